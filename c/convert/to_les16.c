@@ -6,6 +6,7 @@
 // SSE2 version.
 #if !HAVE_FUNC && USE_SSE2
 #define HAVE_FUNC 1
+#include <stdint.h>
 #include <string.h>
 #include <xmmintrin.h>
 void ufxr_to_les16(int n, void *restrict out, const float *restrict xs) {
@@ -0,0 +1,115 @@
+"""Accuracy of the operators, measured from "oprun dump" output.
+
+The error metrics are the ones in op_test.c, computed in double precision over
+the same range of inputs.
+"""
+import dataclasses
+import numpy
+import pathlib
+import subprocess
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Default number of inputs, which matches op_test.c.
+DEFAULT_COUNT = 1 << 20
+
+# Range of inputs, which matches op_test.c.
+INPUT_RANGE = -5.0, 5.0
+
+class AccuracyError(Exception):
+    pass
+
+def exp2_error(xs: numpy.ndarray, ys: numpy.ndarray) -> float:
+    """Maximum error of an exponential function, in cents."""
+    return (1200 * numpy.max(numpy.abs(numpy.log2(ys) - xs))).item()
+
+def reference_tri(xs: numpy.ndarray) -> numpy.ndarray:
+    """Reference triangle function, like the one in op_test.c."""
+    x = 4 * numpy.fmod(xs, 1.0)
+    x = numpy.where(x < 0, x + 4, x)
+    return numpy.where(x < 1, x, numpy.where(x < 3, 2 - x, x - 4))
+
+def tri_error(xs: numpy.ndarray, ys: numpy.ndarray) -> float:
+    """Maximum difference from the reference triangle function."""
+    return numpy.max(numpy.abs(ys - reference_tri(xs))).item()
+
+def sin1_error(xs: numpy.ndarray, ys: numpy.ndarray) -> float:
+    """Ratio of harmonics to fundamental of a sine function."""
+    s = numpy.sin(2 * numpy.pi * xs)
+    # Cosine of angle between sin function and test function.
+    c = numpy.dot(ys, s) / numpy.sqrt(numpy.dot(s, s) * numpy.dot(ys, ys))
+    return (numpy.sqrt(max(0.0, 1 - c)) / c).item()
+
+@dataclasses.dataclass(frozen=True)
+class Metric:
+    name: str
+    unit: str
+    error: Callable[[numpy.ndarray, numpy.ndarray], float]
+
+# Error metric for each family of functions, by name prefix.
+METRICS = {
+    'exp2_': Metric('exp2', 'cents', exp2_error),
+    'sin1_': Metric('sin1', 'harmonics', sin1_error),
+    'tri': Metric('tri', 'max diff', tri_error),
+}
+
+def metric(name: str) -> Optional[Metric]:
+    """Return the error metric for a function, or None if it has none."""
+    for prefix, m in METRICS.items():
+        if name.startswith(prefix):
+            return m
+    return None
+
+def dump(exe: pathlib.Path, name: str, *,
+         count: int = DEFAULT_COUNT) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Evaluate a function with "oprun dump". Returns the inputs and outputs,
+    in double precision.
+    """
+    x0, x1 = INPUT_RANGE
+    proc = subprocess.run(
+        [exe, 'dump', '-count={}'.format(count), '--', name, str(x0),
+         str(x1)],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if proc.returncode:
+        raise AccuracyError('oprun dump {} failed:\n{}'.format(
+            name, proc.stderr.decode('UTF-8', 'replace')))
+    lines = proc.stdout.split(b'\n', 1)
+    if len(lines) != 2 or lines[0] != b'X,Y':
+        raise AccuracyError('unexpected oprun dump output for {}'
+                            .format(name))
+    try:
+        values = numpy.array(lines[1].replace(b'\n', b',').split(b',')[:-1],
+                             numpy.float64)
+    except ValueError:
+        raise AccuracyError('invalid oprun dump output for {}'.format(name))
+    if len(values) != 2 * count:
+        raise AccuracyError('oprun dump {} returned {} values, expected {}'
+                            .format(name, len(values) // 2, count))
+    return values[0::2], values[1::2]
+
+def errors(exe: pathlib.Path, names: List[str], *,
+           count: int = DEFAULT_COUNT) -> Dict[str, float]:
+    """Measure the error of each function which has an error metric."""
+    result = {}
+    for name in names:
+        m = metric(name)
+        if m is not None:
+            result[name] = m.error(*dump(exe, name, count=count))
+    return result
+
+def pareto(points: Dict[str, Tuple[float, float]]) -> List[str]:
+    """Return the Pareto frontier of (time, error) points, fastest first.
+
+    A point is on the frontier if every faster point has a larger error.
+    """
+    frontier = []
+    best = None
+    for name, (time, error) in sorted(points.items(),
+                                      key=lambda item: item[1]):
+        if best is None or error < best:
+            frontier.append(name)
+            best = error
+    return frontier
@@ -0,0 +1,108 @@
+"""Search space for tuning compiler flags.
+
+Each candidate is a compiler and a set of flags, chosen at random from
+independent choices, so candidates can be reproduced from the random seed.
+"""
+import platform
+import random
+import shutil
+import subprocess
+
+from typing import Dict, List, Optional, Tuple
+
+# Compilers to search, if installed.
+COMPILERS = ['gcc', 'clang']
+
+# Target architecture levels. Levels which the host does not support produce
+# programs which crash, and are discarded after building.
+X86_ARCH = ['', '-march=x86-64-v2', '-march=x86-64-v3', '-march=x86-64-v4',
+            '-march=native']
+OTHER_ARCH = ['', '-mcpu=native']
+
+# The pieces of -ffast-math, each chosen independently. Reassociation also
+# needs -fno-signed-zeros and -fno-trapping-math.
+FAST_MATH = [
+    '-fno-math-errno',
+    '-ffinite-math-only',
+    '-fno-signed-zeros',
+    '-fno-trapping-math',
+    '-fassociative-math',
+    '-freciprocal-math',
+]
+
+UNROLL = ['', '-funroll-loops']
+
+# Vectorizer cost models. Clang has no cost model option, but the SLP
+# vectorizer can be turned off.
+VECTORIZER = {
+    'gcc': ['', '-fvect-cost-model=very-cheap', '-fvect-cost-model=cheap',
+            '-fvect-cost-model=dynamic', '-fvect-cost-model=unlimited'],
+    'clang': ['', '-fno-slp-vectorize'],
+}
+
+def compilers() -> List[str]:
+    """Return the compilers in the search space which are installed."""
+    return [cc for cc in COMPILERS if shutil.which(cc) is not None]
+
+def compiler_version(cc: str) -> Optional[str]:
+    """Return the first line of the compiler's version, if it runs."""
+    try:
+        proc = subprocess.run(
+            [cc, '--version'],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+    except FileNotFoundError:
+        return None
+    if proc.returncode:
+        return None
+    lines = proc.stdout.decode('UTF-8', 'replace').splitlines()
+    return lines[0] if lines else None
+
+def arch_levels() -> List[str]:
+    if platform.machine().lower() in ('x86_64', 'amd64'):
+        return X86_ARCH
+    return OTHER_ARCH
+
+def sample(rng: random.Random, ccs: List[str]) -> Tuple[str, List[str]]:
+    """Choose a random compiler and flags."""
+    cc = rng.choice(ccs)
+    flags = [rng.choice(arch_levels())]
+    flags.extend(flag for flag in FAST_MATH if rng.random() < 0.5)
+    flags.append(rng.choice(UNROLL))
+    flags.append(rng.choice(VECTORIZER.get(cc, [''])))
+    return cc, [flag for flag in flags if flag]
+
+def candidates(seed: int, count: int,
+               ccs: List[str]) -> List[Tuple[str, List[str]]]:
+    """Return distinct random candidates.
+
+    There may be fewer than count candidates if the space is small.
+    """
+    rng = random.Random(seed)
+    seen = set()
+    result = []
+    # Give up after many duplicates, rather than loop forever.
+    for _ in range(count * 20):
+        if len(result) >= count:
+            break
+        cc, flags = sample(rng, ccs)
+        key = cc, tuple(flags)
+        if key not in seen:
+            seen.add(key)
+            result.append((cc, flags))
+    return result
+
+def halve(medians: Dict[int, Dict[str, float]], keep: int) -> List[int]:
+    """Return the candidates which are among the fastest keep candidates for
+    any operator, by their median times.
+
+    The medians map candidate indexes to operators to median times.
+    """
+    survivors = set()
+    operators = next(iter(medians.values())).keys()
+    for op in operators:
+        ranked = sorted(medians, key=lambda n: medians[n][op])
+        survivors.update(ranked[:keep])
+    return sorted(survivors)
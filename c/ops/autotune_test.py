@@ -0,0 +1,47 @@
+"""Tests for autotune.py."""
+import random
+import unittest
+import unittest.mock
+
+import autotune
+
+class HalveTest(unittest.TestCase):
+    def test_keeps_fastest_for_any_operator(self):
+        medians = {
+            0: {'tri': 1.0, 'osc': 9.0},
+            1: {'tri': 2.0, 'osc': 8.0},
+            2: {'tri': 3.0, 'osc': 1.0},
+            3: {'tri': 4.0, 'osc': 2.0},
+        }
+        self.assertEqual(autotune.halve(medians, 1), [0, 2])
+        self.assertEqual(autotune.halve(medians, 2), [0, 1, 2, 3])
+
+    def test_single_operator(self):
+        medians = {n: {'tri': float(5 - n)} for n in range(5)}
+        self.assertEqual(autotune.halve(medians, 2), [3, 4])
+
+class CandidatesTest(unittest.TestCase):
+    def test_reproducible(self):
+        self.assertEqual(autotune.candidates(7, 10, ['gcc', 'clang']),
+                         autotune.candidates(7, 10, ['gcc', 'clang']))
+
+    def test_distinct(self):
+        result = autotune.candidates(1, 50, ['gcc', 'clang'])
+        self.assertEqual(len(result), 50)
+        self.assertEqual(len({(cc, tuple(flags)) for cc, flags in result}),
+                         50)
+
+    def test_small_space(self):
+        # With one arch level, the space for clang has 2^6 * 2 * 2 points.
+        with unittest.mock.patch.object(autotune, 'arch_levels',
+                                        lambda: ['']):
+            result = autotune.candidates(1, 1000, ['clang'])
+        self.assertLessEqual(len(result), 256)
+
+    def test_sample_flags(self):
+        cc, flags = autotune.sample(random.Random(3), ['gcc'])
+        self.assertEqual(cc, 'gcc')
+        self.assertNotIn('', flags)
+
+if __name__ == '__main__':
+    unittest.main()
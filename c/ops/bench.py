@@ -1,65 +1,1942 @@
 """"Benchmark driver."""
+import accuracy
 import argparse
+import autotune
+import bisection
+import cachegrind
+import concurrent.futures
 import csv
+import ctypes
 import dataclasses
+import hashlib
+import history
+import itertools
+import json
+import math
 import numpy
+import os
 import pathlib
+import platform
+import random
+import re
+import sfx
+import shutil
+import statistics
 import subprocess
 import sys
+import tempfile
+import time
+import traceback
 
-from typing import Optional
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+# Defaults, which match the defaults in oprun.c.
+DEFAULT_SIZE = 1 << 15
+DEFAULT_ITER = 1 << 15
+DEFAULT_RUNS = 1
+
+# Default number of runs for each configuration with --matrix.
+DEFAULT_MATRIX_RUNS = 5
+
+# Defaults for --autotune: the number of runs in the first round of successive
+# halving, which doubles each round, and the time for each run in ms.
+DEFAULT_AUTOTUNE_RUNS = 3
+DEFAULT_AUTOTUNE_TIME = 10.0
+
+# Input distributions, see "oprun benchmark -input". The default depends on
+# the function.
+INPUTS = ['default', 'linspace', 'uniform', 'normal', 'audio-freq',
+          'denormal', 'huge']
+DEFAULT_INPUTS = {
+    'exp2': 'normal',
+    'osc': 'audio-freq',
+    'sin1': 'uniform',
+    'tri': 'uniform',
+    'to_': 'uniform',
+}
+DEFAULT_INPUT_SEED = 1
+
+# Ratio to the fastest input distribution above which an operator is marked
+# as slow for that distribution.
+INPUT_SLOWDOWN = 2.0
+
+# Ratio to the fastest buffer variant above which an operator is marked as
+# slow for that variant.
+VARIANT_SLOWDOWN = 1.1
+
+# Default smallest block size and number of runs for each block size with
+# --chain.
+DEFAULT_CHAIN_MIN_BLOCK = 16
+DEFAULT_CHAIN_RUNS = 5
+
+# Sample formats for --wave, default format, and default number of runs for
+# each case.
+WAVE_FORMATS = ['u8', 's16', 's24', 'f32']
+# Conversion used to write each format.
+WAVE_CONVERSIONS = {
+    'u8': 'to_u8',
+    's16': 'to_les16',
+    's24': 'to_les24',
+    'f32': 'to_lef32',
+}
+DEFAULT_WAVE_FORMAT = 's16'
+WAVE_RATE = 48000
+DEFAULT_WAVE_RUNS = 5
+
+# Default sample rates, buffer sizes, and number of runs for --sfx.
+DEFAULT_SFX_RATES = [22050, 48000, 96000]
+DEFAULT_SFX_BUFFERS = [64, 256, 1024, 4096]
+DEFAULT_SFX_RUNS = 5
+# Sample rate and buffer size limits, from cmd_sfx.rs.
+SFX_RATE_RANGE = 8000, 192000
+SFX_BUFFER_RANGE = 32, 8192
+
+# Default number of runs for each thread count with --scaling.
+DEFAULT_SCALING_RUNS = 3
+
+# Parallel efficiency below which an operator is reported as not scaling,
+# usually because it is limited by memory bandwidth.
+SCALING_EFFICIENCY = 0.8
+
+# Calibration loop for detecting CPU speed drift. Each repetition takes a few
+# ms. The fastest repetition is used.
+SPIN_ITER = 100000
+SPIN_REPEAT = 5
+
+# Number of times to repeat a measurement with --discard-drifted, before giving
+# up.
+MAX_DRIFT_RETRIES = 3
+
+# Largest seed for --shuffle. Successive measurements use successive seeds, so
+# this leaves room below the maximum for oprun's -seed flag.
+MAX_SEED = 1 << 30
+
+# Default number of iterations when counting instructions. Counts are exact, so
+# few iterations are needed, and Cachegrind is slow.
+DEFAULT_INSTRUCTION_ITER = 16
+
+# Name of the baseline used by --save and --compare without a name, which is
+# stored in bench_ref.csv. Named baselines are stored in BASELINE_DIR.
+DEFAULT_BASELINE = 'ref'
+BASELINE_DIR = 'bench_baselines'
+
+# History database, and the default number of commits to show from it.
+HISTORY_DB = 'bench_history.db'
+DEFAULT_HISTORY_COMMITS = 20
+
+# Exit status for --fail-on-regression when an operator is slower.
+REGRESSION_EXIT_STATUS = 3
+
+# Defaults for bisect: the slowdown to look for in percent, the number of
+# paired runs for each commit, and the number of runs before giving up on a
+# commit whose result is inconclusive.
+DEFAULT_BISECT_THRESHOLD = 5.0
+DEFAULT_BISECT_RUNS = 10
+DEFAULT_BISECT_MAX_RUNS = 40
+
+# Default array size for latency benchmarks, a typical audio callback size.
+DEFAULT_LATENCY_SIZE = 256
+
+# Defaults for sweeping array sizes. The maximum is a 32 MiB working set.
+DEFAULT_SWEEP_MIN = 64
+DEFAULT_SWEEP_MAX = 1 << 22
+DEFAULT_SWEEP_STEPS = 2
+DEFAULT_SWEEP_TIME = 10.0
+
+# A function is considered memory-bound at an array size if the time per sample
+# is this much larger than the best time per sample.
+MEMORY_BOUND_RATIO = 1.25
+
+# Default confidence level for statistics.
+DEFAULT_CONFIDENCE = 0.95
+
+# When measuring to a requested precision, the default number of runs in each
+# batch, and the default maximum number of runs.
+DEFAULT_BATCH_RUNS = 5
+DEFAULT_MAX_RUNS = 100
+
+# When calibrating, initial runs must take at least this fraction of the target
+# time before the iteration count is extrapolated. Matches oprun.c.
+CALIBRATE_DIVISOR = 16
+
+# Array size quantum and buffer alignment, from ops.h.
+UFXR_QUANTUM = 4
+UFXR_ALIGN = 16
+
+# Benchmarked functions, in the same order as kFuncs in oprun.c. All of these
+# except memcpy are exported from the ops or convert library with a "ufxr_"
+# prefix.
+FUNCTIONS = [
+    'exp2_2',
+    'exp2_3',
+    'exp2_4',
+    'exp2_5',
+    'exp2_6',
+    'osc',
+    'sin1_2',
+    'sin1_3',
+    'sin1_4',
+    'sin1_5',
+    'sin1_6',
+    'tri',
+    'memcpy',
+    'to_u8',
+    'to_les16',
+    'to_les24',
+    'to_lef32',
+]
+
+# Sample format conversions, and the size of each output sample in bytes. Their
+# throughput is also reported in MB/s of output. They have no in-place version.
+CONVERSIONS = {
+    'to_u8': 1,
+    'to_les16': 2,
+    'to_les24': 3,
+    'to_lef32': 4,
+}
+
+# Functions with no in-place version. An in-place memcpy does nothing.
+NOT_INPLACE = {'memcpy', *CONVERSIONS}
+
+CLOCKS = {
+    'thread': time.thread_time_ns,
+    'wall': time.perf_counter_ns,
+}
 
 def die(*msg):
     print('Error:', *msg, file=sys.stderr)
     raise SystemExit(1)
 
-def read_csv(path):
+def read_columns(path, columns: List[str],
+                 key: str = "Operator") -> Dict[str, numpy.ndarray]:
+    """Read a CSV file with an operator column followed by numeric columns.
+
+    Returns a 2D array for each operator, with one row for each run.
+    Trailing Seed and Drifted columns are permitted and ignored, see
+    read_seed() and write_csv(). The first column is named by key.
+    """
     ops = {}
     with path.open() as fp:
         r = csv.reader(fp)
         row = next(r)
         if row is None:
             die('File {!r} empty'.format(str(path)))
-        expect = ["Operator", "TimeNS"]
-        if row != expect:
+        expect = [key, *columns]
+        if row[:len(expect)] != expect or row[len(expect):] not in (
+                [], ["Seed"], ["Drifted"], ["Seed", "Drifted"]):
             die('File {!r} has columns {!r}, expected {!r}'
                 .format(str(path), row, expect))
+        ncolumns = len(row)
         for lineno, row in enumerate(r, 2):
             try:
-                opname, timens = row
-                timens = float(timens)
+                if len(row) != ncolumns:
+                    raise ValueError('wrong number of columns')
+                opname = row[0]
+                values = [float(x) for x in row[1:len(expect)]]
             except ValueError:
                 die('File {!r}: could not parse data on line {}'
                     .format(str(path), lineno))
-            optimes = ops.get(opname)
-            if optimes is None:
-                ops[opname] = [timens]
+            opvalues = ops.get(opname)
+            if opvalues is None:
+                ops[opname] = [values]
             else:
-                optimes.append(timens)
-    for opname, optimes in ops.items():
-        ops[opname] = numpy.array(optimes, numpy.float64)
+                opvalues.append(values)
+    for opname, opvalues in ops.items():
+        ops[opname] = numpy.array(opvalues, numpy.float64)
     return ops
 
+def read_seed(path) -> Optional[int]:
+    """Return the seed used to shuffle the order of functions, if any."""
+    with path.open() as fp:
+        r = csv.reader(fp)
+        header = next(r, None)
+        row = next(r, None)
+    if not header or "Seed" not in header or row is None:
+        return None
+    try:
+        return int(row[header.index("Seed")])
+    except ValueError:
+        die('File {!r}: invalid seed'.format(str(path)))
+
+def read_csv(path):
+    return {opname: values[:, 0]
+            for opname, values in read_columns(path, ["TimeNS"]).items()}
+
+# Latency percentiles reported by "oprun benchmark -latency".
+LATENCY_COLUMNS = ["P50NS", "P99NS", "P999NS", "MaxNS"]
+LATENCY_NAMES = ["p50", "p99", "p99.9", "max"]
+
+# Cachegrind metrics, per sample, and the CSV columns they are stored in.
+INSTRUCTION_METRICS = list(cachegrind.METRICS)
+INSTRUCTION_COLUMNS = ["Instructions", "L1Misses", "LLMisses", "BranchMisses"]
+
+# Operators whose Cachegrind metrics are approximate. Cachegrind only counts
+# each function's own instructions, and memcpy's are in the C library, where
+# they are mixed with every other call to memcpy or memmove in oprun.
+APPROXIMATE_INSTRUCTIONS = {'memcpy'}
+
+def instructions_heading(opname: str) -> str:
+    if opname in APPROXIMATE_INSTRUCTIONS:
+        return 'Operator {} (approximate)'.format(opname)
+    return 'Operator {}'.format(opname)
+
+def read_instructions_csv(path) -> Dict[str, Dict[str, float]]:
+    """Read Cachegrind results. Returns counts by operator and metric."""
+    return {
+        opname: dict(zip(INSTRUCTION_METRICS, values[-1]))
+        for opname, values in read_columns(path, INSTRUCTION_COLUMNS).items()
+    }
+
+def write_instructions_csv(path, data: Dict[str, Dict[str, float]]):
+    with path.open('w') as fp:
+        w = csv.writer(fp)
+        w.writerow(["Operator", *INSTRUCTION_COLUMNS])
+        for opname, counts in data.items():
+            w.writerow([opname, *('{:.9g}'.format(counts[metric])
+                                  for metric in INSTRUCTION_METRICS)])
+
+# Hardware performance counters reported by "oprun benchmark -counters", per
+# sample, and the names they are recorded under.
+COUNTER_COLUMNS = ["Cycles", "Instructions", "CacheMisses", "BranchMisses",
+                   "Raw"]
+COUNTER_METRICS = ['cycles', 'instructions', 'cache_misses', 'branch_misses',
+                   'raw_event']
+
+def read_counters_csv(path) -> Tuple[Dict[str, numpy.ndarray],
+                                     Dict[str, Dict[str, numpy.ndarray]]]:
+    """Read results with performance counters.
+
+    Returns times by operator, and counter values by operator and metric.
+    Counters which were not available are NaN.
+    """
+    data = read_columns(path, ["TimeNS", *COUNTER_COLUMNS])
+    times = {opname: values[:, 0] for opname, values in data.items()}
+    counters = {opname: dict(zip(COUNTER_METRICS, values[:, 1:].T))
+                for opname, values in data.items()}
+    return times, counters
+
+def read_latency_csv(path) -> Dict[str, Dict[str, numpy.ndarray]]:
+    """Read latency results. Returns times in ns by operator and percentile."""
+    return {
+        opname: dict(zip(LATENCY_NAMES, values.T))
+        for opname, values in read_columns(path, LATENCY_COLUMNS).items()
+    }
+
+def write_csv(path, data, seed: Optional[int] = None,
+              drifted: Optional[Set[str]] = None):
+    """Write times by operator. If drifted is given, a Drifted column is 1 for
+    operators whose measurements drifted, see check_drift().
+    """
+    with path.open('w') as fp:
+        w = csv.writer(fp)
+        header = ["Operator", "TimeNS"]
+        if seed is not None:
+            header.append("Seed")
+        if drifted is not None:
+            header.append("Drifted")
+        w.writerow(header)
+        for opname, times in data.items():
+            extra = []
+            if seed is not None:
+                extra.append(seed)
+            if drifted is not None:
+                extra.append(int(opname in drifted))
+            for timens in times:
+                w.writerow([opname, '{:.3f}'.format(timens), *extra])
+
+def select_functions(patterns: List[str]) -> List[str]:
+    """Return the functions matching the patterns, like oprun does.
+
+    A pattern is either a function name or a prefix followed by '*'.
+    """
+    if not patterns:
+        return list(FUNCTIONS)
+    selected = set()
+    for pat in patterns:
+        if pat.endswith('*'):
+            prefix = pat[:-1]
+            if '*' in prefix:
+                die("invalid pattern {!r}, '*' must be at end".format(pat))
+            matches = [name for name in FUNCTIONS if name.startswith(prefix)]
+            if not matches:
+                die('no function matches pattern {!r}'.format(pat))
+            selected.update(matches)
+        else:
+            if pat not in FUNCTIONS:
+                die('unknown function {!r}'.format(pat))
+            selected.add(pat)
+    return [name for name in FUNCTIONS if name in selected]
+
+def aligned_empty(size: int, align: int = UFXR_ALIGN) -> numpy.ndarray:
+    """Allocate an uninitialized float32 array with the given alignment."""
+    itemsize = numpy.dtype(numpy.float32).itemsize
+    buf = numpy.empty(size + align // itemsize, numpy.float32)
+    offset = (-buf.ctypes.data % align) // itemsize
+    arr = buf[offset:offset + size]
+    assert arr.ctypes.data % align == 0
+    return arr
+
+OpFunc = Callable[[int, int, int], None]
+
+# Benchmark the named functions for a number of runs, with a given array size.
+Measure = Callable[[List[str], int, int], Dict[str, numpy.ndarray]]
+
+def load_library(bindir: pathlib.Path) -> Dict[str, OpFunc]:
+    """Load the ops and convert shared libraries from the bazel-bin directory
+    and return their benchmarked functions.
+
+    Functions take (n, outs, xs), where outs and xs are buffer addresses.
+    """
+    libs = {}
+    for name in ['ops', 'convert']:
+        path = bindir / 'c' / name / 'lib{}.so'.format(name)
+        try:
+            libs[name] = ctypes.CDLL(str(path))
+        except OSError as ex:
+            die('Could not load {!r}: {}'.format(str(path), ex))
+    funcs = {}
+    for name in FUNCTIONS:
+        if name == 'memcpy':
+            continue
+        lib = libs['convert' if name in CONVERSIONS else 'ops']
+        func = getattr(lib, 'ufxr_' + name)
+        func.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p]
+        func.restype = None
+        funcs[name] = func
+    def memcpy(n, outs, xs):
+        ctypes.memmove(outs, xs, n * 4)
+    funcs['memcpy'] = memcpy
+    return funcs
+
+def time_calls(func: OpFunc, n: int, outs: int, xs: int, iterations: int,
+               clock: Callable[[], int]) -> int:
+    """Call a function repeatedly and return the elapsed time in ns."""
+    t0 = clock()
+    for _ in range(iterations):
+        func(n, outs, xs)
+    return clock() - t0
+
+def calibrate(func: OpFunc, n: int, outs: int, xs: int, target_ns: float,
+              clock: Callable[[], int]) -> int:
+    """Find the number of iterations for a run to take about target_ns."""
+    iterations = 1
+    while True:
+        t = time_calls(func, n, outs, xs, iterations, clock)
+        if t * CALIBRATE_DIVISOR >= target_ns:
+            return max(1, round(iterations * target_ns / max(t, 1)))
+        iterations *= 2
+
+def default_input(name: str) -> str:
+    """Return the default input distribution for a function, like oprun."""
+    for prefix, dist in DEFAULT_INPUTS.items():
+        if name.startswith(prefix):
+            return dist
+    return 'linspace'
+
+def input_values(dist: str, size: int, seed: int) -> numpy.ndarray:
+    """Return input from a distribution, see "oprun benchmark -input".
+
+    The values have the same distribution as oprun's, but are not the same
+    values.
+    """
+    rng = numpy.random.default_rng(seed)
+    if dist == 'linspace':
+        return numpy.linspace(-5.0, 5.0, size)
+    if dist == 'uniform':
+        return rng.uniform(-0.5, 0.5, size)
+    if dist == 'normal':
+        return rng.standard_normal(size)
+    if dist == 'audio-freq':
+        return 20.0 * 1000.0 ** rng.uniform(0.0, 1.0, size) / 48000.0
+    if dist == 'denormal':
+        bits = rng.integers(0, 1 << 32, size, numpy.uint32)
+        return ((bits & 0x807fffff) | 1).view(numpy.float32)
+    if dist == 'huge':
+        return (rng.choice([-1.0, 1.0], size)
+                * numpy.ldexp(rng.uniform(1.0, 2.0, size),
+                              rng.integers(20, 101, size)))
+    raise ValueError('unknown input distribution: {!r}'.format(dist))
+
+def run_library(funcs: Dict[str, OpFunc], names: List[str], *, size: int,
+                iterations: int, runs: int, clock: Callable[[], int],
+                time_ms: Optional[float] = None,
+                seed: Optional[int] = None, input: str = 'default',
+                input_seed: int = DEFAULT_INPUT_SEED,
+                ) -> Dict[str, numpy.ndarray]:
+    """Benchmark library functions in-process.
+
+    This works like "oprun benchmark", but the cost of calling through ctypes
+    is measured by calling each function with an empty array, and subtracted
+    from the result. If a seed is given, the order of functions is shuffled
+    each run.
+    """
+    inputs = {}
+    xps = {}
+    for name in names:
+        dist = default_input(name) if input == 'default' else input
+        xs = inputs.get(dist)
+        if xs is None:
+            xs = inputs[dist] = aligned_empty(size)
+            xs[:] = input_values(dist, size, input_seed)
+        xps[name] = xs.ctypes.data
+    ys = aligned_empty(size)
+    yp = ys.ctypes.data
+    iters = {}
+    for name in names:
+        iters[name] = iterations
+        if time_ms is not None:
+            iters[name] = calibrate(funcs[name], size, yp, xps[name],
+                                    time_ms * 1e6, clock)
+    data = {name: [] for name in names}
+    rng = None if seed is None else numpy.random.default_rng(seed)
+    for run in range(runs):
+        order = names
+        if rng is not None:
+            order = [names[i] for i in rng.permutation(len(names))]
+        for name in order:
+            func = funcs[name]
+            xp = xps[name]
+            func(size, yp, xp)  # Warm cache.
+            overhead = time_calls(func, 0, yp, xp, iters[name], clock)
+            t = time_calls(func, size, yp, xp, iters[name], clock)
+            data[name].append(max(t - overhead, 0) / (iters[name] * size))
+    return {name: numpy.array(times, numpy.float64)
+            for name, times in data.items()}
+
+@dataclasses.dataclass
+class BuildConfig:
+    impl: str = 'vector'
+    copts: List[str] = dataclasses.field(default_factory=list)
+    # Bazel compilation mode.
+    mode: str = 'opt'
+    # C compiler, or empty for Bazel's default.
+    cc: str = ''
+
+    @property
+    def name(self) -> str:
+        parts = [self.impl]
+        if self.cc:
+            parts.insert(0, 'CC=' + self.cc)
+        if self.mode != 'opt':
+            parts.append('-c ' + self.mode)
+        parts.extend(self.copts)
+        return ' '.join(parts)
+
+    def bazel_args(self) -> List[str]:
+        args = ['-c', self.mode]
+        if self.impl != 'vector':
+            args.append('--define=ops=' + self.impl)
+        for copt in self.copts:
+            args.append('--copt=' + copt)
+        if self.cc:
+            args.append('--repo_env=CC=' + self.cc)
+        return args
+
+def build(here: pathlib.Path, target: str, config: BuildConfig):
+    proc = subprocess.run(
+        ['bazel', 'build', *config.bazel_args(), target],
+        cwd=here,
+        stdin=subprocess.DEVNULL,
+    )
+    if proc.returncode:
+        die('Build failed')
+    print(file=sys.stderr)
+
+def cache_dir() -> pathlib.Path:
+    base = os.environ.get('XDG_CACHE_HOME')
+    if base:
+        return pathlib.Path(base) / 'ultrafxr-bench'
+    return pathlib.Path.home() / '.cache' / 'ultrafxr-bench'
+
+def build_isolated(here: pathlib.Path, target: str, config: BuildConfig,
+                   log_path: pathlib.Path,
+                   output_base: Optional[pathlib.Path] = None
+                   ) -> Optional[pathlib.Path]:
+    """Build a target with its own Bazel output base.
+
+    Builds with different output bases can run concurrently. Output is written
+    to the log. The output base defaults to one in the cache directory for the
+    configuration. The Bazel server is shut down afterwards, so it does not
+    use CPU and memory while benchmarks run. Returns the bazel-bin directory,
+    or None if the build failed.
+    """
+    if output_base is None:
+        key = hashlib.sha256(config.name.encode('UTF-8')).hexdigest()[:16]
+        output_base = cache_dir() / key
+    startup = ['bazel', '--output_base=' + str(output_base)]
+    with log_path.open('w') as log:
+        try:
+            proc = subprocess.run(
+                [*startup, 'build', '--symlink_prefix=/',
+                 *config.bazel_args(), target],
+                cwd=here,
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+            if proc.returncode:
+                return None
+            proc = subprocess.run(
+                [*startup, 'info', *config.bazel_args(), 'bazel-bin'],
+                cwd=here,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=log,
+            )
+            if proc.returncode:
+                return None
+        finally:
+            subprocess.run(
+                [*startup, 'shutdown'],
+                cwd=here,
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+    return pathlib.Path(proc.stdout.decode('UTF-8').strip())
+
+def remove_output_base(here: pathlib.Path, output_base: pathlib.Path):
+    """Delete a Bazel output base, and stop its server."""
+    subprocess.run(
+        ['bazel', '--output_base=' + str(output_base), 'clean', '--expunge'],
+        cwd=here,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    # Bazel makes some files read-only.
+    for path in [output_base, *output_base.rglob('*')]:
+        if path.is_dir() and not path.is_symlink():
+            path.chmod(0o755)
+    shutil.rmtree(output_base, ignore_errors=True)
+
+def matrix_configs(impls: List[str], copt_sets: List[List[str]],
+                   modes: List[str]) -> List[BuildConfig]:
+    """Return the cross product of build options. The first is the baseline."""
+    return [BuildConfig(impl, copts, mode)
+            for impl, copts, mode in itertools.product(impls, copt_sets, modes)]
+
+def build_configs(here: pathlib.Path, configs: List[BuildConfig], jobs: int,
+                  logdir: pathlib.Path,
+                  output_root: Optional[pathlib.Path] = None
+                  ) -> List[Optional[pathlib.Path]]:
+    """Build oprun for each configuration concurrently, at most jobs at a
+    time.
+
+    If an output root is given, each configuration's output base is a
+    numbered directory in it, otherwise they are in the cache directory.
+    Returns the path to oprun for each configuration, or None for
+    configurations which failed to build, which are reported on stderr.
+    """
+    logdir.mkdir(exist_ok=True)
+    logs = [logdir / '{}.log'.format(n) for n in range(len(configs))]
+    bases = [None if output_root is None else output_root / str(n)
+             for n in range(len(configs))]
+    print('Building {} configurations'.format(len(configs)), file=sys.stderr)
+    with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+        bindirs = list(pool.map(
+            lambda config, log, base: build_isolated(
+                here, ':oprun', config, log, base),
+            configs, logs, bases))
+    for config, log, bindir in zip(configs, logs, bindirs):
+        if bindir is None:
+            print('Build failed: {}, see {}'.format(config.name, log),
+                  file=sys.stderr)
+    return [None if bindir is None else bindir / 'c/ops/oprun'
+            for bindir in bindirs]
+
+def build_matrix(here: pathlib.Path, configs: List[BuildConfig],
+                 jobs: int) -> List[pathlib.Path]:
+    """Build oprun for each configuration concurrently.
+
+    Returns the path to oprun for each configuration.
+    """
+    exes = build_configs(here, configs, jobs, here / 'bench_matrix_logs')
+    if None in exes:
+        die('Build failed')
+    return exes
+
+def run_matrix(here: pathlib.Path, exes: List[pathlib.Path],
+               bench_args: List[str], names: List[str], runs: int,
+               size: int,
+               seed: Optional[int] = None) -> List[Dict[str, numpy.ndarray]]:
+    """Benchmark each configuration, interleaving runs.
+
+    Each round runs every configuration once, one at a time, so slow drift
+    affects every configuration equally and configurations do not compete for
+    cores or memory bandwidth. The order rotates each round. If a seed is
+    given, the order of functions is shuffled each round, the same way for
+    every configuration.
+    """
+    out = here / 'bench_matrix_out.csv'
+    data = [{name: [] for name in names} for _ in exes]
+    for run in range(runs):
+        for i in range(len(exes)):
+            n = (run + i) % len(exes)
+            print('\r\x1b[KRun {}/{}, configuration {}/{}'.format(
+                run + 1, runs, i + 1, len(exes)), end='', file=sys.stderr)
+            run_args = bench_args
+            if seed is not None:
+                run_args = [*bench_args, '-seed={}'.format(seed + run)]
+            result = read_csv(
+                run_oprun(here, exes[n], run_args, names, 1, size, out))
+            for name, times in result.items():
+                data[n][name].extend(times)
+    print('\r\x1b[K', end='', file=sys.stderr)
+    out.unlink()
+    return [{name: numpy.array(times, numpy.float64)
+             for name, times in cdata.items()}
+            for cdata in data]
+
+def write_matrix_csv(path, configs: List[BuildConfig],
+                     data: List[Dict[str, numpy.ndarray]]):
+    with path.open('w') as fp:
+        w = csv.writer(fp)
+        w.writerow(["Config", "Operator", "TimeNS"])
+        for config, cdata in zip(configs, data):
+            for opname, times in cdata.items():
+                for timens in times:
+                    w.writerow([config.name, opname, '{:.3f}'.format(timens)])
+
+def show_matrix(configs: List[BuildConfig],
+                data: List[Dict[str, numpy.ndarray]], confidence: float):
+    """Print median ns/sample and speedup relative to the first configuration.
+
+    Speedups which are not statistically significant are marked with '?'.
+    Runs from the same round are compared in pairs.
+    """
+    for n, config in enumerate(configs):
+        print('[{}] {}'.format(n, config.name))
+    print()
+    names = list(data[0])
+    print('{:8}'.format('Operator')
+          + ''.join('{:>17}'.format('[{}]'.format(n))
+                    for n in range(len(configs))))
+    for name in names:
+        base = data[0][name]
+        row = '{:8}'.format(name)
+        for n, cdata in enumerate(data):
+            times = cdata[name]
+            median = numpy.median(times).item()
+            if n == 0:
+                row += '{:>8.3f}         '.format(median)
+                continue
+            cmp = compare_times(base, times, confidence=confidence,
+                                paired=True)
+            mark = '?' if cmp.verdict == 'inconclusive' else ' '
+            row += '{:>8.3f} {:>6.2f}x{}'.format(median, 1 / cmp.ratio, mark)
+        print(row)
+
+def oprun_works(here: pathlib.Path, exe: pathlib.Path) -> bool:
+    """Return true if oprun runs. Builds for instructions the CPU does not
+    have crash.
+    """
+    proc = subprocess.run(
+        [exe, 'benchmark', '-size={}'.format(UFXR_QUANTUM), '-iter=1',
+         '-runs=1'],
+        cwd=here,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return proc.returncode == 0
+
+def run_autotune(here: pathlib.Path, exes: List[pathlib.Path],
+                 bench_args: List[str], names: List[str], runs: int,
+                 size: int) -> List[Dict[str, numpy.ndarray]]:
+    """Find the fastest configuration for each function by successive
+    halving.
+
+    The first configuration is the baseline. Each round benchmarks the
+    remaining configurations with interleaved runs, then keeps the fastest
+    half for each function, and the number of runs doubles. The baseline is
+    always kept, and the last round has the fastest configuration for each
+    function. Returns all results for each configuration; configurations
+    which were dropped have fewer runs.
+    """
+    data = [{name: numpy.zeros(0) for name in names} for _ in exes]
+    alive = list(range(len(exes)))
+    keep = len(exes) - 1
+    rounds = itertools.count(1)
+    while True:
+        print('Round {}: {} configurations, {} runs'.format(
+            next(rounds), len(alive), runs), file=sys.stderr)
+        result = run_matrix(here, [exes[n] for n in alive], bench_args,
+                            names, runs, size)
+        for n, cdata in zip(alive, result):
+            for name, times in cdata.items():
+                data[n][name] = numpy.concatenate([data[n][name], times])
+        if keep <= 1:
+            return data
+        keep = (keep + 1) // 2
+        alive = [0, *autotune.halve(
+            {n: {name: numpy.median(data[n][name]).item() for name in names}
+             for n in alive[1:]}, keep)]
+        runs *= 2
+
+def read_sysfs(path: str) -> Optional[str]:
+    try:
+        with open(path) as fp:
+            return fp.read().strip()
+    except OSError:
+        return None
+
+def cpu_governor(cpu: int) -> Optional[str]:
+    """Return the cpufreq scaling governor for a CPU, if known."""
+    return read_sysfs(
+        '/sys/devices/system/cpu/cpu{}/cpufreq/scaling_governor'.format(cpu))
+
+def turbo_enabled() -> Optional[bool]:
+    """Return whether turbo boost is enabled, if known."""
+    value = read_sysfs('/sys/devices/system/cpu/intel_pstate/no_turbo')
+    if value is not None:
+        return value == '0'
+    value = read_sysfs('/sys/devices/system/cpu/cpufreq/boost')
+    if value is not None:
+        return value == '1'
+    return None
+
+def report_cpu(cpus: List[int]):
+    """Print the frequency scaling configuration, and warn if it is noisy."""
+    turbo = turbo_enabled()
+    print('Turbo: {}'.format(
+        'unknown' if turbo is None else 'enabled' if turbo else 'disabled'),
+        file=sys.stderr)
+    if turbo:
+        print('Warning: turbo is enabled, results may vary with temperature',
+              file=sys.stderr)
+    for cpu in cpus:
+        governor = cpu_governor(cpu)
+        print('CPU {}: governor {}'.format(cpu, governor or 'unknown'),
+              file=sys.stderr)
+        if governor is not None and governor != 'performance':
+            print('Warning: CPU {} governor is not "performance"'.format(cpu),
+                  file=sys.stderr)
+
+def spin() -> int:
+    """Time a fixed amount of work, in ns. Used to detect CPU speed drift."""
+    best = None
+    for _ in range(SPIN_REPEAT):
+        t0 = time.perf_counter_ns()
+        x = 0
+        for i in range(SPIN_ITER):
+            x += i
+        t = time.perf_counter_ns() - t0
+        if best is None or t < best:
+            best = t
+    return best
+
+def check_drift(measure: Measure, max_drift: float, discard: bool,
+                drifted: Set[str]) -> Measure:
+    """Wrap a measurement with a calibration loop before and after.
+
+    If the calibration time changes by more than max_drift, the CPU speed
+    changed during the measurement, and the operators measured are added to
+    drifted. If discard is true, the measurement is repeated instead, and the
+    benchmark fails if it drifts every time.
+    """
+    def wrapped(names, runs, size):
+        for attempt in range(1 + (MAX_DRIFT_RETRIES if discard else 0)):
+            before = spin()
+            data = measure(names, runs, size)
+            after = spin()
+            drift = after / before - 1
+            if abs(drift) <= max_drift:
+                return data
+            print('Warning: calibration drifted by {:+.1f}% during '
+                  'measurement'.format(100 * drift), file=sys.stderr)
+        if discard:
+            die('calibration drifted after {} retries, discarding the results'
+                .format(MAX_DRIFT_RETRIES))
+        drifted.update(data)
+        return data
+    return wrapped
+
+def pin_cpu(cpu: Optional[int]):
+    """Pin this process and its children to a CPU, and report its settings.
+
+    This should be done after building, so the build is not restricted.
+    """
+    if cpu is not None:
+        if not hasattr(os, 'sched_setaffinity'):
+            die('--cpu is not supported on this platform')
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except OSError as ex:
+            die('Could not set CPU affinity: {}'.format(ex))
+    if hasattr(os, 'sched_getaffinity'):
+        report_cpu(sorted(os.sched_getaffinity(0)))
+    else:
+        report_cpu([0])
+
+def run_oprun(here: pathlib.Path, exe: pathlib.Path, bench_args: List[str],
+              names: List[str], runs: int, size: int, out: pathlib.Path):
+    """Run "oprun benchmark" and return the output file."""
+    proc = subprocess.run(
+        [exe, 'benchmark', *bench_args, '-size={}'.format(size),
+         '-runs={}'.format(runs), '-out=' + out.name,
+         '--', *names],
+        cwd=here,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+    )
+    if proc.returncode:
+        die('Benchmark failed')
+    return out
+
+def stream_oprun(here: pathlib.Path, exe: pathlib.Path,
+                 bench_args: List[str], names: List[str], runs: int,
+                 size: int) -> Iterator[Tuple[str, float]]:
+    """Run "oprun benchmark", and yield the function name and time in ns per
+    sample for each measurement as it finishes.
+
+    The benchmark is stopped if the generator is closed before it finishes.
+    """
+    proc = subprocess.Popen(
+        [exe, 'benchmark', *bench_args, '-size={}'.format(size),
+         '-runs={}'.format(runs), '--', *names],
+        cwd=here,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    stopped = True
+    try:
+        header = proc.stdout.readline().rstrip('\n').split(',')
+        if header[:2] != ['Operator', 'TimeNS']:
+            die('Unexpected oprun output: {!r}'.format(','.join(header)))
+        for line in proc.stdout:
+            fields = line.rstrip('\n').split(',')
+            yield fields[0], float(fields[1])
+        stopped = False
+    finally:
+        if stopped:
+            proc.terminate()
+        proc.stdout.close()
+        proc.wait()
+    if proc.returncode:
+        die('Benchmark failed')
+
+def file_hash(path: pathlib.Path) -> str:
+    h = hashlib.sha256()
+    with path.open('rb') as fp:
+        for chunk in iter(lambda: fp.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def host_fingerprint() -> Dict[str, object]:
+    """Return a description of the host, for the result cache.
+
+    This includes the settings which affect timing, so results are not reused
+    after the governor or turbo state changes.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = [0]
+    return {
+        'node': platform.node(),
+        'kernel': platform.release(),
+        'cpu_model': history.cpu_model(),
+        'cpus': cpus,
+        'governors': [cpu_governor(cpu) for cpu in cpus],
+        'turbo': turbo_enabled(),
+    }
+
+class OprunServer:
+    """Client for "oprun serve", which runs benchmarks in one process.
+
+    The process keeps its buffers and input data between measurements, so
+    there is no process startup or page fault overhead for each measurement.
+    Iteration counts for a target run time are calibrated once for each
+    function, size, and input, and reused.
+    """
+
+    def __init__(self, exe: pathlib.Path, cwd: pathlib.Path):
+        self.proc = subprocess.Popen(
+            [exe, 'serve'],
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        self.iters = {}
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.stdin.write('quit\n')
+            self.proc.stdin.close()
+            self.proc.wait()
+
+    def command(self, *fields):
+        self.proc.stdin.write(' '.join(map(str, fields)) + '\n')
+        self.proc.stdin.flush()
+
+    def result(self) -> Dict[str, object]:
+        line = self.proc.stdout.readline()
+        if not line:
+            die('oprun serve exited unexpectedly')
+        obj = json.loads(line)
+        if 'error' in obj:
+            die('oprun serve: {}'.format(obj['error']))
+        return obj
+
+    def iterations(self, name: str, size: int, time_ms: float,
+                   input_keys: List[str]) -> int:
+        key = name, size, *input_keys
+        iters = self.iters.get(key)
+        if iters is None:
+            self.command('calibrate', name, 'size={}'.format(size),
+                         'time={}'.format(time_ms), *input_keys)
+            iters = self.iters[key] = self.result()['iter']
+        return iters
+
+    def run(self, name: str, *, size: int, iterations: Optional[int],
+            runs: int, time_ms: Optional[float] = None,
+            input: str = 'default', input_seed: int = DEFAULT_INPUT_SEED):
+        """Benchmark a function, and yield the time for each run in ns per
+        sample as it finishes.
+        """
+        input_keys = ['input-seed={}'.format(input_seed)]
+        if input != 'default':
+            input_keys.append('input=' + input)
+        if time_ms is not None:
+            iterations = self.iterations(name, size, time_ms, input_keys)
+        elif iterations is None:
+            iterations = DEFAULT_ITER
+        self.command('run', name, 'size={}'.format(size),
+                     'iter={}'.format(iterations), 'runs={}'.format(runs),
+                     *input_keys)
+        for _ in range(runs):
+            yield self.result()['time_ns']
+
+    def stream(self, names: List[str], runs: int, size: int, *,
+               iterations: Optional[int], time_ms: Optional[float],
+               input: str, input_seed: int,
+               seed: Optional[int] = None) -> Iterator[Tuple[str, float]]:
+        """Benchmark functions like "oprun benchmark". Each run measures every
+        function once, in a shuffled order if a seed is given. Yields the
+        function name and time for each measurement.
+        """
+        rng = None if seed is None else numpy.random.default_rng(seed)
+        for run in range(runs):
+            order = names
+            if rng is not None:
+                order = [names[i] for i in rng.permutation(len(names))]
+            for name in order:
+                for t in self.run(name, size=size, iterations=iterations,
+                                  runs=1, time_ms=time_ms, input=input,
+                                  input_seed=input_seed):
+                    yield name, t
+
+    def measure(self, names: List[str], runs: int, size: int,
+                **kw) -> Dict[str, numpy.ndarray]:
+        """Benchmark functions, like stream(). Returns the times by name."""
+        data = {name: [] for name in names}
+        for name, t in self.stream(names, runs, size, **kw):
+            data[name].append(t)
+        return {name: numpy.array(times, numpy.float64)
+                for name, times in data.items()}
+
+def run_oprun_cached(here: pathlib.Path, exe: pathlib.Path,
+                     bench_args: List[str], names: List[str], runs: int,
+                     size: int, out: pathlib.Path, *,
+                     force: bool = False) -> Tuple[pathlib.Path, bool]:
+    """Run "oprun benchmark", or reuse the results of an identical run.
+
+    Results are cached by the hash of the oprun binary, the benchmark
+    arguments, and the host. Returns the output file, and whether it came from
+    the cache. If force is true, the benchmark is always run.
+    """
+    key = hashlib.sha256(json.dumps({
+        'oprun': file_hash(exe),
+        'args': [*bench_args, '-size={}'.format(size),
+                 '-runs={}'.format(runs), *names],
+        'host': host_fingerprint(),
+    }, sort_keys=True).encode('UTF-8')).hexdigest()
+    path = cache_dir() / 'results' / (key + '.csv')
+    if not force and path.exists():
+        print('Using cached results {}'.format(key[:12]), file=sys.stderr)
+        shutil.copyfile(path, out)
+        return out, True
+    run_oprun(here, exe, bench_args, names, runs, size, out)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_suffix('.tmp')
+    shutil.copyfile(out, temp)
+    temp.replace(path)
+    return out, False
+
 @dataclasses.dataclass
 class Stats:
     median: float
     variation: Optional[float]
+    # Confidence interval for the median, if there are enough samples.
+    median_low: Optional[float] = None
+    median_high: Optional[float] = None
+
+def median_ci(times, confidence: float) -> Optional[Tuple[float, float]]:
+    """Distribution-free confidence interval for the median.
 
-def stats(times):
+    The interval is bounded by order statistics chosen with the normal
+    approximation to the binomial distribution. Returns None if there are too
+    few samples for the requested confidence.
+    """
+    n = len(times)
+    z = statistics.NormalDist().inv_cdf(0.5 + 0.5 * confidence)
+    half = 0.5 * z * math.sqrt(n)
+    lo = math.floor(0.5 * n - half)
+    hi = math.ceil(0.5 * n + half)
+    if lo < 0 or hi >= n:
+        return None
+    times = numpy.sort(times)
+    return times[lo].item(), times[hi].item()
+
+def stats(times, confidence: float = DEFAULT_CONFIDENCE):
     median = numpy.median(times).item()
     variation = None
     if len(times) > 1:
         variation = numpy.mean(numpy.abs(times - median)).item()
-    return Stats(median, variation)
+    st = Stats(median, variation)
+    ci = median_ci(times, confidence)
+    if ci is not None:
+        st.median_low, st.median_high = ci
+    return st
+
+def relative_ci(times, confidence: float) -> Optional[float]:
+    """Return the half-width of the median's CI, relative to the median."""
+    st = stats(times, confidence)
+    if st.median_low is None or st.median <= 0:
+        return None
+    return 0.5 * (st.median_high - st.median_low) / st.median
+
+def run_to_precision(measure: Measure, names: List[str], *, size: int,
+                     precision: float, confidence: float, batch_runs: int,
+                     max_runs: int) -> Dict[str, numpy.ndarray]:
+    """Add runs in batches until each median is known to the given precision.
+
+    Precision is the relative half-width of the median's confidence interval.
+    Functions which have converged are not run again. Functions which have not
+    converged after max_runs are reported on stderr.
+    """
+    data = {name: numpy.zeros(0, numpy.float64) for name in names}
+    pending = list(names)
+    while pending:
+        batch = measure(pending, batch_runs, size)
+        for name in pending:
+            data[name] = numpy.concatenate([data[name], batch[name]])
+        remaining = []
+        for name in pending:
+            rel = relative_ci(data[name], confidence)
+            if rel is not None and rel <= precision:
+                continue
+            if len(data[name]) >= max_runs:
+                print('Warning: {} did not converge after {} runs ({})'
+                      .format(name, len(data[name]),
+                              'CI unknown' if rel is None
+                              else '±{:.2f}%'.format(100 * rel)),
+                      file=sys.stderr)
+                continue
+            remaining.append(name)
+        pending = remaining
+        if pending:
+            print('Not converged: {}'.format(' '.join(pending)),
+                  file=sys.stderr)
+    return data
+
+# Minimum time between updates of the live display, in seconds.
+LIVE_INTERVAL = 0.1
+
+class LiveDisplay:
+    """Table on a terminal, which is redrawn in place."""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.lines = 0
+        self.last = None
+
+    def update(self, lines: List[str], force: bool = False):
+        now = time.monotonic()
+        if (not force and self.last is not None
+                and now - self.last < LIVE_INTERVAL):
+            return
+        self.last = now
+        if self.lines:
+            # Move to the start of the first line of the previous table.
+            self.fp.write('\x1b[{}F'.format(self.lines))
+        for line in lines:
+            self.fp.write(line + '\x1b[K\n')
+        self.fp.flush()
+        self.lines = len(lines)
+
+def run_streaming(results: Iterator[Tuple[str, float]], names: List[str], *,
+                  confidence: float,
+                  precision: Optional[float]) -> Dict[str, numpy.ndarray]:
+    """Collect measurements as they finish.
+
+    If stderr is a terminal, the running median and its confidence interval
+    are shown for each function. If a precision is given, the benchmark is
+    stopped as soon as every median is known to that precision, like
+    run_to_precision. Functions which have not converged by the end are
+    reported on stderr.
+    """
+    data = {name: [] for name in names}
+    rel = {name: None for name in names}
+    live = LiveDisplay(sys.stderr) if sys.stderr.isatty() else None
+
+    def converged(name):
+        return (precision is not None and rel[name] is not None
+                and rel[name] <= precision)
+
+    def table():
+        lines = []
+        for name in names:
+            times = data[name]
+            if not times:
+                lines.append('{:8} {:5}'.format(name, 0))
+                continue
+            lines.append('{:8} {:5} {:8.3f} {:>9}{}'.format(
+                name, len(times), numpy.median(times),
+                '' if rel[name] is None
+                else '±{:.2f}%'.format(100 * rel[name]),
+                '  done' if converged(name) else ''))
+        return lines
+
+    try:
+        for name, t in results:
+            data[name].append(t)
+            rel[name] = relative_ci(numpy.array(data[name]), confidence)
+            if precision is not None and all(map(converged, names)):
+                break
+            if live is not None:
+                live.update(table())
+    finally:
+        results.close()
+    if live is not None:
+        live.update(table(), force=True)
+    if precision is not None:
+        for name in names:
+            if not converged(name):
+                print('Warning: {} did not converge after {} runs ({})'
+                      .format(name, len(data[name]),
+                              'CI unknown' if rel[name] is None
+                              else '±{:.2f}%'.format(100 * rel[name])),
+                      file=sys.stderr)
+    return {name: numpy.array(times, numpy.float64)
+            for name, times in data.items()}
+
+def sweep_sizes(min_size: int, max_size: int, steps: int) -> List[int]:
+    """Geometric range of array sizes, rounded to the array quantum.
+
+    There are the given number of steps per octave.
+    """
+    sizes = []
+    count = round(steps * math.log2(max_size / min_size)) + 1
+    for x in numpy.geomspace(min_size, max_size, count):
+        size = max(UFXR_QUANTUM, round(x / UFXR_QUANTUM) * UFXR_QUANTUM)
+        if not sizes or size > sizes[-1]:
+            sizes.append(size)
+    return sizes
+
+def memory_bound_size(sizes: List[int], medians: List[float],
+                      threshold: float) -> Optional[int]:
+    """Find the size where a function becomes memory-bound.
+
+    This is the first size, larger than the fastest size, where the time per
+    sample exceeds the fastest time by the given ratio. Returns None if there
+    is no such size.
+    """
+    best = int(numpy.argmin(medians))
+    for size, median in zip(sizes[best:], medians[best:]):
+        if median > medians[best] * threshold:
+            return size
+    return None
+
+def format_bytes(n: int) -> str:
+    for unit in ['B', 'KiB', 'MiB']:
+        if n < 1024 or unit == 'MiB':
+            break
+        n /= 1024
+    return '{:.4g} {}'.format(n, unit)
+
+def write_sweep_csv(path, data: Dict[int, Dict[str, numpy.ndarray]]):
+    with path.open('w') as fp:
+        w = csv.writer(fp)
+        w.writerow(["Operator", "Size", "TimeNS"])
+        for size, sizedata in data.items():
+            for opname, times in sizedata.items():
+                for timens in times:
+                    w.writerow([opname, size, '{:.3f}'.format(timens)])
+
+def show_sweep(names: List[str], data: Dict[int, Dict[str, numpy.ndarray]],
+               threshold: float):
+    """Print a table of median ns/sample by array size.
+
+    The working set is the size of the input and output arrays together.
+    Entries where a function is memory-bound are marked with '*'.
+    """
+    sizes = list(data)
+    bound = {}
+    for name in names:
+        medians = [numpy.median(data[size][name]).item() for size in sizes]
+        bound[name] = memory_bound_size(sizes, medians, threshold)
+    print('{:>9} {:>11}'.format('Size', 'Working set')
+          + ''.join(' {:>8}'.format(name) for name in names))
+    for size in sizes:
+        row = '{:>9} {:>11}'.format(size, format_bytes(2 * 4 * size))
+        for name in names:
+            mark = ' '
+            if bound[name] is not None and size >= bound[name]:
+                mark = '*'
+            row += ' {:>7.3f}{}'.format(
+                numpy.median(data[size][name]).item(), mark)
+        print(row)
+    print()
+    for name in names:
+        if bound[name] is None:
+            print('{}: not memory-bound'.format(name))
+        else:
+            print('{}: memory-bound from {} samples ({} working set)'
+                  .format(name, bound[name], format_bytes(8 * bound[name])))
+
+def run_scaling(here: pathlib.Path, exe: pathlib.Path, bench_args: List[str],
+                names: List[str], runs: int, size: int,
+                max_threads: int) -> Dict[int, Dict[str, numpy.ndarray]]:
+    """Benchmark with 1 to max_threads threads running at once.
+
+    Returns wall clock times in ns per sample per thread, by thread count.
+    """
+    out = here / 'bench_scaling_out.csv'
+    data = {}
+    for nthreads in range(1, max_threads + 1):
+        print('Threads {}'.format(nthreads), file=sys.stderr)
+        data[nthreads] = read_csv(run_oprun(
+            here, exe, [*bench_args, '-threads={}'.format(nthreads)], names,
+            runs, size, out))
+    return data
+
+def write_scaling_csv(path, data: Dict[int, Dict[str, numpy.ndarray]]):
+    with path.open('w') as fp:
+        w = csv.writer(fp)
+        w.writerow(["Operator", "Threads", "TimeNS"])
+        for nthreads, tdata in data.items():
+            for opname, times in tdata.items():
+                for timens in times:
+                    w.writerow([opname, nthreads, '{:.3f}'.format(timens)])
+
+def show_scaling(names: List[str], data: Dict[int, Dict[str, numpy.ndarray]],
+                 threshold: float):
+    """Print aggregate throughput and parallel efficiency by thread count.
+
+    Throughput is in millions of samples per second, over all threads.
+    Efficiency is throughput relative to the single-threaded throughput times
+    the number of threads. Entries below the threshold are marked with '*'.
+    """
+    counts = list(data)
+    throughput = {
+        name: [nthreads * 1e3 / numpy.median(data[nthreads][name]).item()
+               for nthreads in counts]
+        for name in names
+    }
+    print('{:>7}'.format('Threads')
+          + ''.join(' {:>14} '.format(name) for name in names))
+    for i, nthreads in enumerate(counts):
+        row = '{:>7}'.format(nthreads)
+        for name in names:
+            tput = throughput[name][i]
+            eff = tput / (nthreads * throughput[name][0])
+            row += ' {:>8.0f} {:>4.0f}%{}'.format(
+                tput, 100 * eff, '*' if eff < threshold else ' ')
+        print(row)
+    print()
+    for name in names:
+        best = max(range(len(counts)), key=lambda i: throughput[name][i])
+        print('{}: peak {:.0f} Msamples/s at {} threads'.format(
+            name, throughput[name][best], counts[best]))
+
+def filesystem_type(path: pathlib.Path) -> str:
+    """Return the type of the filesystem containing a path, like "ext4" or
+    "tmpfs", or "unknown".
+    """
+    path = path.resolve()
+    best, fstype = None, 'unknown'
+    try:
+        with open('/proc/self/mounts') as fp:
+            for line in fp:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # Spaces and other characters in mount points are escaped
+                # with octal.
+                mount = pathlib.Path(re.sub(
+                    r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)),
+                    fields[1]))
+                if mount != path and mount not in path.parents:
+                    continue
+                if best is None or len(mount.parts) >= len(best.parts):
+                    best, fstype = mount, fields[2]
+    except OSError:
+        pass
+    return fstype
+
+def wave_dirs(here: pathlib.Path,
+              dirs: Optional[List[str]]) -> List[pathlib.Path]:
+    """Return the directories to write files to for --wave.
+
+    The default is this directory, and /dev/shm if it exists, which is
+    normally tmpfs.
+    """
+    if dirs:
+        return [pathlib.Path(d) for d in dirs]
+    result = [here]
+    shm = pathlib.Path('/dev/shm')
+    if shm.is_dir() and os.access(str(shm), os.W_OK):
+        result.append(shm)
+    return result
+
+def run_wave(here: pathlib.Path, exe: pathlib.Path, seconds: float,
+             formats: List[str], dirs: List[pathlib.Path],
+             runs: int) -> Dict[Tuple[pathlib.Path, str, bool], numpy.ndarray]:
+    """Render audio to a WAVE file in each directory, with each format, with
+    and without fsync.
+
+    Returns the render, write, and sync times in ns for each run, by
+    directory, format, and whether the file was synced.
+    """
+    out = here / 'bench_wave_out.csv'
+    data = {}
+    for d in dirs:
+        with tempfile.TemporaryDirectory(prefix='bench_wave_', dir=d) as tmp:
+            path = pathlib.Path(tmp) / 'out.wav'
+            for fmt in formats:
+                for sync in [False, True]:
+                    print('Wave {} {}{}'.format(
+                        d, fmt, ' fsync' if sync else ''), file=sys.stderr)
+                    proc = subprocess.run(
+                        [exe, 'wave', '-seconds={}'.format(seconds),
+                         '-rate={}'.format(WAVE_RATE),
+                         '-format=' + fmt, '-runs={}'.format(runs),
+                         *(['-fsync'] if sync else []),
+                         '-out=' + out.name, str(path)],
+                        cwd=here,
+                        stdin=subprocess.DEVNULL,
+                        stdout=subprocess.DEVNULL,
+                    )
+                    if proc.returncode:
+                        die('Benchmark failed')
+                    data[d, fmt, sync] = read_columns(
+                        out, ["RenderNS", "WriteNS", "SyncNS"],
+                        "Format")[fmt]
+    return data
+
+def write_wave_csv(path, data: Dict[Tuple[pathlib.Path, str, bool],
+                                    numpy.ndarray]):
+    with path.open('w') as fp:
+        w = csv.writer(fp)
+        w.writerow(["Directory", "Filesystem", "Format", "Sync", "RenderNS",
+                    "WriteNS", "SyncNS"])
+        for (d, fmt, sync), times in data.items():
+            fstype = filesystem_type(d)
+            for render, write, synctime in times:
+                w.writerow([d, fstype, fmt, int(sync), '{:.0f}'.format(render),
+                            '{:.0f}'.format(write),
+                            '{:.0f}'.format(synctime)])
+
+def show_wave(seconds: float, data: Dict[Tuple[pathlib.Path, str, bool],
+                                        numpy.ndarray]):
+    """Print median times in ms for --wave, the throughput of the file data
+    in MB/s, and the speed relative to realtime.
+    """
+    last = None
+    for (d, fmt, sync), times in data.items():
+        if d != last:
+            if last is not None:
+                print()
+            print('{} ({})'.format(d, filesystem_type(d)))
+            print('  {:6} {:4} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(
+                'Format', 'Sync', 'Render', 'Write', 'Sync', 'MB/s',
+                'Realtime'))
+            last = d
+        render, write, synctime = numpy.median(times, axis=0).tolist()
+        total = render + write + synctime
+        size = round(seconds * WAVE_RATE) * CONVERSIONS[WAVE_CONVERSIONS[fmt]]
+        print('  {:6} {:4} {:>7.2f}ms {:>7.2f}ms {:>7.2f}ms {:>9.1f} {:>8.0f}x'
+              .format(fmt, 'yes' if sync else 'no', render / 1e6, write / 1e6,
+                      synctime / 1e6, 1e3 * size / total,
+                      1e9 * seconds / total))
+
+# Results for --sfx, by sample rate and buffer size, then by program, with
+# one result for each run.
+SfxData = Dict[Tuple[int, int], Dict[str, List[sfx.Timing]]]
+
+def run_sfx(exe: pathlib.Path, paths: Dict[str, pathlib.Path],
+            rates: List[int], buffers: List[int], runs: int) -> SfxData:
+    """Render each program with each sample rate and buffer size.
+
+    Each run renders every configuration once, so slow drift affects all
+    configurations equally.
+    """
+    data = {(rate, buffer): {name: [] for name in paths}
+            for rate in rates for buffer in buffers}
+    for run in range(runs):
+        print('Run {}/{}'.format(run + 1, runs), file=sys.stderr)
+        for (rate, buffer), cdata in data.items():
+            try:
+                result = sfx.run(exe, paths, sample_rate=rate,
+                                 buffer_size=buffer)
+            except sfx.SfxError as ex:
+                die(ex)
+            for name, timing in result.items():
+                cdata[name].append(timing)
+    return data
+
+def write_sfx_csv(path, data: SfxData):
+    with path.open('w') as fp:
+        w = csv.writer(fp)
+        w.writerow(["Program", "SampleRate", "BufferSize", "ParseNS",
+                    "GraphNS", "RenderNS", "Samples"])
+        for (rate, buffer), cdata in data.items():
+            for name, timings in cdata.items():
+                for t in timings:
+                    w.writerow([name, rate, buffer, '{:.0f}'.format(t.parse),
+                                '{:.0f}'.format(t.graph),
+                                '{:.0f}'.format(t.render), t.samples])
+
+def format_ns(timens: float) -> str:
+    """Format a time in ns with a suitable unit."""
+    for unit, scale in [('s', 1e9), ('ms', 1e6), ('us', 1e3)]:
+        if timens >= scale:
+            return '{:.2f}{}'.format(timens / scale, unit)
+    return '{:.0f}ns'.format(timens)
 
-def compare(refdata, newdata):
+def show_sfx(data: SfxData):
+    """Print the median time to parse, build the graph, and render each
+    program, and the median realtime factor, for each configuration.
+    """
+    width = max(len('Program'), *(len(name) for cdata in data.values()
+                                  for name in cdata))
+    for n, ((rate, buffer), cdata) in enumerate(data.items()):
+        if n:
+            print()
+        print('Sample rate {}, buffer size {}'.format(rate, buffer))
+        print('{:{}} {:>9} {:>9} {:>9} {:>9}'.format(
+            'Program', width, 'Parse', 'Graph', 'Render', 'Realtime'))
+        for name, timings in cdata.items():
+            parse = statistics.median(t.parse for t in timings)
+            graph = statistics.median(t.graph for t in timings)
+            render = statistics.median(t.render for t in timings)
+            realtime = statistics.median(t.realtime for t in timings)
+            print('{:{}} {:>9} {:>9} {:>9} {:>8.0f}x'.format(
+                name, width, format_ns(parse), format_ns(graph),
+                format_ns(render), realtime))
+
+def sfx_history_config() -> history.Config:
+    """Return the history configuration for --sfx results. These do not depend
+    on the C build configuration.
+    """
+    return history.Config(backend='sfx', impl='rust', copts=[],
+                          mode='release', cpu=history.cpu_model())
+
+def record_sfx(db, here: pathlib.Path, data: SfxData):
+    """Record --sfx results in the history database.
+
+    The operator is the program name and the sample rate, like
+    "intern-apocalypse/bass@48000", and the size is the buffer size.
+    """
+    for (rate, buffer), cdata in data.items():
+        history.record(db, here, sfx_history_config(), buffer, {
+            '{}@{}'.format(name, rate): {
+                'sfx_parse': [t.parse for t in timings],
+                'sfx_graph': [t.graph for t in timings],
+                'sfx_render': [t.render for t in timings],
+                'sfx_realtime': [t.realtime for t in timings],
+            }
+            for name, timings in cdata.items()
+        })
+
+def run_chain(here: pathlib.Path, exe: pathlib.Path, bench_args: List[str],
+              chain: List[str], runs: int, size: int,
+              blocks: List[int]) -> Dict[int, numpy.ndarray]:
+    """Benchmark a chain of functions with each block size.
+
+    Returns times in ns per sample for the whole chain, by block size.
+    """
+    out = here / 'bench_chain_out.csv'
+    data = {}
+    for block in blocks:
+        print('Block {}'.format(block), file=sys.stderr)
+        proc = subprocess.run(
+            [exe, 'chain', *bench_args, '-size={}'.format(size),
+             '-block={}'.format(block), '-runs={}'.format(runs),
+             '-out=' + out.name, '--', *chain],
+            cwd=here,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+        )
+        if proc.returncode:
+            die('Benchmark failed')
+        data[block] = read_columns(out, ["TimeNS"], "Block")[str(block)][:, 0]
+    out.unlink()
+    return data
+
+def write_chain_csv(path, data: Dict[int, numpy.ndarray]):
+    with path.open('w') as fp:
+        w = csv.writer(fp)
+        w.writerow(["Block", "TimeNS"])
+        for block, times in data.items():
+            for timens in times:
+                w.writerow([block, '{:.3f}'.format(timens)])
+
+def show_chain(chain: List[str], data: Dict[int, numpy.ndarray],
+               isolated: Dict[str, numpy.ndarray]):
+    """Print median ns/sample for the chain by block size, and the change
+    from the sum of the functions' isolated times.
+    """
+    medians = {name: numpy.median(times).item()
+               for name, times in isolated.items()}
+    total = sum(medians[name] for name in chain)
+    print('Chain: {}'.format(' -> '.join(chain)))
+    print('Isolated: {:.3f}ns/sample ({})'.format(
+        total, ' + '.join('{} {:.3f}'.format(name, medians[name])
+                          for name in chain)))
+    print()
+    print('{:>9} {:>9} {:>9}'.format('Block', 'ns/sample', 'Change'))
+    for block, times in data.items():
+        median = numpy.median(times).item()
+        print('{:>9} {:>9.3f} {:>+8.2f}%'.format(
+            block, median, 100 * (median / total - 1)))
+    print()
+    best = min(data, key=lambda block: numpy.median(data[block]).item())
+    print('Fastest block size: {}'.format(best))
+
+def input_args(dist: str, seed: int) -> List[str]:
+    """Return the oprun arguments for an input distribution."""
+    args = []
+    if dist != 'default':
+        args.append('-input=' + dist)
+    if seed != DEFAULT_INPUT_SEED:
+        args.append('-input-seed={}'.format(seed))
+    return args
+
+def buffer_variants() -> Dict[str, List[str]]:
+    """Return the buffer variants for --variants, and their oprun arguments.
+
+    Each alignment variant is aligned to exactly that many bytes. The in-place
+    variant uses the same buffer for input and output.
+    """
+    page = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+    return {
+        'malloc': [],
+        'align16': ['-align=16'],
+        'align32': ['-align=32'],
+        'align64': ['-align=64'],
+        'page': ['-align={}'.format(page)],
+        'inplace': ['-inplace'],
+    }
+
+def write_columns_csv(path, column: str,
+                      data: Dict[str, Dict[str, numpy.ndarray]]):
+    """Write results for each value of a benchmark option, like the input
+    distribution, with the option in the given column.
+    """
+    with path.open('w') as fp:
+        w = csv.writer(fp)
+        w.writerow(["Operator", column, "TimeNS"])
+        for value, vdata in data.items():
+            for opname, times in vdata.items():
+                for timens in times:
+                    w.writerow([opname, value, '{:.3f}'.format(timens)])
+
+def show_columns(names: List[str], data: Dict[str, Dict[str, numpy.ndarray]],
+                 threshold: float):
+    """Print a table of median ns/sample, with a column for each value of a
+    benchmark option, like the input distribution.
+
+    Entries which are slower than the fastest column for that operator by more
+    than the threshold ratio are marked with '*'.
+    """
+    columns = list(data)
+    width = max(8, *(len(column) for column in columns))
+    print('{:8}'.format('Operator')
+          + ''.join(' {:>{}} '.format(column, width) for column in columns))
+    for name in names:
+        # Operators missing from a column, like memcpy and the conversions,
+        # which have no in-place version, are shown as '-'.
+        medians = [numpy.median(data[column][name]).item()
+                   if name in data[column] else None
+                   for column in columns]
+        fastest = min([median for median in medians if median is not None],
+                      default=0.0)
+        row = '{:8}'.format(name)
+        for median in medians:
+            if median is None:
+                row += ' {:>{}} '.format('-', width)
+                continue
+            mark = '*' if median > threshold * fastest else ' '
+            row += ' {:>{}.3f}{}'.format(median, width, mark)
+        print(row)
+
+def rank(values) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Rank values starting at 1, averaging the ranks of tied values.
+
+    Returns the ranks and the size of each group of tied values.
+    """
+    n = len(values)
+    order = numpy.argsort(values, kind='mergesort')
+    ranks = numpy.empty(n, numpy.float64)
+    ranks[order] = numpy.arange(1, n + 1)
+    _, inverse, counts = numpy.unique(
+        values, return_inverse=True, return_counts=True)
+    rank_sums = numpy.zeros(len(counts))
+    numpy.add.at(rank_sums, inverse, ranks)
+    return (rank_sums / counts)[inverse], counts
+
+def two_sided_p(z: float) -> float:
+    return min(1.0, 2 * (1 - statistics.NormalDist().cdf(max(z, 0.0))))
+
+def mann_whitney(xs, ys) -> float:
+    """Two-sided Mann-Whitney U test. Returns the p-value.
+
+    Uses the normal approximation with a correction for ties, which is
+    adequate for the sample counts we use.
+    """
+    nx = len(xs)
+    ny = len(ys)
+    n = nx + ny
+    ranks, counts = rank(numpy.concatenate([xs, ys]))
+    u = numpy.sum(ranks[:nx]) - nx * (nx + 1) / 2
+    mean = nx * ny / 2
+    tie_term = numpy.sum(counts ** 3 - counts) / (n * (n - 1))
+    var = nx * ny / 12 * ((n + 1) - tie_term)
+    if var <= 0:
+        return 1.0
+    # Continuity correction.
+    z = (abs(u - mean) - 0.5) / math.sqrt(var)
+    return two_sided_p(z)
+
+def wilcoxon(diffs) -> float:
+    """Two-sided Wilcoxon signed-rank test. Returns the p-value.
+
+    Tests whether paired differences are centered on zero. Zero differences
+    are dropped. Uses the normal approximation with a correction for ties.
+    """
+    diffs = diffs[diffs != 0]
+    n = len(diffs)
+    if n == 0:
+        return 1.0
+    ranks, counts = rank(numpy.abs(diffs))
+    w = numpy.sum(ranks[diffs > 0])
+    mean = n * (n + 1) / 4
+    var = (n * (n + 1) * (2 * n + 1) / 24
+           - numpy.sum(counts ** 3 - counts) / 48)
+    if var <= 0:
+        return 1.0
+    z = (abs(w - mean) - 0.5) / math.sqrt(var)
+    return two_sided_p(z)
+
+def bootstrap_ratio(reftimes, newtimes, *, confidence: float,
+                    resamples: int = 10000,
+                    seed: int = 0) -> Tuple[float, float]:
+    """Bootstrap confidence interval for the ratio of medians, new / ref."""
+    rng = numpy.random.default_rng(seed)
+    refmeds = numpy.median(
+        reftimes[rng.integers(0, len(reftimes), (resamples, len(reftimes)))],
+        axis=1)
+    newmeds = numpy.median(
+        newtimes[rng.integers(0, len(newtimes), (resamples, len(newtimes)))],
+        axis=1)
+    ratios = newmeds / refmeds
+    alpha = 1 - confidence
+    lo, hi = numpy.quantile(ratios, [0.5 * alpha, 1 - 0.5 * alpha])
+    return lo.item(), hi.item()
+
+@dataclasses.dataclass
+class Comparison:
+    # Ratio of medians, new / ref.
+    ratio: float
+    ratio_low: float
+    ratio_high: float
+    # Mann-Whitney U test p-value, or None if there are too few samples.
+    pvalue: Optional[float]
+    # One of 'faster', 'slower', 'inconclusive'.
+    verdict: str
+
+def compare_paired(reftimes, newtimes, *, confidence: float,
+                   resamples: int = 10000, seed: int = 0) -> Comparison:
+    """Compare paired benchmark times, where run i of each was run under the
+    same conditions.
+
+    The ratio is the median of the per-run ratios, with a bootstrap confidence
+    interval from resampling pairs, and the p-value is from the Wilcoxon
+    signed-rank test on the log ratios.
+    """
+    logs = numpy.log(newtimes / reftimes)
+    ratio = math.exp(numpy.median(logs).item())
+    rng = numpy.random.default_rng(seed)
+    meds = numpy.median(
+        logs[rng.integers(0, len(logs), (resamples, len(logs)))], axis=1)
+    alpha = 1 - confidence
+    lo, hi = numpy.exp(numpy.quantile(meds, [0.5 * alpha, 1 - 0.5 * alpha]))
+    return Comparison(ratio, lo.item(), hi.item(), wilcoxon(logs), '')
+
+def compare_times(reftimes, newtimes, *,
+                  confidence: float = DEFAULT_CONFIDENCE,
+                  paired: bool = False) -> Comparison:
+    """Compare two sets of benchmark times.
+
+    A change is only reported as faster or slower if both the bootstrap
+    confidence interval for the ratio of medians excludes 1, and the
+    Mann-Whitney U test rejects the hypothesis that the samples come from the
+    same distribution. If paired is true and there are the same number of
+    samples, the samples are compared in pairs instead, see compare_paired().
+    """
+    ratio = numpy.median(newtimes).item() / numpy.median(reftimes).item()
+    if len(reftimes) < 2 or len(newtimes) < 2:
+        return Comparison(ratio, ratio, ratio, None, 'inconclusive')
+    if (paired and len(reftimes) == len(newtimes)
+            and numpy.all(reftimes > 0) and numpy.all(newtimes > 0)):
+        cmp = compare_paired(reftimes, newtimes, confidence=confidence)
+    else:
+        lo, hi = bootstrap_ratio(reftimes, newtimes, confidence=confidence)
+        cmp = Comparison(ratio, lo, hi, mann_whitney(reftimes, newtimes), '')
+    cmp.verdict = 'inconclusive'
+    if cmp.pvalue < 1 - confidence:
+        if cmp.ratio_low > 1:
+            cmp.verdict = 'slower'
+        elif cmp.ratio_high < 1:
+            cmp.verdict = 'faster'
+    return cmp
+
+@dataclasses.dataclass
+class TuneResult:
+    operator: str
+    # Index of the fastest configuration.
+    config: int
+    comparison: Comparison
+
+def autotune_results(data: List[Dict[str, numpy.ndarray]], *,
+                     confidence: float) -> List[TuneResult]:
+    """Choose the fastest configuration for each function, among those in
+    the last round, and compare it to the baseline.
+    """
+    results = []
+    for name, base in data[0].items():
+        final = [n for n, cdata in enumerate(data)
+                 if len(cdata[name]) == len(base)]
+        best = min(final, key=lambda n: numpy.median(data[n][name]).item())
+        # Every configuration in the last round ran in every round, so its
+        # runs pair with the baseline's.
+        results.append(TuneResult(name, best, compare_times(
+            base, data[best][name], confidence=confidence, paired=True)))
+    return results
+
+def show_autotune(configs: List[BuildConfig], results: List[TuneResult]):
+    """Print the fastest configuration for each function, and its speedup
+    relative to the baseline.
+
+    Speedups which are not statistically significant are marked with '?'.
+    """
+    used = sorted({result.config for result in results} | {0})
+    for n in used:
+        print('[{}] {}{}'.format(n, configs[n].name,
+                                 ' (baseline)' if n == 0 else ''))
+    print()
+    print('{:8}  {:>7}  {}'.format('Operator', 'Speedup', 'Config'))
+    for result in results:
+        cmp = result.comparison
+        mark = '?' if cmp.verdict == 'inconclusive' else ' '
+        print('{:8}  {:>6.2f}x{}  [{}]'.format(
+            result.operator, 1 / cmp.ratio, mark, result.config))
+
+def write_autotune_config(path: pathlib.Path, configs: List[BuildConfig],
+                          results: List[TuneResult],
+                          search: Dict[str, object]):
+    """Write the best configuration for each function as JSON, with the
+    search settings, so the search and the builds can be repeated.
+    """
+    operators = {}
+    for result in results:
+        config = configs[result.config]
+        cmp = result.comparison
+        operators[result.operator] = {
+            'config': result.config,
+            **dataclasses.asdict(config),
+            'bazel': ' '.join(['bazel', 'build', *config.bazel_args(),
+                               '//c/ops:oprun']),
+            'speedup': 1 / cmp.ratio,
+            'speedup_low': 1 / cmp.ratio_high,
+            'speedup_high': 1 / cmp.ratio_low,
+            'pvalue': cmp.pvalue,
+            'verdict': cmp.verdict,
+        }
+    with path.open('w') as fp:
+        json.dump({
+            'search': search,
+            'cpu': history.cpu_model(),
+            'compilers': {cc: autotune.compiler_version(cc)
+                          for cc in search['compilers']},
+            'operators': operators,
+        }, fp, indent=2)
+        fp.write('\n')
+
+VERDICT_COLORS = {
+    'slower': '31',
+    'faster': '32',
+}
+
+def colored(text, color):
+    if not color:
+        return text
+    return '\x1b[{}m{}\x1b[0m'.format(color, text)
+
+@dataclasses.dataclass
+class OperatorResult:
+    """Results for one operator, and the comparison with the reference."""
+    operator: str
+    times: numpy.ndarray
+    stats: Stats
+    reftimes: Optional[numpy.ndarray] = None
+    refstats: Optional[Stats] = None
+    comparison: Optional[Comparison] = None
+    # True if the CPU speed drifted while the operator was measured.
+    drifted: bool = False
+
+def summarize(newdata, refdata=None, *,
+              confidence: float = DEFAULT_CONFIDENCE,
+              paired: bool = False,
+              drifted: Set[str] = frozenset()) -> List[OperatorResult]:
+    """Compute statistics for each operator, and compare to the reference if
+    given. Operators missing from the reference are not compared.
+    """
+    results = []
     for opname, times in newdata.items():
-        reftimes = refdata.get(opname)
-        if reftimes is None:
+        result = OperatorResult(opname, times, stats(times, confidence),
+                                drifted=opname in drifted)
+        reftimes = None if refdata is None else refdata.get(opname)
+        if reftimes is not None:
+            result.reftimes = reftimes
+            result.refstats = stats(reftimes, confidence)
+            result.comparison = compare_times(
+                reftimes, times, confidence=confidence, paired=paired)
+        results.append(result)
+    return results
+
+def compare(refdata, newdata, *, confidence: float = DEFAULT_CONFIDENCE,
+            paired: bool = False):
+    """Compare new results to reference results.
+
+    If paired is true, the results were run with the same shuffled order, and
+    run i of each operator is compared with run i of the reference.
+    """
+    if paired:
+        print('Comparing runs in pairs')
+        print()
+    for result in summarize(newdata, refdata, confidence=confidence,
+                            paired=paired):
+        if result.comparison is None:
             continue
-        print('Operator {}'.format(opname))
-        rst = stats(reftimes)
-        nst = stats(times)
+        print('Operator {}'.format(result.operator))
+        rst = result.refstats
+        nst = result.stats
         print('    Median:    {:5.3f} -> {:5.3f} ns/sample'
               .format(rst.median, nst.median))
         if rst.variation is not None or nst.variation is not None:
@@ -67,93 +1944,1626 @@ def compare(refdata, newdata):
             nv = '-----' if nst.variation is None else format(nst.variation, '.3f')
             print('    Variation: {:5} -> {:5} ns/sample'
                   .format(rv, nv))
-        change = 100 * (nst.median - rst.median) / rst.median
-        color = ''
-        if change > 2:
-            color = '31'
-        elif change < -2:
-            color = '32'
-        set_color = ''
-        reset_color = ''
-        if color:
-            set_color = '\x1b[{}m'.format(color)
-            reset_color = '\x1b[0m'
-        print('    Change: {}{:+.2f}%{}'.format(set_color, change, reset_color))
+        cmp = result.comparison
+        change = 100 * (cmp.ratio - 1)
+        if cmp.pvalue is None:
+            print('    Change:    {:+.2f}%'.format(change))
+        else:
+            print('    Change:    {:+.2f}% ({:.0f}% CI {:+.2f}% .. {:+.2f}%)'
+                  .format(change, 100 * confidence,
+                          100 * (cmp.ratio_low - 1),
+                          100 * (cmp.ratio_high - 1)))
+            print('    P-value:   {:.4f}'.format(cmp.pvalue))
+        print('    Verdict:   {}'.format(
+            colored(cmp.verdict, VERDICT_COLORS.get(cmp.verdict))))
 
         print()
 
+def compare_baselines(baselines: Dict[str, Dict[str, numpy.ndarray]],
+                      newdata, *, confidence: float = DEFAULT_CONFIDENCE,
+                      paired: Dict[str, bool]):
+    """Print new results next to several baselines.
+
+    Each baseline column shows its median and the change from it to the new
+    results. Changes which are not statistically significant are marked with
+    '?'. Baselines marked with '*' were compared in pairs.
+    """
+    names = list(baselines)
+    for n, name in enumerate(names):
+        print('[{}] {}{}'.format(n, name, ' *' if paired[name] else ''))
+    print()
+    print('{:8} {:>8}'.format('Operator', 'Current')
+          + ''.join('{:>18}'.format('[{}]'.format(n))
+                    for n in range(len(names))))
+    for opname, times in newdata.items():
+        row = '{:8} {:>8.3f}'.format(opname, numpy.median(times).item())
+        for name in names:
+            reftimes = baselines[name].get(opname)
+            if reftimes is None:
+                row += '{:>18}'.format('-')
+                continue
+            cmp = compare_times(reftimes, times, confidence=confidence,
+                                paired=paired[name])
+            mark = '?' if cmp.verdict == 'inconclusive' else ' '
+            cell = '{:>7.3f} {:+7.2f}%{}'.format(
+                numpy.median(reftimes).item(), 100 * (cmp.ratio - 1), mark)
+            row += ' ' + colored(cell, VERDICT_COLORS.get(cmp.verdict))
+        print(row)
+
+def compare_latency(refdata, newdata, *,
+                    confidence: float = DEFAULT_CONFIDENCE,
+                    paired: bool = False):
+    """Compare latency percentiles, treating each percentile like a median."""
+    for opname, percentiles in newdata.items():
+        refpercentiles = refdata.get(opname)
+        if refpercentiles is None:
+            continue
+        print('Operator {}'.format(opname))
+        for name, times in percentiles.items():
+            reftimes = refpercentiles[name]
+            cmp = compare_times(reftimes, times, confidence=confidence,
+                                paired=paired)
+            print('    {:6} {:8.0f} -> {:8.0f} ns  {:+7.2f}%  {}'.format(
+                name + ':',
+                numpy.median(reftimes).item(),
+                numpy.median(times).item(),
+                100 * (cmp.ratio - 1),
+                colored(cmp.verdict, VERDICT_COLORS.get(cmp.verdict))))
+        print()
+
+def show_latency(data):
+    for opname, percentiles in data.items():
+        print('Operator {}'.format(opname))
+        for name, times in percentiles.items():
+            print('    {:6} {:.0f}ns'.format(
+                name + ':', numpy.median(times).item()))
+
+def instruction_counts(counts: Dict[str, Dict[str, int]], names: List[str],
+                       samples: int) -> Dict[str, Dict[str, float]]:
+    """Get Cachegrind metrics for each operator, per sample.
+
+    Counts are exclusive, so memcpy's counts are in the C library, and are
+    found by name. This includes calls from outside the benchmark, see
+    APPROXIMATE_INSTRUCTIONS.
+    """
+    data = {}
+    for name in names:
+        total = dict.fromkeys(INSTRUCTION_METRICS, 0)
+        for fn, fncounts in counts.items():
+            if (fn == 'ufxr_' + name
+                    or (name == 'memcpy'
+                        and ('memcpy' in fn or 'memmove' in fn))):
+                for metric, value in cachegrind.metrics(fncounts).items():
+                    total[metric] += value
+        data[name] = {metric: value / samples
+                      for metric, value in total.items()}
+    return data
+
+def compare_instructions(refdata, newdata):
+    """Compare Cachegrind metrics. These are exact, so any change is shown."""
+    for opname, counts in newdata.items():
+        refcounts = refdata.get(opname)
+        if refcounts is None:
+            continue
+        print(instructions_heading(opname))
+        for metric in INSTRUCTION_METRICS:
+            ref = refcounts[metric]
+            new = counts[metric]
+            if math.isclose(ref, new, rel_tol=1e-9, abs_tol=1e-12):
+                change = 'unchanged'
+            else:
+                change = '{:+.4f}'.format(new - ref)
+                if ref:
+                    change += ' ({:+.2f}%)'.format(100 * (new / ref - 1))
+                change = colored(change, '31' if new > ref else '32')
+            print('    {:14} {:10.4f} -> {:10.4f}  {}'.format(
+                metric + ':', ref, new, change))
+        print()
+
+def show_instructions(data):
+    for opname, counts in data.items():
+        print(instructions_heading(opname))
+        for metric in INSTRUCTION_METRICS:
+            print('    {:14} {:.4f}/sample'.format(
+                metric + ':', counts[metric]))
+
+def show_counters(data: Dict[str, Dict[str, numpy.ndarray]]):
+    """Print the median of each performance counter, per sample."""
+    for opname, counters in data.items():
+        print('Operator {}'.format(opname))
+        available = False
+        for metric in COUNTER_METRICS:
+            values = counters[metric]
+            if numpy.isnan(values).all():
+                continue
+            available = True
+            print('    {:14} {:.4f}/sample'.format(
+                metric + ':', numpy.nanmedian(values)))
+        ipc = counters['instructions'] / counters['cycles']
+        if not numpy.isnan(ipc).all():
+            print('    {:14} {:.3f}'.format('ipc:', numpy.nanmedian(ipc)))
+        if not available:
+            print('    No counters available')
+
+def megabytes_per_second(opname: str, timens: float) -> Optional[float]:
+    """Return the output throughput of a conversion in MB/s, or None if the
+    operator is not a conversion.
+    """
+    size = CONVERSIONS.get(opname)
+    if size is None or timens <= 0:
+        return None
+    return 1e3 * size / timens
+
 def show(data):
     for opname, times in data.items():
         print('Operator {}'.format(opname))
         st = stats(times)
         print('    Median:    {:.3f}ns/sample'.format(st.median))
+        throughput = megabytes_per_second(opname, st.median)
+        if throughput is not None:
+            print('    Output:    {:.1f}MB/s'.format(throughput))
+        if st.median_low is not None:
+            print('    Median CI: {:.3f} .. {:.3f}ns/sample'
+                  .format(st.median_low, st.median_high))
         if st.variation is not None:
             print('    Variation: {:.3f}ns/sample'.format(st.variation))
 
+# Output formats for results, other than text.
+REPORT_FORMATS = ['json', 'csv', 'markdown']
+
+# Columns of CSV reports. Times are space-separated lists of every sample.
+REPORT_COLUMNS = [
+    "Operator", "Runs", "Median", "MedianLow", "MedianHigh", "Variation",
+    "RefRuns", "RefMedian", "RefMedianLow", "RefMedianHigh", "RefVariation",
+    "Ratio", "RatioLow", "RatioHigh", "PValue", "Verdict", "TimesNS",
+    "RefTimesNS", "Drifted",
+]
+
+def stats_json(times, st: Stats):
+    return {
+        'times_ns': times.tolist(),
+        'median': st.median,
+        'median_ci': (None if st.median_low is None
+                      else [st.median_low, st.median_high]),
+        'variation': st.variation,
+    }
+
+def report_json(results: List[OperatorResult], *, confidence: float,
+                paired: bool) -> str:
+    operators = []
+    for result in results:
+        op = {'operator': result.operator,
+              **stats_json(result.times, result.stats)}
+        throughput = megabytes_per_second(result.operator, result.stats.median)
+        if throughput is not None:
+            op['output_mb_per_s'] = throughput
+        if result.comparison is not None:
+            cmp = result.comparison
+            op['reference'] = stats_json(result.reftimes, result.refstats)
+            op['ratio'] = cmp.ratio
+            op['ratio_ci'] = [cmp.ratio_low, cmp.ratio_high]
+            op['pvalue'] = cmp.pvalue
+            op['verdict'] = cmp.verdict
+        op['drifted'] = result.drifted
+        operators.append(op)
+    return json.dumps({'unit': 'ns/sample', 'confidence': confidence,
+                       'paired': paired, 'operators': operators}, indent=2)
+
+def report_csv(fp, results: List[OperatorResult]):
+    def num(x):
+        return '' if x is None else '{:.6g}'.format(x)
+
+    def stat_columns(times, st):
+        if st is None:
+            return [''] * 5
+        return [len(times), num(st.median), num(st.median_low),
+                num(st.median_high), num(st.variation)]
+
+    w = csv.writer(fp)
+    w.writerow(REPORT_COLUMNS)
+    for result in results:
+        cmp = result.comparison
+        if cmp is None:
+            cmp_columns = [''] * 5
+        else:
+            cmp_columns = [num(cmp.ratio), num(cmp.ratio_low),
+                           num(cmp.ratio_high), num(cmp.pvalue), cmp.verdict]
+        w.writerow([
+            result.operator,
+            *stat_columns(result.times, result.stats),
+            *stat_columns(result.reftimes, result.refstats),
+            *cmp_columns,
+            ' '.join('{:.3f}'.format(t) for t in result.times),
+            ('' if result.reftimes is None else
+             ' '.join('{:.3f}'.format(t) for t in result.reftimes)),
+            int(result.drifted),
+        ])
+
+def report_markdown(results: List[OperatorResult], *,
+                    confidence: float) -> str:
+    """Return a Markdown table of the results. Samples are not included."""
+    compared = any(result.comparison is not None for result in results)
+    ci = '{:.0f}% CI'.format(100 * confidence)
+    header = ['Operator', 'Runs', 'Median (ns/sample)', ci]
+    if compared:
+        header += ['Reference', 'Change', 'Change ' + ci, 'P-value',
+                   'Verdict']
+    lines = ['| ' + ' | '.join(header) + ' |',
+             '|' + '|'.join('---' for _ in header) + '|']
+    for result in results:
+        st = result.stats
+        row = [result.operator, str(len(result.times)),
+               '{:.3f}'.format(st.median),
+               ('' if st.median_low is None else '{:.3f} .. {:.3f}'
+                .format(st.median_low, st.median_high))]
+        if compared:
+            cmp = result.comparison
+            if cmp is None:
+                row += [''] * 5
+            else:
+                row += [
+                    '{:.3f}'.format(result.refstats.median),
+                    '{:+.2f}%'.format(100 * (cmp.ratio - 1)),
+                    '{:+.2f}% .. {:+.2f}%'.format(
+                        100 * (cmp.ratio_low - 1), 100 * (cmp.ratio_high - 1)),
+                    '' if cmp.pvalue is None else '{:.4f}'.format(cmp.pvalue),
+                    cmp.verdict,
+                ]
+        lines.append('| ' + ' | '.join(row) + ' |')
+    return '\n'.join(lines)
+
+def write_report(fmt: str, results: List[OperatorResult], *,
+                 confidence: float, paired: bool):
+    """Write results to standard output in a machine-readable format."""
+    if fmt == 'json':
+        print(report_json(results, confidence=confidence, paired=paired))
+    elif fmt == 'csv':
+        report_csv(sys.stdout, results)
+    elif fmt == 'markdown':
+        print(report_markdown(results, confidence=confidence))
+    else:
+        raise ValueError('unknown format: {!r}'.format(fmt))
+
+def regressions(results: List[OperatorResult],
+                threshold: float) -> List[OperatorResult]:
+    """Return operators which are slower than the reference by more than the
+    threshold, as a fraction. The whole confidence interval for the ratio must
+    be above the threshold.
+    """
+    return [result for result in results
+            if result.comparison is not None
+            and result.comparison.verdict == 'slower'
+            and result.comparison.ratio_low > 1 + threshold]
+
+@dataclasses.dataclass(frozen=True)
+class Workload:
+    """What a baseline was measured on, which results must match to be
+    compared with it. Fields which are None are unknown.
+    """
+    input: str
+    input_seed: Optional[int] = None
+    size: Optional[int] = None
+    backend: Optional[str] = None
+    clock: Optional[str] = None
+    # How runs are shuffled with a seed: by oprun, or with numpy for the
+    # library backend and --serve. The same seed gives a different order with
+    # each.
+    shuffle: Optional[str] = None
+
+# Workload of baselines saved before the workload was recorded, which all used
+# linspace input, like old rows in the history.
+LEGACY_WORKLOAD = Workload(input='linspace')
+
+def workload_path(path: pathlib.Path) -> pathlib.Path:
+    """Return the file a baseline's workload is saved in, next to it."""
+    return path.with_suffix('.json')
+
+def read_workload(path: pathlib.Path) -> Workload:
+    try:
+        with workload_path(path).open() as fp:
+            fields = json.load(fp)
+    except FileNotFoundError:
+        return LEGACY_WORKLOAD
+    try:
+        return Workload(**fields)
+    except TypeError:
+        die('File {!r}: invalid workload'.format(str(workload_path(path))))
+
+def check_workload(name: str, ref: Workload, workload: Workload):
+    """Refuse to compare with a baseline measured on different inputs or
+    sizes, and warn if it was measured with a different backend or clock.
+    """
+    def differences(fields):
+        return ['{} {} (baseline {})'.format(
+                    field.replace('_', ' '), getattr(workload, field),
+                    getattr(ref, field))
+                for field in fields
+                if getattr(ref, field) is not None
+                and getattr(workload, field) is not None
+                and getattr(ref, field) != getattr(workload, field)]
+    different = differences(['input', 'input_seed', 'size'])
+    if different:
+        die('cannot compare with baseline {!r}, it was measured with a '
+            'different workload: {}'.format(name, ', '.join(different)))
+    different = differences(['backend', 'clock'])
+    if different:
+        print('Warning: baseline {!r} was measured differently: {}'
+              .format(name, ', '.join(different)), file=sys.stderr)
+
+def run_instructions(here: pathlib.Path, build_config: BuildConfig,
+                     refs: Dict[str, pathlib.Path], workload: Workload, args):
+    """Count instructions with Cachegrind, and show or compare the results."""
+    size = DEFAULT_SIZE if args.size is None else args.size
+    if size < 1 or size % UFXR_QUANTUM:
+        die('invalid size {}, must be a positive multiple of {}'
+            .format(size, UFXR_QUANTUM))
+    iterations = DEFAULT_INSTRUCTION_ITER if args.iter is None else args.iter
+    names = select_functions(args.function)
+    out = here / 'bench_instructions_out.csv'
+    build(here, ':oprun', build_config)
+    exe = here / '../../bazel-bin/c/ops/oprun'
+    cgout = here / 'bench_cachegrind.out'
+    print('Running benchmarks under Cachegrind', file=sys.stderr)
+    try:
+        cachegrind.run(
+            [str(exe), 'benchmark', '-size={}'.format(size),
+             '-iter={}'.format(iterations), '-runs=1',
+             *input_args(args.input, args.input_seed), '--', *names],
+            cgout, cwd=here)
+        counts = cachegrind.read(cgout)
+    except cachegrind.CachegrindError as ex:
+        die(str(ex))
+    # Each function is called once to warm the cache before it is timed.
+    data = instruction_counts(counts, names, (iterations + 1) * size)
+    write_instructions_csv(out, data)
+    if not args.no_history:
+        history.record(
+            history.connect(here / HISTORY_DB), here, history_config(args),
+            size,
+            {opname: {metric: [value] for metric, value in counts.items()}
+             for opname, counts in data.items()})
+    if refs:
+        (ref,) = refs.values()
+        compare_instructions(read_instructions_csv(ref), data)
+    else:
+        show_instructions(data)
+    if args.save:
+        save_baseline(out, baseline_path(here, 'instructions', args.save),
+                      workload)
+
+def is_function_pattern(value: str) -> bool:
+    if value.endswith('*'):
+        return any(name.startswith(value[:-1]) for name in FUNCTIONS)
+    return value in FUNCTIONS
+
+def check_baseline_name(name: str):
+    if (not re.fullmatch(r'[A-Za-z0-9][-A-Za-z0-9_.]*', name)
+            or is_function_pattern(name)):
+        die('invalid baseline name {!r}'.format(name))
+
+def baseline_path(here: pathlib.Path, kind: str, name: str) -> pathlib.Path:
+    """Return the file a baseline is saved in.
+
+    The kind is 'time', 'latency', or 'instructions', since each is saved
+    separately.
+    """
+    if name == DEFAULT_BASELINE:
+        prefix = '' if kind == 'time' else kind + '_'
+        return here / 'bench_{}ref.csv'.format(prefix)
+    suffix = '' if kind == 'time' else '.' + kind
+    return here / BASELINE_DIR / '{}{}.csv'.format(name, suffix)
+
+def baseline_paths(here: pathlib.Path, kind: str,
+                   names: Optional[List[str]]) -> Dict[str, pathlib.Path]:
+    """Return the files for baselines to compare against, which must exist."""
+    paths = {}
+    for name in names or []:
+        path = baseline_path(here, kind, name)
+        if not path.exists():
+            die('no saved baseline {!r} ({})'.format(name, path))
+        paths[name] = path
+    return paths
+
+def save_baseline(out: pathlib.Path, path: pathlib.Path, workload: Workload):
+    path.parent.mkdir(exist_ok=True)
+    out.replace(path)
+    with workload_path(path).open('w') as fp:
+        json.dump(dataclasses.asdict(workload), fp, indent=2)
+        fp.write('\n')
+
+def comma_list(value: str) -> List[str]:
+    return [item for item in value.split(',') if item]
+
+def config_args(p: argparse.ArgumentParser):
+    """Add arguments for the build configuration."""
+    p.add_argument('--impl', choices={'vector', 'scalar'},
+                   default='vector', help='Operator implementation')
+    p.add_argument('--copt', action='append', help='C compiler flags')
+    p.add_argument('--compilation-mode', choices={'opt', 'fastbuild', 'dbg'},
+                   default='opt', help='Bazel compilation mode')
+    p.add_argument('--backend', choices={'oprun', 'library'},
+                   default='oprun',
+                   help='Run oprun, or call the ops library in-process')
+    p.add_argument('--input', default='default',
+                   help=('Input distribution: {}, or a comma-separated list '
+                         'or "all" to compare distributions'
+                         .format(', '.join(INPUTS))))
+
+def history_config(args) -> history.Config:
+    return history.Config(
+        backend=args.backend,
+        impl=args.impl,
+        copts=args.copt or [],
+        mode=args.compilation_mode,
+        cpu=history.cpu_model(),
+        input=args.input,
+    )
+
+def history_main(argv):
+    p = argparse.ArgumentParser('bench.py history')
+    sub = p.add_subparsers(dest='command', required=True)
+    for name, help in [
+            ('trend', 'Show an operator\'s results over recent commits'),
+            ('best', 'Show the best and worst commits for an operator')]:
+        c = sub.add_parser(name, help=help)
+        c.add_argument('operator', help='Operator to query')
+        c.add_argument('--last', type=int, default=DEFAULT_HISTORY_COMMITS,
+                       help='Number of recent commits to include')
+        c.add_argument('--metric', default=history.THROUGHPUT,
+                       help=('Metric to query: throughput, or latency_p50, '
+                             'latency_p99, etc.'))
+        c.add_argument('--size', type=int,
+                       help='Array size to query, defaults to the default '
+                       'size for the benchmark; required for --sfx metrics, '
+                       'which use the buffer size')
+        c.add_argument('--include-drifted', action='store_true',
+                       help='Include runs where the CPU speed drifted')
+        config_args(c)
+    args = p.parse_args(argv)
+
+    here = pathlib.Path(__file__).parent
+    size = args.size
+    if size is None:
+        if args.metric.startswith('sfx_'):
+            die('--size is required for {}, use one of the buffer sizes '
+                'from --sfx-buffers'.format(args.metric))
+        if args.metric.startswith('latency_'):
+            size = DEFAULT_LATENCY_SIZE
+        else:
+            size = DEFAULT_SIZE
+    db = history.connect(here / HISTORY_DB)
+    config = history_config(args)
+    if args.metric.startswith('sfx_'):
+        config = sfx_history_config()
+    results = history.commit_results(
+        db, config, args.operator, args.metric, size,
+        include_drifted=args.include_drifted)
+    results = results[-args.last:]
+    if not results:
+        die('No results for {} with this configuration'
+            .format(args.operator))
+    if args.command == 'trend':
+        history.show_trend(results)
+    else:
+        best = min(results, key=lambda result: result.median)
+        worst = max(results, key=lambda result: result.median)
+        for label, result in [('Best', best), ('Worst', worst)]:
+            print('{}: {} {:.3f} ({} samples, {})'.format(
+                label, history.short_hash(result),
+                result.median, result.count, result.timestamp[:19]))
+
+def write_pareto_csv(path, errors: Dict[str, float],
+                     times: Dict[str, history.CommitResult],
+                     frontier: List[str]):
+    with path.open('w') as fp:
+        w = csv.writer(fp)
+        w.writerow(['Operator', 'Metric', 'Error', 'TimeNS', 'Commit',
+                    'Pareto'])
+        for name, error in errors.items():
+            result = times.get(name)
+            w.writerow([
+                name, accuracy.metric(name).name, '{:.4e}'.format(error),
+                '' if result is None else '{:.3f}'.format(result.median),
+                '' if result is None else result.commit_hash or '',
+                int(name in frontier)])
+
+def show_pareto(errors: Dict[str, float],
+                times: Dict[str, history.CommitResult], frontier: List[str]):
+    """Print the error and time of each operator, grouped by error metric."""
+    groups = {}
+    for name in errors:
+        groups.setdefault(accuracy.metric(name), []).append(name)
+    for metric, names in groups.items():
+        print('{} error ({})'.format(metric.name, metric.unit))
+        print('  {:8}  {:>10}  {:>9}  {:11}'.format(
+            'Operator', 'Error', 'ns/sample', 'Commit'))
+        for name in names:
+            result = times.get(name)
+            if result is None:
+                time, commit = '-', '-'
+            else:
+                time = '{:.3f}'.format(result.median)
+                commit = history.short_hash(result)
+            print('  {:8}  {:10.4e}  {:>9}  {:11}{}'.format(
+                name, errors[name], time, commit,
+                '  *' if name in frontier else ''))
+        print()
+    print('* Pareto frontier: no faster operator has a smaller error')
+    missing = [name for name in errors if name not in times]
+    if missing:
+        print('No benchmark results with this configuration: {}'
+              .format(' '.join(missing)))
+
+def pareto_main(argv):
+    p = argparse.ArgumentParser(
+        'bench.py pareto',
+        description=('Show the error of each operator against its latest '
+                     'median time in the history, and the Pareto frontier '
+                     'for each error metric'))
+    p.add_argument('function', default=[], nargs='*',
+                   help='Functions to include, default is all with an '
+                   'error metric')
+    p.add_argument('--count', type=int, default=accuracy.DEFAULT_COUNT,
+                   help='Number of inputs when measuring error')
+    p.add_argument('--size', type=int, default=DEFAULT_SIZE,
+                   help='Array size of benchmark results to use')
+    config_args(p)
+    args = p.parse_args(argv)
+    if args.count < 1:
+        die('count must be positive')
+
+    here = pathlib.Path(__file__).parent
+    names = [name for name in select_functions(args.function)
+             if accuracy.metric(name) is not None]
+    if not names:
+        die('No functions with an error metric')
+    build(here, ':oprun', BuildConfig(args.impl, args.copt or [],
+                                      args.compilation_mode))
+    try:
+        errors = accuracy.errors(here / '../../bazel-bin/c/ops/oprun', names,
+                                 count=args.count)
+    except accuracy.AccuracyError as ex:
+        die(ex)
+
+    db = history.connect(here / HISTORY_DB)
+    config = history_config(args)
+    times = {}
+    for name in names:
+        results = history.commit_results(db, config, name, history.THROUGHPUT,
+                                         args.size)
+        if results:
+            times[name] = results[-1]
+    # Each metric has its own frontier, since errors are in different units.
+    frontier = []
+    for metric in {accuracy.metric(name).name for name in times}:
+        frontier.extend(accuracy.pareto({
+            name: (result.median, errors[name])
+            for name, result in times.items()
+            if accuracy.metric(name).name == metric}))
+    write_pareto_csv(here / 'bench_pareto.csv', errors, times, frontier)
+    show_pareto(errors, times, frontier)
+
+def bisect_tools(state: bisection.State) -> Tuple[
+        bisection.Builder, bisection.Measure, bisection.Compare]:
+    """Return the functions which build, benchmark, and compare oprun for
+    bisection.
+    """
+    config = BuildConfig(**state.config)
+
+    def builder(worktree, log, output_base):
+        return build_isolated(worktree / 'c/ops', ':oprun', config, log,
+                              output_base)
+
+    def measure(good_exe, exe):
+        data = run_matrix(pathlib.Path(state.tmp), [good_exe, exe],
+                          state.bench_args, [state.op], state.runs,
+                          state.size)
+        return data[0][state.op], data[1][state.op]
+
+    def compare(good, test):
+        return compare_times(good, test, confidence=state.confidence,
+                             paired=True)
+
+    return builder, measure, compare
+
+def bisect_main(argv):
+    p = argparse.ArgumentParser(
+        'bench.py bisect',
+        description=('Find the commit which made an operator slower, with '
+                     '"git bisect run". Each commit is built in a temporary '
+                     'worktree, and compared to the good commit with paired '
+                     'runs'))
+    p.add_argument('--op', required=True, help='Operator to measure')
+    p.add_argument('--good', required=True,
+                   help='Revision where the operator is fast')
+    p.add_argument('--bad', required=True,
+                   help='Revision where the operator is slow')
+    p.add_argument('--threshold', type=float,
+                   default=DEFAULT_BISECT_THRESHOLD, metavar='PCT',
+                   help=('Size of the slowdown in percent; commits more than '
+                         'half this slower than the good commit are bad'))
+    p.add_argument('--runs', type=int, default=DEFAULT_BISECT_RUNS,
+                   help='Number of paired runs for each commit')
+    p.add_argument('--max-runs', type=int, default=DEFAULT_BISECT_MAX_RUNS,
+                   help=('Maximum number of runs for a commit before it is '
+                         'skipped as inconclusive'))
+    p.add_argument('--size', type=int, default=DEFAULT_SIZE,
+                   help='Size of array')
+    p.add_argument('--iter', type=int, default=DEFAULT_ITER,
+                   help='Number of iterations per run')
+    p.add_argument('--confidence', type=float, default=DEFAULT_CONFIDENCE,
+                   help='Confidence level for classifying commits')
+    config_args(p)
+    if argv[:1] == ['--step'] and len(argv) == 2:
+        # Run by "git bisect run" with the state file. Errors must stop the
+        # bisection, rather than mark the commit as bad.
+        try:
+            state = bisection.State(
+                **json.loads(pathlib.Path(argv[1]).read_text()))
+            status = bisection.step(state, cache_dir() / 'bisect',
+                                    *bisect_tools(state))
+        except SystemExit:
+            status = bisection.ABORT
+        except bisection.BisectError as ex:
+            print('Error:', ex, file=sys.stderr)
+            status = bisection.ABORT
+        except Exception:
+            traceback.print_exc()
+            status = bisection.ABORT
+        raise SystemExit(status)
+    args = p.parse_args(argv)
+    if args.op not in FUNCTIONS:
+        die('unknown function {!r}'.format(args.op))
+    if args.backend != 'oprun':
+        die('bisect requires the oprun backend')
+    if args.threshold <= 0:
+        die('threshold must be positive')
+    if args.runs < 2 or args.max_runs < args.runs:
+        die('runs must be at least 2, and no more than max runs')
+    if args.size < 1 or args.size % UFXR_QUANTUM:
+        die('invalid size {}, must be a positive multiple of {}'
+            .format(args.size, UFXR_QUANTUM))
+
+    here = pathlib.Path(__file__).parent.resolve()
+    try:
+        bisect_commits(here, args)
+    except bisection.BisectError as ex:
+        die(str(ex))
+
+def bisect_commits(here: pathlib.Path, args):
+    """Build the good and bad commits, check the bad one is slower, and run
+    "git bisect run" between them.
+    """
+    repo = pathlib.Path(bisection.git(here, 'rev-parse', '--show-toplevel'))
+    good = bisection.git(repo, 'rev-parse', '--verify',
+                         args.good + '^{commit}')
+    bad = bisection.git(repo, 'rev-parse', '--verify', args.bad + '^{commit}')
+    # Older versions of oprun do not have -input, so it is only passed if
+    # needed.
+    bench_args = ['-iter={}'.format(args.iter)]
+    if args.input != 'default':
+        bench_args.append('-input=' + args.input)
+
+    with tempfile.TemporaryDirectory(prefix='bench-bisect-') as tmpname:
+        tmp = pathlib.Path(tmpname)
+        state = bisection.State(
+            op=args.op,
+            threshold=args.threshold,
+            confidence=args.confidence,
+            runs=args.runs,
+            max_runs=args.max_runs,
+            size=args.size,
+            bench_args=bench_args,
+            config=dataclasses.asdict(BuildConfig(
+                args.impl, args.copt or [], args.compilation_mode)),
+            tmp=str(tmp),
+            good_exe='',
+            log=str(tmp / 'steps.jsonl'),
+        )
+        builder, measure, compare = bisect_tools(state)
+        good_tree = tmp / 'good'
+        bisect_tree = tmp / 'bisect'
+        bisection.git(repo, 'worktree', 'add', '--detach', str(good_tree),
+                      good)
+        bisection.git(repo, 'worktree', 'add', '--detach', str(bisect_tree),
+                      bad)
+        try:
+            print('Building good and bad commits', file=sys.stderr)
+            # Each worktree has its own Bazel output base, which is kept
+            # for the next bisection.
+            good_exe = bisection.build(good_tree, state, 'good',
+                                       cache_dir() / 'bisect-good', builder)
+            bad_exe = bisection.build(bisect_tree, state, 'bad',
+                                      cache_dir() / 'bisect', builder)
+            if good_exe is None or bad_exe is None:
+                die('Build failed')
+            state.good_exe = str(good_exe)
+            # Check the bad commit is classified as bad before bisecting, so
+            # the search does not chase noise.
+            verdict, cmp = bisection.classify(state, bad_exe, measure,
+                                              compare)
+            print('Bad commit: {:+.2f}% ({:+.2f}% .. {:+.2f}%)'.format(
+                100 * (cmp.ratio - 1), 100 * (cmp.ratio_low - 1),
+                100 * (cmp.ratio_high - 1)), file=sys.stderr)
+            if verdict != 'bad':
+                die('{} is not more than {}% slower at {} than at {}'
+                    .format(args.op, 0.5 * args.threshold, args.bad,
+                            args.good))
+            state_path = tmp / 'state.json'
+            state_path.write_text(json.dumps(dataclasses.asdict(state)))
+            bisection.git(bisect_tree, 'bisect', 'start', bad, good)
+            proc = subprocess.run(
+                ['git', 'bisect', 'run', sys.executable,
+                 str(here / 'bench.py'), 'bisect', '--step', str(state_path)],
+                cwd=bisect_tree,
+                stdin=subprocess.DEVNULL,
+            )
+            first_bad = None
+            if proc.returncode == 0:
+                first_bad = bisection.git(bisect_tree, 'rev-parse',
+                                          'refs/bisect/bad')
+            entries = []
+            if pathlib.Path(state.log).exists():
+                with open(state.log) as fp:
+                    entries = [json.loads(line) for line in fp]
+        finally:
+            for tree in [bisect_tree, good_tree]:
+                bisection.git(repo, 'worktree', 'remove', '--force',
+                              str(tree), check=False)
+    bisection.write_csv(here / 'bench_bisect.csv', entries)
+    if first_bad is None:
+        die('git bisect run failed')
+    print()
+    print('First bad commit: {}'.format(
+        bisection.git(repo, 'show', '-s', '--format=%h %s', first_bad)))
+    for entry in entries:
+        if entry['commit'] == first_bad and 'ratio' in entry:
+            print('{} is {:.2f}% slower than at {}'.format(
+                args.op, 100 * (entry['ratio'] - 1), args.good))
+
+# Options which cannot be used together. Each entry is an option, whether it
+# requires the oprun backend, and the options it cannot be used with. The names
+# are those in used_options.
+OPTION_CONFLICTS = [
+    ('several inputs', False,
+     ['--latency', '--sweep', '--matrix', '--scaling', '--mode=instructions',
+      '--save', '--compare', '--format']),
+    ('several baselines', False,
+     ['--latency', '--mode=instructions', '--format']),
+    ('--format', False,
+     ['--latency', '--sweep', '--matrix', '--mode=instructions']),
+    ('--fail-on-regression', False,
+     ['--latency', '--sweep', '--matrix', '--mode=instructions']),
+    ('--latency', True, ['--sweep', '--precision']),
+    ('--counters', True, ['--latency', '--sweep', '--matrix']),
+    ('--variants', True,
+     ['--latency', '--counters', '--sweep', '--matrix', '--scaling',
+      'several inputs', '--mode=instructions', '--save', '--compare',
+      '--format']),
+    ('--serve', True,
+     ['--latency', '--counters', '--matrix', '--autotune', '--scaling',
+      '--variants', '--chain', '--wave', '--sfx', '--mode=instructions']),
+    ('--stream', True,
+     ['--latency', '--counters', '--matrix', '--autotune', '--scaling',
+      '--variants', '--chain', '--wave', '--sfx', '--mode=instructions',
+      '--max-drift']),
+    ('--autotune', True,
+     ['--latency', '--counters', '--sweep', '--matrix', '--precision',
+      '--save', '--compare', '--format', '--mode=instructions']),
+    ('--mode=instructions', True,
+     ['--latency', '--sweep', '--matrix', '--precision']),
+    ('--matrix', True,
+     ['--latency', '--sweep', '--precision', '--save', '--compare']),
+    ('--sfx', False,
+     ['function arguments', '--latency', '--counters', '--sweep', '--matrix',
+      '--scaling', '--variants', '--chain', '--wave', 'several inputs',
+      '--mode=instructions', '--precision', '--save', '--compare',
+      '--format']),
+    ('--wave', True,
+     ['function arguments', '--latency', '--counters', '--sweep', '--matrix',
+      '--scaling', '--variants', '--chain', 'several inputs',
+      '--mode=instructions', '--precision', '--save', '--compare',
+      '--format']),
+    ('--chain', True,
+     ['function arguments', '--latency', '--counters', '--sweep', '--matrix',
+      '--scaling', '--variants', 'several inputs', '--mode=instructions',
+      '--precision', '--save', '--compare', '--format']),
+    ('--scaling', True,
+     ['--latency', '--counters', '--sweep', '--precision', '--cpu', '--save',
+      '--compare', '--format']),
+    ('--sweep', False, ['--save', '--compare']),
+]
+
+def used_options(args, inputs: List[str]) -> Dict[str, bool]:
+    """Return whether each option in OPTION_CONFLICTS is used."""
+    return {
+        'function arguments': bool(args.function),
+        'several inputs': len(inputs) > 1,
+        'several baselines': bool(args.compare) and len(args.compare) > 1,
+        '--latency': args.latency,
+        '--counters': args.counters,
+        '--sweep': args.sweep,
+        '--matrix': args.matrix,
+        '--autotune': args.autotune is not None,
+        '--scaling': args.scaling,
+        '--variants': args.variants,
+        '--chain': bool(args.chain),
+        '--wave': args.wave is not None,
+        '--sfx': args.sfx,
+        '--serve': args.serve,
+        '--stream': args.stream,
+        '--mode=instructions': args.mode != 'time',
+        '--precision': args.precision is not None,
+        '--max-drift': args.max_drift is not None,
+        '--cpu': args.cpu is not None,
+        '--save': args.save is not None,
+        '--compare': bool(args.compare),
+        '--format': args.format != 'text',
+        '--fail-on-regression': args.fail_on_regression is not None,
+    }
+
+def check_conflicts(used: Dict[str, bool], backend: str):
+    """Exit with an error if options which cannot be used together are used.
+    """
+    for option, needs_oprun, others in OPTION_CONFLICTS:
+        if not used[option]:
+            continue
+        if needs_oprun and backend != 'oprun':
+            die('{} requires the oprun backend'.format(option))
+        conflicts = [other for other in others if used[other]]
+        if conflicts:
+            die('{} cannot be used with {}'.format(
+                option, ', '.join(conflicts)))
+
 def main(argv):
+    if argv and argv[0] == 'history':
+        history_main(argv[1:])
+        return
+    if argv and argv[0] == 'pareto':
+        pareto_main(argv[1:])
+        return
+    if argv and argv[0] == 'bisect':
+        bisect_main(argv[1:])
+        return
     p = argparse.ArgumentParser('bench.py')
     p.add_argument('function', default=[], nargs='*',
                    help='Functions to benchmark')
-    p.add_argument('--save', help='Save results as reference',
-                   action='store_true')
-    p.add_argument('--compare', help='Compare results to reference',
-                   action='store_true')
+    p.add_argument('--mode', choices={'time', 'instructions'}, default='time',
+                   help=('Measure time, or count instructions, cache misses, '
+                         'and branch mispredictions with Cachegrind'))
+    p.add_argument('--save', nargs='?', const=DEFAULT_BASELINE,
+                   metavar='NAME',
+                   help=('Save results as a named baseline, or as the '
+                         'reference'))
+    p.add_argument('--compare', nargs='?', const=[DEFAULT_BASELINE],
+                   type=comma_list, metavar='NAME,...',
+                   help=('Compare results to comma-separated named baselines, '
+                         'or to the reference'))
     p.add_argument('--runs', type=int, help='Number of benchmark runs')
     p.add_argument('--size', type=int, help='Size of array')
     p.add_argument('--iter', type=int, help='Number of iterations per run')
-    p.add_argument('--impl', choices={'vector', 'scalar'},
-                   default='vector', help='Operator implementation')
-    p.add_argument('--copt', action='append', help='C compiler flags')
+    p.add_argument('--time', type=float,
+                   help='Choose iterations so each run takes TIME ms')
+    p.add_argument('--precision', type=float,
+                   help=('Add runs until the median CI is within '
+                         '±PRECISION percent'))
+    p.add_argument('--max-runs', type=int, default=DEFAULT_MAX_RUNS,
+                   help='Maximum number of runs with --precision')
+    p.add_argument('--sweep', action='store_true',
+                   help=('Benchmark over a geometric range of array sizes, '
+                         'and write bench_sweep.csv'))
+    p.add_argument('--sweep-min', type=int, default=DEFAULT_SWEEP_MIN,
+                   help='Smallest array size for --sweep')
+    p.add_argument('--sweep-max', type=int, default=DEFAULT_SWEEP_MAX,
+                   help='Largest array size for --sweep')
+    p.add_argument('--sweep-steps', type=int, default=DEFAULT_SWEEP_STEPS,
+                   help='Number of array sizes per octave for --sweep')
+    p.add_argument('--shuffle', action='store_true',
+                   help='Shuffle the order of functions in each run')
+    p.add_argument('--seed', type=int,
+                   help=('Random seed for --shuffle, implies --shuffle, use '
+                         'the same seed as the reference to compare runs in '
+                         'pairs'))
+    p.add_argument('--cpu', type=int,
+                   help='Pin the benchmark to this CPU')
+    p.add_argument('--max-drift', type=float,
+                   help=('Run a calibration loop before and after each '
+                         'measurement, and flag measurements where it '
+                         'changed by more than MAX_DRIFT percent'))
+    p.add_argument('--discard-drifted', action='store_true',
+                   help=('Repeat measurements flagged by --max-drift, and '
+                         'fail if they still drift'))
+    p.add_argument('--matrix', action='store_true',
+                   help=('Build and benchmark every combination of '
+                         '--matrix-impl, --matrix-copts, and '
+                         '--matrix-compilation-mode, '
+                         'and write bench_matrix.csv'))
+    p.add_argument('--matrix-impl', type=comma_list,
+                   help='Comma-separated implementations for --matrix')
+    p.add_argument('--matrix-copts', action='append',
+                   help=('Space-separated set of C compiler flags for '
+                         '--matrix, may be repeated, use "" for no flags'))
+    p.add_argument('--matrix-compilation-mode', type=comma_list,
+                   help='Comma-separated compilation modes for --matrix')
+    p.add_argument('--jobs', type=int,
+                   help='Number of concurrent builds for --matrix and '
+                   '--autotune')
+    p.add_argument('--autotune', type=int, metavar='COUNT',
+                   help=('Build COUNT random combinations of compiler and '
+                         'flags, find the fastest for each function by '
+                         'successive halving, and write '
+                         'bench_autotune.json'))
+    p.add_argument('--autotune-seed', type=int,
+                   help='Random seed for choosing --autotune configurations')
+    p.add_argument('--autotune-compilers', type=comma_list,
+                   help=('Comma-separated compilers for --autotune, default '
+                         'is every one of {} installed'
+                         .format(', '.join(autotune.COMPILERS))))
+    p.add_argument('--latency', action='store_true',
+                   help=('Time each call, and report latency percentiles '
+                         'in ns per call'))
+    p.add_argument('--variants', action='store_true',
+                   help=('Benchmark with buffers aligned to 16, 32, and 64 '
+                         'bytes and to a page, and in place, and write '
+                         'bench_variants.csv'))
+    p.add_argument('--sfx', action='store_true',
+                   help=('Render the example programs with the Rust sfx '
+                         'command, and write bench_sfx.csv'))
+    p.add_argument('--sfx-rates', type=comma_list,
+                   help=('Comma-separated sample rates for --sfx, default {}'
+                         .format(','.join(map(str, DEFAULT_SFX_RATES)))))
+    p.add_argument('--sfx-buffers', type=comma_list,
+                   help=('Comma-separated buffer sizes for --sfx, default {}'
+                         .format(','.join(map(str, DEFAULT_SFX_BUFFERS)))))
+    p.add_argument('--wave', type=float, metavar='SECONDS',
+                   help=('Render SECONDS of audio to a WAVE file, with and '
+                         'without fsync, and write bench_wave.csv'))
+    p.add_argument('--wave-format', type=comma_list,
+                   help=('Comma-separated sample formats for --wave, or '
+                         '"all", default {}'.format(DEFAULT_WAVE_FORMAT)))
+    p.add_argument('--wave-dir', action='append',
+                   help=('Directory to write files to for --wave, may be '
+                         'repeated, default this directory and /dev/shm'))
+    p.add_argument('--chain', type=comma_list,
+                   help=('Benchmark a comma-separated chain of functions, '
+                         'where each function processes the output of the '
+                         'previous one, over a range of block sizes, and '
+                         'write bench_chain.csv'))
+    p.add_argument('--chain-min-block', type=int,
+                   default=DEFAULT_CHAIN_MIN_BLOCK,
+                   help='Smallest block size for --chain')
+    p.add_argument('--scaling', action='store_true',
+                   help=('Run each function on 1 to --max-threads threads at '
+                         'once, report throughput and parallel efficiency, '
+                         'and write bench_scaling.csv'))
+    p.add_argument('--max-threads', type=int,
+                   help='Maximum number of threads for --scaling')
+    p.add_argument('--counters', action='store_true',
+                   help=('Measure cycles, instructions, cache misses, and '
+                         'branch mispredictions with hardware performance '
+                         'counters'))
+    p.add_argument('--raw-event',
+                   help=('Also measure this model-specific raw performance '
+                         'counter event, like 0x08c7, implies --counters'))
+    config_args(p)
+    p.add_argument('--format', choices=['text', *REPORT_FORMATS],
+                   default='text',
+                   help='Format for results, written to standard output')
+    p.add_argument('--fail-on-regression', type=float, metavar='PCT',
+                   help=('Exit with status {} if an operator is slower than '
+                         'the reference by more than PCT percent, with '
+                         'confidence'.format(REGRESSION_EXIT_STATUS)))
+    p.add_argument('--confidence', type=float, default=DEFAULT_CONFIDENCE,
+                   help='Confidence level for statistics')
+    p.add_argument('--no-history', action='store_true',
+                   help='Do not record results in the history database')
+    p.add_argument('--input-seed', type=int, default=DEFAULT_INPUT_SEED,
+                   help='Random seed for the input distribution')
+    p.add_argument('--serve', action='store_true',
+                   help=('Run all measurements in one oprun process, which '
+                         'keeps its buffers warm between measurements'))
+    p.add_argument('--stream', action='store_true',
+                   help=('Read results as they are measured, and show the '
+                         'running median of each function; with '
+                         '--precision, stop as soon as every function has '
+                         'converged'))
+    p.add_argument('--force', action='store_true',
+                   help=('Run benchmarks even if cached results from the '
+                         'same oprun binary and arguments exist'))
+    p.add_argument('--clock', choices=CLOCKS, default='thread',
+                   help='Clock for the library backend')
     args = p.parse_args(argv)
 
+    # A function after --save or --compare is not a baseline name, so
+    # "--save sin1_4" works as it did before baselines were named.
+    if args.save is not None and is_function_pattern(args.save):
+        args.function.insert(0, args.save)
+        args.save = DEFAULT_BASELINE
+    if (args.compare and len(args.compare) == 1
+            and is_function_pattern(args.compare[0])):
+        args.function.insert(0, args.compare[0])
+        args.compare = [DEFAULT_BASELINE]
+    for name in [args.save, *(args.compare or [])]:
+        if name is not None:
+            check_baseline_name(name)
+
+    inputs = INPUTS if args.input == 'all' else comma_list(args.input)
+    for dist in inputs:
+        if dist not in INPUTS:
+            die('unknown input distribution {!r}'.format(dist))
+    # Input distribution for the current measurements.
+    input_dist = inputs[0]
+    if args.raw_event is not None:
+        args.counters = True
+    # Check every combination of options before running anything, so the
+    # order of the modes below does not matter.
+    check_conflicts(used_options(args, inputs), args.backend)
+    if args.fail_on_regression is not None and not args.compare:
+        die('--fail-on-regression requires --compare')
+    if args.discard_drifted and args.max_drift is None:
+        die('--discard-drifted requires --max-drift')
+    # Extra oprun arguments and history metric for the current measurements.
+    variant_args = []
+    metric = history.THROUGHPUT
+
     bench_args = []
-    if args.runs is not None:
-        bench_args.append('-runs={}'.format(args.runs))
     if args.iter is not None:
         bench_args.append('-iter={}'.format(args.iter))
-    if args.size is not None:
-        bench_args.append('-size={}'.format(args.size))
+    time_ms = args.time
+    if args.sweep and time_ms is None and args.iter is None:
+        time_ms = DEFAULT_SWEEP_TIME
+    if args.autotune is not None and time_ms is None and args.iter is None:
+        time_ms = DEFAULT_AUTOTUNE_TIME
+    if time_ms is not None:
+        bench_args.append('-time={}'.format(time_ms))
 
     here = pathlib.Path(__file__).parent
-    ref = here / 'bench_ref.csv'
-    out = here / 'bench_out.csv'
 
-    bazel_args = []
-    if args.impl != 'vector':
-        bazel_args.append('--define=ops=' + args.impl)
-    if args.copt is not None:
-        for copt in args.copt:
-            bazel_args.append('--copt=' + copt)
+    if args.latency:
+        bench_args.append('-latency')
+        kind = 'latency'
+        out = here / 'bench_latency_out.csv'
+        read_out = read_latency_csv
+    else:
+        kind = 'time'
+        out = here / 'bench_out.csv'
+        read_out = read_csv
 
-    proc = subprocess.run(
-        ['bazel', 'build', '-c', 'opt', ':oprun', *bazel_args],
-        cwd=here,
-        stdin=subprocess.DEVNULL,
+    # Performance counters for each operator, over all measurements.
+    counter_data = {}
+    if args.counters:
+        bench_args.append('-counters')
+        if args.raw_event is not None:
+            bench_args.append('-raw-event=' + args.raw_event)
+
+        def read_out(path):
+            times, counters = read_counters_csv(path)
+            for opname, metrics in counters.items():
+                opdata = counter_data.setdefault(opname, {})
+                for metric, values in metrics.items():
+                    opdata[metric] = numpy.concatenate(
+                        [opdata.get(metric, []), values])
+            return times
+
+    if args.mode == 'instructions':
+        kind = 'instructions'
+    # Check the baselines exist, and were measured on the same workload,
+    # before spending time benchmarking.
+    refs = baseline_paths(here, kind, args.compare)
+    if args.size is not None:
+        size = args.size
+    elif args.latency and kind != 'instructions':
+        size = DEFAULT_LATENCY_SIZE
+    else:
+        size = DEFAULT_SIZE
+    workload = Workload(
+        input=input_dist,
+        input_seed=args.input_seed,
+        size=size,
+        backend=args.backend,
+        clock=args.clock if args.backend == 'library' else None,
+        shuffle=('oprun' if args.backend == 'oprun' and not args.serve
+                 else 'numpy'),
     )
-    if proc.returncode:
-        die('Build failed')
-    print(file=sys.stderr)
+    for name, path in refs.items():
+        check_workload(name, read_workload(path), workload)
+
+    build_config = BuildConfig(args.impl, args.copt or [],
+                               args.compilation_mode)
+
+    seed = args.seed
+    if args.shuffle and seed is None:
+        seed = random.SystemRandom().randint(1, MAX_SEED)
+    if seed is not None:
+        if not 1 <= seed <= MAX_SEED:
+            die('seed must be between 1 and {}'.format(MAX_SEED))
+        print('Shuffle seed: {}'.format(seed), file=sys.stderr)
+
+    if args.autotune is not None and args.autotune < 1:
+        die('--autotune count must be positive')
+
+    if args.mode == 'instructions':
+        run_instructions(here, build_config, refs, workload, args)
+        return
+
+    if args.matrix:
+        configs = matrix_configs(
+            args.matrix_impl or [args.impl],
+            ([copts.split() for copts in args.matrix_copts]
+             if args.matrix_copts else [args.copt or []]),
+            args.matrix_compilation_mode or [args.compilation_mode])
+        size = DEFAULT_SIZE if args.size is None else args.size
+        names = select_functions(args.function)
+        exes = build_matrix(here, configs, args.jobs or len(configs))
+        pin_cpu(args.cpu)
+        print('Running benchmarks', file=sys.stderr)
+        data = run_matrix(
+            here, exes,
+            [*bench_args, *input_args(input_dist, args.input_seed)], names,
+            DEFAULT_MATRIX_RUNS if args.runs is None else args.runs, size,
+            seed)
+        if not args.no_history:
+            db = history.connect(here / HISTORY_DB)
+            for config, cdata in zip(configs, data):
+                history.record(
+                    db, here,
+                    history.Config('oprun', config.impl, config.copts,
+                                   config.mode, history.cpu_model(),
+                                   input_dist),
+                    size,
+                    {opname: {history.THROUGHPUT: times}
+                     for opname, times in cdata.items()})
+        write_matrix_csv(here / 'bench_matrix.csv', configs, data)
+        show_matrix(configs, data, args.confidence)
+        return
+
+    if args.autotune is not None:
+        ccs = args.autotune_compilers or autotune.compilers()
+        if not ccs:
+            die('No compilers found')
+        tune_seed = args.autotune_seed
+        if tune_seed is None:
+            tune_seed = random.SystemRandom().randint(1, MAX_SEED)
+        print('Autotune seed: {}'.format(tune_seed), file=sys.stderr)
+        base = BuildConfig(args.impl, args.copt or [], args.compilation_mode)
+        configs = [base, *(
+            BuildConfig(base.impl, [*base.copts, *flags], base.mode, cc)
+            for cc, flags in autotune.candidates(tune_seed, args.autotune,
+                                                 ccs))]
+        # The output bases are only used once, so they are deleted after
+        # copying out oprun.
+        exedir = tempfile.TemporaryDirectory(prefix='bench-autotune-')
+        output_root = cache_dir() / 'autotune'
+        try:
+            exes = build_configs(here, configs,
+                                 args.jobs or os.cpu_count() or 1,
+                                 here / 'bench_autotune_logs', output_root)
+            usable = []
+            for n, (config, exe) in enumerate(zip(configs, exes)):
+                if exe is not None:
+                    copy = pathlib.Path(exedir.name) / 'oprun-{}'.format(n)
+                    shutil.copy2(exe, copy)
+                    exe = copy
+                if exe is not None and not oprun_works(here, exe):
+                    print('Does not run on this CPU: {}'.format(config.name),
+                          file=sys.stderr)
+                    exe = None
+                if exe is not None:
+                    usable.append((config, exe))
+        finally:
+            for n in range(len(configs)):
+                remove_output_base(here, output_root / str(n))
+        with exedir:
+            if not usable or usable[0][0] is not base:
+                die('Baseline configuration failed')
+            configs = [config for config, _ in usable]
+            size = DEFAULT_SIZE if args.size is None else args.size
+            names = select_functions(args.function)
+            pin_cpu(args.cpu)
+            print('Running benchmarks', file=sys.stderr)
+            data = run_autotune(
+                here, [exe for _, exe in usable],
+                [*bench_args, *input_args(input_dist, args.input_seed)],
+                names,
+                DEFAULT_AUTOTUNE_RUNS if args.runs is None else args.runs,
+                size)
+        results = autotune_results(data, confidence=args.confidence)
+        write_matrix_csv(here / 'bench_autotune.csv', configs, data)
+        write_autotune_config(here / 'bench_autotune.json', configs, results, {
+            'seed': tune_seed,
+            'count': args.autotune,
+            'compilers': ccs,
+            'size': size,
+            'bench_args': bench_args,
+            'input': args.input,
+            'functions': names,
+        })
+        show_autotune(configs, results)
+        return
+
+    if args.sfx:
+        limits = [('sample rate', args.sfx_rates, DEFAULT_SFX_RATES,
+                   SFX_RATE_RANGE),
+                  ('buffer size', args.sfx_buffers, DEFAULT_SFX_BUFFERS,
+                   SFX_BUFFER_RANGE)]
+        values = []
+        for label, arg, default, (lo, hi) in limits:
+            try:
+                value = default if arg is None else [int(x) for x in arg]
+            except ValueError:
+                die('invalid {} list {!r}'.format(label, ','.join(arg)))
+            for x in value:
+                if not lo <= x <= hi:
+                    die('invalid {} {}, must be {} to {}'
+                        .format(label, x, lo, hi))
+            values.append(value)
+        rates, buffers = values
+        for buffer in buffers:
+            if buffer & (buffer - 1):
+                die('invalid buffer size {}, must be a power of two'
+                    .format(buffer))
+        root = here.parent.parent
+        try:
+            exe = sfx.build(root / 'rust')
+        except sfx.SfxError as ex:
+            die(ex)
+        paths = sfx.programs(root / 'examples')
+        if not paths:
+            die('no example programs')
+        pin_cpu(args.cpu)
+        print('Running benchmarks', file=sys.stderr)
+        data = run_sfx(exe, paths, rates, buffers,
+                       DEFAULT_SFX_RUNS if args.runs is None else args.runs)
+        if not args.no_history:
+            record_sfx(history.connect(here / HISTORY_DB), here, data)
+        write_sfx_csv(here / 'bench_sfx.csv', data)
+        show_sfx(data)
+        return
+
+    if args.wave is not None:
+        if not args.wave > 0:
+            die('--wave must be positive')
+        formats = args.wave_format or [DEFAULT_WAVE_FORMAT]
+        if formats == ['all']:
+            formats = list(WAVE_FORMATS)
+        for fmt in formats:
+            if fmt not in WAVE_FORMATS:
+                die('unknown format {!r}'.format(fmt))
+        dirs = wave_dirs(here, args.wave_dir)
+        for d in dirs:
+            if not d.is_dir():
+                die('not a directory: {!r}'.format(str(d)))
+        build(here, ':oprun', build_config)
+        exe = here / '../../bazel-bin/c/ops/oprun'
+        pin_cpu(args.cpu)
+        print('Running benchmarks', file=sys.stderr)
+        data = run_wave(here, exe, args.wave, formats, dirs,
+                        DEFAULT_WAVE_RUNS if args.runs is None else args.runs)
+        if not args.no_history:
+            db = history.connect(here / HISTORY_DB)
+            size = round(args.wave * WAVE_RATE)
+            for (d, fmt, sync), times in data.items():
+                # Directories on the same type of filesystem may be on
+                # different disks, so the metric includes the directory.
+                metric = 'wave_' + filesystem_type(d)
+                if sync:
+                    metric += '_fsync'
+                metric += ':' + str(d.resolve())
+                history.record(
+                    db, here, history_config(args), size,
+                    {'wave_' + fmt: {metric: times.sum(axis=1) / size}})
+        write_wave_csv(here / 'bench_wave.csv', data)
+        show_wave(args.wave, data)
+        return
+
+    if args.chain:
+        for name in args.chain:
+            if name not in FUNCTIONS:
+                die('unknown function {!r}'.format(name))
+            if name in CONVERSIONS:
+                die('{!r} does not output float, and cannot be chained'
+                    .format(name))
+        size = DEFAULT_SIZE if args.size is None else args.size
+        if size < 1 or size % UFXR_QUANTUM:
+            die('invalid size {}, must be a positive multiple of {}'
+                .format(size, UFXR_QUANTUM))
+        if args.chain_min_block < 1 or args.chain_min_block % UFXR_QUANTUM:
+            die('invalid --chain-min-block {}, must be a positive multiple '
+                'of {}'.format(args.chain_min_block, UFXR_QUANTUM))
+        blocks = sweep_sizes(min(args.chain_min_block, size), size, 1)
+        # The chain and the isolated functions run on the same input.
+        run_args = [*bench_args, *input_args(input_dist, args.input_seed)]
+        if time_ms is None and args.iter is None:
+            run_args.append('-time={}'.format(DEFAULT_SWEEP_TIME))
+        build(here, ':oprun', build_config)
+        exe = here / '../../bazel-bin/c/ops/oprun'
+        pin_cpu(args.cpu)
+        print('Running benchmarks', file=sys.stderr)
+        runs = DEFAULT_CHAIN_RUNS if args.runs is None else args.runs
+        data = run_chain(here, exe, run_args, args.chain, runs, size, blocks)
+        print('Isolated', file=sys.stderr)
+        isolated = read_csv(run_oprun(
+            here, exe, run_args, sorted(set(args.chain)), runs, size, out))
+        if not args.no_history:
+            db = history.connect(here / HISTORY_DB)
+            for block, times in data.items():
+                history.record(db, here, history_config(args), block,
+                               {'>'.join(args.chain):
+                                {history.THROUGHPUT: times}})
+        write_chain_csv(here / 'bench_chain.csv', data)
+        show_chain(args.chain, data, isolated)
+        return
+
+    if args.scaling:
+        max_threads = args.max_threads or os.cpu_count() or 1
+        if max_threads < 1:
+            die('--max-threads must be positive')
+        size = DEFAULT_SIZE if args.size is None else args.size
+        names = select_functions(args.function)
+        build(here, ':oprun', build_config)
+        exe = here / '../../bazel-bin/c/ops/oprun'
+        pin_cpu(None)
+        print('Running benchmarks', file=sys.stderr)
+        run_args = [*bench_args, *input_args(input_dist, args.input_seed)]
+        if seed is not None:
+            run_args.append('-seed={}'.format(seed))
+        data = run_scaling(
+            here, exe, run_args, names,
+            DEFAULT_SCALING_RUNS if args.runs is None else args.runs, size,
+            max_threads)
+        if not args.no_history:
+            db = history.connect(here / HISTORY_DB)
+            history.record(
+                db, here, history_config(args), size,
+                {opname: {'threads_{}'.format(nthreads): tdata[opname]
+                          for nthreads, tdata in data.items()}
+                 for opname in names})
+        write_scaling_csv(here / 'bench_scaling.csv', data)
+        show_scaling(names, data, SCALING_EFFICIENCY)
+        return
+
+    if args.sweep:
+        sizes = sweep_sizes(args.sweep_min, args.sweep_max, args.sweep_steps)
+    elif args.size is not None:
+        sizes = [args.size]
+    elif args.latency:
+        sizes = [DEFAULT_LATENCY_SIZE]
+    else:
+        sizes = [DEFAULT_SIZE]
+    for size in sizes:
+        if size < 1 or size % UFXR_QUANTUM:
+            die('invalid size {}, must be a positive multiple of {}'
+                .format(size, UFXR_QUANTUM))
+
+    # Results are only cached when each size is measured once. Repeated
+    # measurements with the same arguments must not reuse the same results.
+    use_cache = (args.precision is None and args.max_drift is None
+                 and not args.serve and not args.stream)
+    # Sizes, inputs, and metrics whose results came from the cache, and are
+    # already in the history.
+    cached = set()
+
+    # Each measurement gets a different seed, so repeated measurements do not
+    # repeat the same order.
+    seeds = itertools.count(seed) if seed is not None else None
+
+    names = select_functions(args.function)
+    if args.backend == 'library':
+        build(here, ':ops', build_config)
+        build(here, '//c/convert', build_config)
+        funcs = load_library(here / '../../bazel-bin')
+
+        def measure(names, runs, size):
+            return run_library(
+                funcs, names,
+                size=size,
+                iterations=DEFAULT_ITER if args.iter is None else args.iter,
+                runs=runs,
+                clock=CLOCKS[args.clock],
+                time_ms=time_ms,
+                seed=None if seeds is None else next(seeds),
+                input=input_dist,
+                input_seed=args.input_seed,
+            )
+    elif args.serve:
+        build(here, ':oprun', build_config)
+        server = OprunServer(here / '../../bazel-bin/c/ops/oprun', here)
+
+        def stream(names, runs, size):
+            return server.stream(
+                names, runs, size,
+                iterations=args.iter,
+                time_ms=time_ms,
+                input=input_dist,
+                input_seed=args.input_seed,
+                seed=None if seeds is None else next(seeds),
+            )
+
+        def measure(names, runs, size):
+            return server.measure(
+                names, runs, size,
+                iterations=args.iter,
+                time_ms=time_ms,
+                input=input_dist,
+                input_seed=args.input_seed,
+                seed=None if seeds is None else next(seeds),
+            )
+    else:
+        build(here, ':oprun', build_config)
+        exe = here / '../../bazel-bin/c/ops/oprun'
+
+        def oprun_args(names):
+            """Return the benchmark arguments, and the functions to run."""
+            run_args = [*bench_args, *input_args(input_dist, args.input_seed),
+                        *variant_args]
+            if '-inplace' in variant_args:
+                names = [name for name in names if name not in NOT_INPLACE]
+            if seeds is not None:
+                run_args.append('-seed={}'.format(next(seeds)))
+            return run_args, names
+
+        def stream(names, runs, size):
+            run_args, names = oprun_args(names)
+            return stream_oprun(here, exe, run_args, names, runs, size)
+
+        def measure(names, runs, size):
+            run_args, names = oprun_args(names)
+            if not names:
+                return {}
+            if not use_cache:
+                return read_out(
+                    run_oprun(here, exe, run_args, names, runs, size, out))
+            path, hit = run_oprun_cached(here, exe, run_args, names, runs,
+                                         size, out, force=args.force)
+            if hit:
+                cached.add((size, input_dist, metric))
+            return read_out(path)
+
+    pin_cpu(args.cpu)
+    # Operators whose measurements drifted, in the current collection.
+    drifted = set()
+    if args.max_drift is not None:
+        measure = check_drift(measure, args.max_drift / 100,
+                              args.discard_drifted, drifted)
+
+    def collect(size):
+        drifted.clear()
+        if args.stream:
+            if args.precision is not None:
+                runs = args.max_runs
+            else:
+                runs = DEFAULT_RUNS if args.runs is None else args.runs
+            return run_streaming(
+                stream(names, runs, size), names,
+                confidence=args.confidence,
+                precision=(None if args.precision is None
+                           else args.precision / 100),
+            )
+        if args.precision is not None:
+            return run_to_precision(
+                measure, names,
+                size=size,
+                precision=args.precision / 100,
+                confidence=args.confidence,
+                batch_runs=(DEFAULT_BATCH_RUNS if args.runs is None
+                            else args.runs),
+                max_runs=args.max_runs,
+            )
+        return measure(
+            names, DEFAULT_RUNS if args.runs is None else args.runs, size)
+
+    db = None
+    if not args.no_history:
+        db = history.connect(here / HISTORY_DB)
+    config = history_config(args)
+
+    def record(size, data):
+        if db is None or (size, input_dist, metric) in cached:
+            return
+        if args.latency:
+            metrics = {
+                opname: {'latency_' + name: times
+                         for name, times in percentiles.items()}
+                for opname, percentiles in data.items()
+            }
+        else:
+            metrics = {opname: {metric: times}
+                       for opname, times in data.items()}
+        for opname, counters in counter_data.items():
+            for counter, values in counters.items():
+                values = values[~numpy.isnan(values)]
+                if len(values):
+                    metrics[opname]['counter_' + counter] = values
+        history.record(db, here, dataclasses.replace(config, input=input_dist),
+                       size, metrics, drifted=bool(drifted))
+
     print('Running benchmarks', file=sys.stderr)
-    exe = here / '../../bazel-bin/c/ops/oprun'
+    if args.sweep:
+        sweep_data = {}
+        for size in sizes:
+            print('Size {}'.format(size), file=sys.stderr)
+            sweep_data[size] = collect(size)
+            record(size, sweep_data[size])
+        write_sweep_csv(here / 'bench_sweep.csv', sweep_data)
+        show_sweep(names, sweep_data, MEMORY_BOUND_RATIO)
+        return
 
-    proc = subprocess.run(
-        [exe, 'benchmark', *bench_args, '-out=bench_out.csv',
-         '--', *args.function],
-        cwd=here,
-        stdin=subprocess.DEVNULL,
-        stdout=subprocess.DEVNULL,
-    )
-    if proc.returncode:
-        die('Benchmark failed')
+    if len(inputs) > 1:
+        input_data = {}
+        for input_dist in inputs:
+            print('Input {}'.format(input_dist), file=sys.stderr)
+            input_data[input_dist] = collect(sizes[0])
+            record(sizes[0], input_data[input_dist])
+        write_columns_csv(here / 'bench_inputs.csv', 'Input', input_data)
+        show_columns(names, input_data, INPUT_SLOWDOWN)
+        return
 
-    out_data = read_csv(out)
-    if args.compare:
-        ref_data = read_csv(ref)
-        compare(ref_data, out_data)
+    if args.variants:
+        variant_data = {}
+        for variant, variant_args in buffer_variants().items():
+            print('Variant {}'.format(variant), file=sys.stderr)
+            metric = 'variant_' + variant
+            variant_data[variant] = collect(sizes[0])
+            record(sizes[0], variant_data[variant])
+        write_columns_csv(here / 'bench_variants.csv', 'Variant',
+                          variant_data)
+        show_columns(names, variant_data, VARIANT_SLOWDOWN)
+        return
+
+    out_data = collect(sizes[0])
+    record(sizes[0], out_data)
+    # Results are paired with a baseline if both used the same order, which
+    # needs the same seed, shuffled the same way.
+    paired = {name: seed is not None and read_seed(path) == seed
+              and read_workload(path).shuffle == workload.shuffle
+              for name, path in refs.items()}
+    if args.latency:
+        if refs:
+            (name, path), = refs.items()
+            compare_latency(read_latency_csv(path), out_data,
+                            confidence=args.confidence, paired=paired[name])
+        else:
+            show_latency(out_data)
     else:
-        show(out_data)
+        write_csv(out, out_data, seed,
+                  None if args.max_drift is None else drifted)
+        baselines = {name: read_csv(path) for name, path in refs.items()}
+        if args.format != 'text':
+            name = next(iter(baselines), None)
+            results = summarize(out_data, baselines.get(name),
+                                confidence=args.confidence,
+                                paired=paired.get(name, False),
+                                drifted=drifted)
+            write_report(args.format, results, confidence=args.confidence,
+                         paired=paired.get(name, False))
+        elif len(baselines) > 1:
+            compare_baselines(baselines, out_data,
+                              confidence=args.confidence, paired=paired)
+        elif baselines:
+            (name, refdata), = baselines.items()
+            compare(refdata, out_data, confidence=args.confidence,
+                    paired=paired[name])
+        else:
+            show(out_data)
+    if counter_data and args.format == 'text':
+        print()
+        print('Performance counters:')
+        show_counters(counter_data)
     if args.save:
-        out.replace(ref)
+        save_baseline(out, baseline_path(here, kind, args.save), workload)
+    if args.fail_on_regression is not None:
+        slower = []
+        for name, refdata in baselines.items():
+            for result in regressions(
+                    summarize(out_data, refdata, confidence=args.confidence,
+                              paired=paired[name]),
+                    args.fail_on_regression / 100):
+                slower.append('{} (vs {})'.format(result.operator, name))
+        if slower:
+            print('Regression: {} slower by more than {}%'.format(
+                ', '.join(slower), args.fail_on_regression),
+                file=sys.stderr)
+            raise SystemExit(REGRESSION_EXIT_STATUS)
 
 if __name__ == '__main__':
     main(sys.argv[1:])
@@ -0,0 +1,156 @@
+"""Tests for the statistics and workload checks in bench.py.
+
+Run from this directory with: python3 -m unittest discover -p '*_test.py'
+"""
+import argparse
+import contextlib
+import io
+import numpy
+import unittest
+
+import bench
+
+class RankTest(unittest.TestCase):
+    def test_ties(self):
+        ranks, counts = bench.rank(numpy.array([3.0, 1.0, 3.0, 2.0]))
+        numpy.testing.assert_array_equal(ranks, [3.5, 1.0, 3.5, 2.0])
+        numpy.testing.assert_array_equal(sorted(counts), [1, 1, 2])
+
+class MannWhitneyTest(unittest.TestCase):
+    def test_separated(self):
+        # U = 0, mean 12.5, variance 25 * 11 / 12, with continuity correction.
+        p = bench.mann_whitney(numpy.arange(1.0, 6.0),
+                               numpy.arange(6.0, 11.0))
+        self.assertAlmostEqual(p, 0.01219, places=4)
+
+    def test_identical(self):
+        xs = numpy.array([1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(bench.mann_whitney(xs, xs), 1.0)
+
+    def test_all_tied(self):
+        xs = numpy.ones(4)
+        self.assertEqual(bench.mann_whitney(xs, xs), 1.0)
+
+class WilcoxonTest(unittest.TestCase):
+    def test_all_positive(self):
+        # W = 55, mean 27.5, variance 10 * 11 * 21 / 24.
+        p = bench.wilcoxon(numpy.arange(1.0, 11.0))
+        self.assertAlmostEqual(p, 0.005922, places=5)
+
+    def test_zeros_dropped(self):
+        self.assertEqual(bench.wilcoxon(numpy.zeros(5)), 1.0)
+        self.assertAlmostEqual(
+            bench.wilcoxon(numpy.array([0.0, *range(1, 11)])),
+            bench.wilcoxon(numpy.arange(1.0, 11.0)))
+
+class CompareTimesTest(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.default_rng(1)
+        self.ref = 1.0 + 0.01 * rng.standard_normal(30)
+        self.noise = 0.01 * rng.standard_normal(30)
+
+    def test_slower(self):
+        cmp = bench.compare_times(self.ref, 1.2 + self.noise,
+                                  confidence=0.95)
+        self.assertEqual(cmp.verdict, 'slower')
+        self.assertGreater(cmp.ratio_low, 1)
+        self.assertLess(cmp.pvalue, 0.05)
+
+    def test_faster(self):
+        cmp = bench.compare_times(self.ref, 0.8 + self.noise,
+                                  confidence=0.95)
+        self.assertEqual(cmp.verdict, 'faster')
+        self.assertLess(cmp.ratio_high, 1)
+
+    def test_same(self):
+        cmp = bench.compare_times(self.ref, 1.0 + self.noise,
+                                  confidence=0.95)
+        self.assertEqual(cmp.verdict, 'inconclusive')
+        self.assertLess(cmp.ratio_low, 1)
+        self.assertGreater(cmp.ratio_high, 1)
+
+    def test_too_few(self):
+        cmp = bench.compare_times(numpy.array([1.0]), numpy.array([2.0]))
+        self.assertEqual(cmp.verdict, 'inconclusive')
+        self.assertEqual(cmp.ratio, 2.0)
+        self.assertIsNone(cmp.pvalue)
+
+    def test_paired(self):
+        # Runs drift together, which hides a 2% slowdown from the unpaired
+        # test, but not from the paired one.
+        drift = numpy.linspace(1.0, 1.5, 20)
+        ref = drift
+        new = 1.02 * drift * (1 + 0.001 * numpy.sin(numpy.arange(20)))
+        self.assertEqual(
+            bench.compare_times(ref, new, confidence=0.95).verdict,
+            'inconclusive')
+        cmp = bench.compare_times(ref, new, confidence=0.95, paired=True)
+        self.assertEqual(cmp.verdict, 'slower')
+        self.assertAlmostEqual(cmp.ratio, 1.02, places=2)
+
+class ComparePairedTest(unittest.TestCase):
+    def test_ratio(self):
+        ref = numpy.array([1.0, 2.0, 4.0, 8.0])
+        cmp = bench.compare_paired(ref, 1.5 * ref, confidence=0.95)
+        self.assertAlmostEqual(cmp.ratio, 1.5)
+        self.assertAlmostEqual(cmp.ratio_low, 1.5)
+        self.assertAlmostEqual(cmp.ratio_high, 1.5)
+
+class BootstrapTest(unittest.TestCase):
+    def test_contains_ratio(self):
+        rng = numpy.random.default_rng(2)
+        ref = 1.0 + 0.05 * rng.standard_normal(50)
+        new = 2.0 + 0.1 * rng.standard_normal(50)
+        lo, hi = bench.bootstrap_ratio(ref, new, confidence=0.95)
+        self.assertLess(lo, 2.0)
+        self.assertGreater(hi, 2.0)
+        self.assertEqual((lo, hi),
+                         bench.bootstrap_ratio(ref, new, confidence=0.95))
+
+class CheckWorkloadTest(unittest.TestCase):
+    def check(self, ref, workload):
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            bench.check_workload('ref', ref, workload)
+        return stderr.getvalue()
+
+    def test_same(self):
+        workload = bench.Workload('uniform', 1, 1024, 'oprun', None, 'oprun')
+        self.assertEqual(self.check(workload, workload), '')
+
+    def test_different_input(self):
+        for ref in [bench.Workload('normal', 1, 1024),
+                    bench.Workload('uniform', 2, 1024),
+                    bench.Workload('uniform', 1, 2048)]:
+            with self.assertRaises(SystemExit):
+                self.check(ref, bench.Workload('uniform', 1, 1024))
+
+    def test_unknown(self):
+        self.assertEqual(
+            self.check(bench.LEGACY_WORKLOAD,
+                       bench.Workload('linspace', 1, 1024, 'oprun')),
+            '')
+
+    def test_different_backend(self):
+        warning = self.check(
+            bench.Workload('uniform', backend='oprun'),
+            bench.Workload('uniform', backend='library', clock='thread'))
+        self.assertIn('backend library (baseline oprun)', warning)
+
+class OptionConflictsTest(unittest.TestCase):
+    def test_names(self):
+        args = argparse.Namespace(
+            function=[], compare=None, latency=False, counters=False,
+            sweep=False, matrix=False, autotune=None, scaling=False,
+            variants=False, chain=None, wave=None, sfx=False, serve=False,
+            stream=False, mode='time', precision=None, max_drift=None,
+            cpu=None, save=None, format='text', fail_on_regression=None)
+        used = bench.used_options(args, ['linspace'])
+        self.assertFalse(any(used.values()))
+        for option, _, others in bench.OPTION_CONFLICTS:
+            self.assertIn(option, used)
+            for other in others:
+                self.assertIn(other, used)
+
+if __name__ == '__main__':
+    unittest.main()
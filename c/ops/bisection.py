@@ -0,0 +1,149 @@
+"""Finding the commit which made an operator slower, with "git bisect run".
+
+Each commit is built and compared with the good commit in paired runs. Building
+and benchmarking are done by bench.py, which passes them in as functions.
+
+This is not named bisect, which would hide the standard library module of that
+name from random and statistics.
+"""
+import csv
+import dataclasses
+import json
+import numpy
+import pathlib
+import shutil
+import subprocess
+import sys
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Exit status for "git bisect run" to skip a commit, which cannot be tested,
+# and to stop bisecting.
+SKIP = 125
+ABORT = 128
+
+class BisectError(Exception):
+    pass
+
+# Build oprun in a worktree, with a build log and a Bazel output base. Returns
+# the Bazel output directory, or None if the build failed.
+Builder = Callable[[pathlib.Path, pathlib.Path, pathlib.Path],
+                   Optional[pathlib.Path]]
+
+# Benchmark the good and tested oprun in paired runs, and return the times for
+# each.
+Measure = Callable[[pathlib.Path, pathlib.Path],
+                   Tuple[numpy.ndarray, numpy.ndarray]]
+
+# Compare the good and tested times from paired runs. Returns an object with
+# ratio, ratio_low, ratio_high, and pvalue, like bench.py's Comparison.
+Compare = Callable[[numpy.ndarray, numpy.ndarray], Any]
+
+def git(repo: pathlib.Path, *args: str, check: bool = True) -> str:
+    """Run a git command and return its output."""
+    proc = subprocess.run(
+        ['git', *args],
+        cwd=repo,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+    )
+    if check and proc.returncode:
+        raise BisectError('git {} failed'.format(args[0]))
+    return proc.stdout.decode('UTF-8').strip()
+
+@dataclasses.dataclass
+class State:
+    """Settings shared by the bisect driver and each step of "git bisect run".
+    """
+    op: str
+    threshold: float
+    confidence: float
+    runs: int
+    max_runs: int
+    size: int
+    bench_args: List[str]
+    config: Dict[str, object]
+    # Directory for temporary files, with the good oprun.
+    tmp: str
+    good_exe: str
+    # File which each step appends its result to, as a line of JSON.
+    log: str
+
+def build(worktree: pathlib.Path, state: State, name: str,
+          output_base: pathlib.Path,
+          builder: Builder) -> Optional[pathlib.Path]:
+    """Build oprun in a worktree, and copy it to the temporary directory.
+
+    Returns the copy, or None if the build failed.
+    """
+    tmp = pathlib.Path(state.tmp)
+    log = tmp / 'build-{}.log'.format(name)
+    bindir = builder(worktree, log, output_base)
+    if bindir is None:
+        print('Build failed at {}, see {}'.format(name, log), file=sys.stderr)
+        return None
+    exe = tmp / 'oprun-{}'.format(name)
+    shutil.copy2(bindir / 'c/ops/oprun', exe)
+    return exe
+
+def classify(state: State, exe: pathlib.Path, measure: Measure,
+             compare: Compare) -> Tuple[str, Any]:
+    """Compare oprun against the good build, adding paired runs until the
+    result is clear.
+
+    A commit is bad if its slowdown is significantly more than half the
+    threshold, and good if it is significantly less. Otherwise it is
+    skipped, once it has max_runs runs.
+    """
+    midpoint = 1 + 0.5 * state.threshold / 100
+    good, test = numpy.zeros(0), numpy.zeros(0)
+    while True:
+        good_times, test_times = measure(pathlib.Path(state.good_exe), exe)
+        good = numpy.concatenate([good, good_times])
+        test = numpy.concatenate([test, test_times])
+        cmp = compare(good, test)
+        if (cmp.pvalue is not None and cmp.pvalue < 1 - state.confidence
+                and cmp.ratio_low > midpoint):
+            return 'bad', cmp
+        if cmp.ratio_high < midpoint:
+            return 'good', cmp
+        if len(test) >= state.max_runs:
+            return 'skip', cmp
+
+def step(state: State, output_base: pathlib.Path, builder: Builder,
+         measure: Measure, compare: Compare) -> int:
+    """Test the commit checked out by "git bisect run", and return the exit
+    status for it.
+    """
+    worktree = pathlib.Path.cwd()
+    commit = git(worktree, 'rev-parse', 'HEAD')
+    exe = build(worktree, state, commit[:12], output_base, builder)
+    if exe is None:
+        verdict, cmp = 'skip', None
+    else:
+        verdict, cmp = classify(state, exe, measure, compare)
+        exe.unlink()
+    entry = {'commit': commit, 'verdict': verdict}
+    if cmp is not None:
+        entry.update(ratio=cmp.ratio, ratio_low=cmp.ratio_low,
+                     ratio_high=cmp.ratio_high, pvalue=cmp.pvalue)
+    with open(state.log, 'a') as fp:
+        fp.write(json.dumps(entry) + '\n')
+    print('{} {:5} {}'.format(
+        commit[:12], verdict, '' if cmp is None
+        else '{:+.2f}% ({:+.2f}% .. {:+.2f}%)'.format(
+            100 * (cmp.ratio - 1), 100 * (cmp.ratio_low - 1),
+            100 * (cmp.ratio_high - 1))))
+    return {'good': 0, 'bad': 1, 'skip': SKIP}[verdict]
+
+def write_csv(path, entries: List[Dict[str, object]]):
+    with path.open('w') as fp:
+        w = csv.writer(fp)
+        w.writerow(['Commit', 'Verdict', 'Ratio', 'RatioLow', 'RatioHigh',
+                    'PValue'])
+        for entry in entries:
+            w.writerow([entry['commit'], entry['verdict'],
+                        *('{:.4f}'.format(entry[key]) if key in entry else ''
+                          for key in ['ratio', 'ratio_low', 'ratio_high']),
+                        '' if entry.get('pvalue') is None
+                        else '{:.4g}'.format(entry['pvalue'])])
@@ -0,0 +1,54 @@
+"""Tests for bisection.py."""
+import numpy
+import unittest
+
+import bench
+import bisection
+
+def make_state(max_runs: int = 40) -> bisection.State:
+    return bisection.State(
+        op='tri', threshold=10.0, confidence=0.95, runs=10,
+        max_runs=max_runs, size=1024, bench_args=[], config={}, tmp='/tmp',
+        good_exe='good', log='log')
+
+def measure_ratio(ratio: float):
+    """Return a Measure function where the tested build takes ratio times as
+    long as the good one, with noise which is shared by each pair.
+    """
+    rng = numpy.random.default_rng(0)
+    calls = []
+
+    def measure(good_exe, exe):
+        calls.append(exe)
+        good = 1.0 + 0.05 * rng.random(10)
+        test = ratio * good * (1 + 0.001 * rng.standard_normal(10))
+        return good, test
+    return measure, calls
+
+def compare(good, test):
+    return bench.compare_times(good, test, confidence=0.95, paired=True)
+
+class ClassifyTest(unittest.TestCase):
+    def classify(self, ratio, max_runs=40):
+        measure, calls = measure_ratio(ratio)
+        verdict, cmp = bisection.classify(make_state(max_runs), 'test',
+                                          measure, compare)
+        return verdict, cmp, len(calls)
+
+    def test_bad(self):
+        verdict, cmp, _ = self.classify(1.10)
+        self.assertEqual(verdict, 'bad')
+        self.assertAlmostEqual(cmp.ratio, 1.10, places=2)
+
+    def test_good(self):
+        verdict, _, _ = self.classify(1.0)
+        self.assertEqual(verdict, 'good')
+
+    def test_midpoint_skipped(self):
+        # A slowdown of exactly half the threshold is never clear.
+        verdict, _, calls = self.classify(1.05, max_runs=30)
+        self.assertEqual(verdict, 'skip')
+        self.assertEqual(calls, 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Instruction and cache miss counts from Valgrind's Cachegrind.
+
+Cachegrind simulates the CPU, so its counts are the same on every run. The
+cache configuration is given explicitly, rather than detected from the host,
+so counts are also the same on different machines.
+"""
+import pathlib
+import subprocess
+
+from typing import Dict, List
+
+# Simulated cache configuration: size, associativity, line size.
+CACHE_ARGS = [
+    '--I1=32768,8,64',
+    '--D1=32768,8,64',
+    '--LL=8388608,16,64',
+]
+
+# Metrics computed from Cachegrind events, and the events they sum.
+METRICS = {
+    'instructions': ['Ir'],
+    'l1_misses': ['I1mr', 'D1mr', 'D1mw'],
+    'll_misses': ['ILmr', 'DLmr', 'DLmw'],
+    'branch_misses': ['Bcm', 'Bim'],
+}
+
+class CachegrindError(Exception):
+    pass
+
+def run(cmd: List[str], outfile: pathlib.Path, *, cwd: pathlib.Path):
+    """Run a command under Cachegrind, writing the results to outfile."""
+    try:
+        proc = subprocess.run(
+            ['valgrind', '--tool=cachegrind', '--cache-sim=yes',
+             '--branch-sim=yes', *CACHE_ARGS,
+             '--cachegrind-out-file=' + str(outfile), *cmd],
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        raise CachegrindError('valgrind not found')
+    if proc.returncode:
+        raise CachegrindError(
+            'valgrind failed:\n' + proc.stderr.decode('UTF-8', 'replace'))
+
+def read(path: pathlib.Path) -> Dict[str, Dict[str, int]]:
+    """Read a Cachegrind output file. Returns event counts by function name.
+
+    Counts for a function are summed over all files it appears in.
+    """
+    events = None
+    funcs = {}
+    counts = None
+    with path.open() as fp:
+        for lineno, line in enumerate(fp, 1):
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            if line.startswith('events:'):
+                events = line[len('events:'):].split()
+            elif line.startswith('fn='):
+                if events is None:
+                    raise CachegrindError(
+                        '{}:{}: function before events'.format(path, lineno))
+                name = line[len('fn='):]
+                counts = funcs.get(name)
+                if counts is None:
+                    counts = funcs[name] = [0] * len(events)
+            elif line[0].isdigit():
+                if counts is None:
+                    continue
+                fields = line.split()
+                # The first field is the line number. Missing trailing
+                # counts are zero.
+                try:
+                    values = [int(x) for x in fields[1:]]
+                except ValueError:
+                    raise CachegrindError(
+                        '{}:{}: invalid counts'.format(path, lineno))
+                for i, value in enumerate(values):
+                    counts[i] += value
+            # Other lines, like "desc:", "cmd:", "fl=", and "summary:", are
+            # not needed.
+    if events is None:
+        raise CachegrindError('{}: no events'.format(path))
+    return {name: dict(zip(events, values)) for name, values in funcs.items()}
+
+def metrics(counts: Dict[str, int]) -> Dict[str, int]:
+    """Compute metrics from a function's event counts.
+
+    Metrics whose events were not collected are omitted.
+    """
+    result = {}
+    for metric, events in METRICS.items():
+        if all(event in counts for event in events):
+            result[metric] = sum(counts[event] for event in events)
+    return result
@@ -1,10 +1,23 @@
 // exp2_gen.c - Generate exp2 functions.
+#include "c/util/defs.h"
 #include "c/util/util.h"
 
 #include <errno.h>
 #include <stdlib.h>
 #include <unistd.h>
 
+// Each function is emitted twice, as the operator and its in-place version.
+static const struct signature {
+    const char *suffix;
+    const char *args;
+    const char *check;
+    const char *outs;
+} kSignatures[] = {
+    {"", "(int n, float *restrict outs, const float *restrict xs)",
+     "CHECK2(n, outs, xs)", "outs"},
+    {"_inplace", "(int n, float *xs)", "CHECK1(n, xs)", "xs"},
+};
+
 static void emit(int order, char **coeffs) {
     char fname[30];
     xsprintf(fname, sizeof(fname), "exp2_%d.c", order);
@@ -13,9 +26,6 @@ static void emit(int order, char **coeffs) {
         goto error;
     }
 
-    const char *args =
-        "(int n, float *restrict outs, const float *restrict xs)";
-
     xputs(fp, kNotice);
     xputs(fp, "#include \"c/ops/impl.h\"\n");
     xputs(fp,
@@ -24,54 +34,73 @@ static void emit(int order, char **coeffs) {
           "#if !HAVE_FUNC && USE_SSE2\n"
           "#define HAVE_FUNC 1\n"
           "#include <xmmintrin.h>\n");
-    xprintf(fp, "void ufxr_exp2_%d%s {\n", order, args);
-    xputs(fp, "    CHECK2(n, outs, xs);\n");
-    for (int i = 0; i <= order; i++) {
-        xprintf(fp, "    const __m128 c%d = _mm_set1_ps(%sf);\n", i, coeffs[i]);
-    }
-    xputs(fp,
-          "    for (int i = 0; i < n; i += 4) {\n"
-          "        __m128 x = _mm_load_ps(xs + i);\n"
-          "        __m128i ival = _mm_cvtps_epi32(x);\n"
-          "        __m128 frac = "
-          "_mm_sub_ps(x, _mm_cvtepi32_ps(ival));\n");
-    xprintf(fp, "        __m128 y = c%d;\n", order);
-    for (int i = order - 1; i >= 0; i--) {
-        xprintf(fp, "        y = _mm_add_ps(_mm_mul_ps(y, frac), c%d);\n", i);
+    for (size_t k = 0; k < ARRAY_SIZE(kSignatures); k++) {
+        const struct signature *sig = &kSignatures[k];
+        if (k > 0) {
+            xputs(fp, "\n");
+        }
+        xprintf(fp, "void ufxr_exp2_%d%s%s {\n", order, sig->suffix,
+                sig->args);
+        xprintf(fp, "    %s;\n", sig->check);
+        for (int i = 0; i <= order; i++) {
+            xprintf(fp, "    const __m128 c%d = _mm_set1_ps(%sf);\n", i,
+                    coeffs[i]);
+        }
+        xputs(fp,
+              "    for (int i = 0; i < n; i += 4) {\n"
+              "        __m128 x = _mm_load_ps(xs + i);\n"
+              "        __m128i ival = _mm_cvtps_epi32(x);\n"
+              "        __m128 frac = "
+              "_mm_sub_ps(x, _mm_cvtepi32_ps(ival));\n");
+        xprintf(fp, "        __m128 y = c%d;\n", order);
+        for (int i = order - 1; i >= 0; i--) {
+            xprintf(fp, "        y = _mm_add_ps(_mm_mul_ps(y, frac), c%d);\n",
+                    i);
+        }
+        xputs(fp,
+              "        __m128 exp2ival = _mm_castsi128_ps(_mm_add_epi32(\n"
+              "            _mm_slli_epi32(ival, 23), "
+              "_mm_set1_epi32(0x3f800000)));\n");
+        xprintf(fp,
+                "        _mm_store_ps(%s + i, _mm_mul_ps(y, exp2ival));\n"
+                "    }\n"
+                "}\n",
+                sig->outs);
     }
-    xputs(
-        fp,
-        "        __m128 exp2ival = _mm_castsi128_ps(_mm_add_epi32(\n"
-        "            _mm_slli_epi32(ival, 23), _mm_set1_epi32(0x3f800000)));\n"
-        "        _mm_store_ps(outs + i, _mm_mul_ps(y, exp2ival));\n"
-        "    }\n"
-        "}\n"
-        "#endif\n");
+    xputs(fp, "#endif\n");
 
     xputs(fp,
           "\n"
           "// Scalar version.\n"
           "#if !HAVE_FUNC\n"
           "#include <math.h>\n");
-    xprintf(fp, "void ufxr_exp2_%d%s {\n", order, args);
-    xputs(fp, "    CHECK2(n, outs, xs);\n");
-    for (int i = 0; i <= order; i++) {
-        xprintf(fp, "    const float c%d = %sf;\n", i, coeffs[i]);
-    }
-    xputs(fp,
-          "    for (int i = 0; i < n; i++) {\n"
-          "        float x = xs[i];\n"
-          "        float ival = rintf(x);\n"
-          "        float frac = x - ival;\n");
-    xprintf(fp, "        float y = c%d;\n", order);
-    for (int i = order - 1; i >= 0; i--) {
-        xprintf(fp, "        y = y * frac + c%d;\n", i);
+    for (size_t k = 0; k < ARRAY_SIZE(kSignatures); k++) {
+        const struct signature *sig = &kSignatures[k];
+        if (k > 0) {
+            xputs(fp, "\n");
+        }
+        xprintf(fp, "void ufxr_exp2_%d%s%s {\n", order, sig->suffix,
+                sig->args);
+        xprintf(fp, "    %s;\n", sig->check);
+        for (int i = 0; i <= order; i++) {
+            xprintf(fp, "    const float c%d = %sf;\n", i, coeffs[i]);
+        }
+        xputs(fp,
+              "    for (int i = 0; i < n; i++) {\n"
+              "        float x = xs[i];\n"
+              "        float ival = rintf(x);\n"
+              "        float frac = x - ival;\n");
+        xprintf(fp, "        float y = c%d;\n", order);
+        for (int i = order - 1; i >= 0; i--) {
+            xprintf(fp, "        y = y * frac + c%d;\n", i);
+        }
+        xprintf(fp,
+                "        %s[i] = scalbnf(y, (int)ival);\n"
+                "    }\n"
+                "}\n",
+                sig->outs);
     }
-    xputs(fp,
-          "        outs[i] = scalbnf(y, (int)ival);\n"
-          "    }\n"
-          "}\n"
-          "#endif\n");
+    xputs(fp, "#endif\n");
 
     int r = fclose(fp);
     if (r != 0) {
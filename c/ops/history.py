@@ -0,0 +1,204 @@
+"""Benchmark history database.
+
+Benchmark results are appended to an SQLite database, along with the commit
+they were measured at and the build configuration, so performance can be
+tracked over many commits.
+"""
+import dataclasses
+import datetime
+import json
+import numpy
+import pathlib
+import platform
+import sqlite3
+import subprocess
+
+from typing import Dict, List, Optional
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS run (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    commit_hash TEXT,
+    dirty INTEGER NOT NULL,
+    backend TEXT NOT NULL,
+    impl TEXT NOT NULL,
+    copts TEXT NOT NULL,
+    mode TEXT NOT NULL DEFAULT 'opt',
+    cpu TEXT NOT NULL,
+    size INTEGER,
+    input TEXT NOT NULL DEFAULT 'linspace',
+    drifted INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS sample (
+    run_id INTEGER NOT NULL REFERENCES run(id),
+    operator TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sample_operator ON sample (operator, metric);
+'''
+
+# Metric for throughput results, in ns/sample.
+THROUGHPUT = 'throughput'
+
+@dataclasses.dataclass
+class Config:
+    """Build and benchmark configuration which results are keyed by."""
+    backend: str
+    impl: str
+    copts: List[str]
+    # Bazel compilation mode.
+    mode: str
+    cpu: str
+    # Input distribution.
+    input: str = 'default'
+
+def git_commit(path: pathlib.Path) -> Optional[str]:
+    """Return the commit hash of HEAD, or None if not in a git repository."""
+    proc = subprocess.run(
+        ['git', 'rev-parse', 'HEAD'],
+        cwd=path,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    if proc.returncode:
+        return None
+    return proc.stdout.decode('ASCII').strip()
+
+def git_dirty(path: pathlib.Path) -> bool:
+    """Return true if tracked files in the repository have been modified."""
+    proc = subprocess.run(
+        ['git', 'status', '--porcelain', '--untracked-files=no'],
+        cwd=path,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    return proc.returncode == 0 and bool(proc.stdout.strip())
+
+def cpu_model() -> str:
+    """Return a description of the CPU model."""
+    try:
+        with open('/proc/cpuinfo') as fp:
+            for line in fp:
+                key, sep, value = line.partition(':')
+                if sep and key.strip() == 'model name':
+                    return value.strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+# Columns added to the run table after it was created, and their definitions.
+# Existing runs get the default values.
+ADDED_COLUMNS = [
+    ('mode', "TEXT NOT NULL DEFAULT 'opt'"),
+    ('input', "TEXT NOT NULL DEFAULT 'linspace'"),
+    ('drifted', 'INTEGER NOT NULL DEFAULT 0'),
+]
+
+def connect(path: pathlib.Path) -> sqlite3.Connection:
+    db = sqlite3.connect(str(path))
+    db.executescript(SCHEMA)
+    columns = [row[1] for row in db.execute('PRAGMA table_info(run)')]
+    for name, definition in ADDED_COLUMNS:
+        if name not in columns:
+            with db:
+                db.execute('ALTER TABLE run ADD COLUMN {} {}'
+                           .format(name, definition))
+    return db
+
+def record(db: sqlite3.Connection, repo: pathlib.Path, config: Config,
+           size: Optional[int], data: Dict[str, Dict[str, numpy.ndarray]], *,
+           drifted: bool = False):
+    """Append benchmark results to the database.
+
+    The data maps operator names to metrics to the values from each run.
+    Drifted is true if the CPU speed changed during the measurements.
+    """
+    timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    with db:
+        cur = db.execute(
+            'INSERT INTO run (timestamp, commit_hash, dirty, backend, impl, '
+            'copts, mode, cpu, size, input, drifted) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (timestamp, git_commit(repo), int(git_dirty(repo)),
+             config.backend, config.impl, json.dumps(config.copts),
+             config.mode, config.cpu, size, config.input, int(drifted)))
+        run_id = cur.lastrowid
+        db.executemany(
+            'INSERT INTO sample (run_id, operator, metric, value) '
+            'VALUES (?, ?, ?, ?)',
+            [(run_id, opname, metric, float(value))
+             for opname, metrics in data.items()
+             for metric, values in metrics.items()
+             for value in values])
+
+@dataclasses.dataclass
+class CommitResult:
+    commit_hash: Optional[str]
+    # True for runs with a modified working tree.
+    dirty: bool
+    # Time of the most recent run at this commit.
+    timestamp: str
+    median: float
+    count: int
+
+def commit_results(db: sqlite3.Connection, config: Config, operator: str,
+                   metric: str = THROUGHPUT,
+                   size: Optional[int] = None, *,
+                   include_drifted: bool = False) -> List[CommitResult]:
+    """Return results for an operator grouped by commit, oldest first.
+
+    Only runs with a matching configuration are included, and runs where the
+    CPU speed drifted are left out unless include_drifted is true. Runs with
+    modified working trees are grouped separately from runs at the same commit.
+    """
+    query = (
+        'SELECT run.commit_hash, run.dirty, run.timestamp, sample.value '
+        'FROM sample JOIN run ON sample.run_id = run.id '
+        'WHERE sample.operator = ? AND sample.metric = ? '
+        'AND run.backend = ? AND run.impl = ? AND run.copts = ? '
+        'AND run.mode = ? AND run.cpu = ? AND run.input = ?')
+    params = [operator, metric, config.backend, config.impl,
+              json.dumps(config.copts), config.mode, config.cpu, config.input]
+    if size is not None:
+        query += ' AND run.size = ?'
+        params.append(size)
+    if not include_drifted:
+        query += ' AND run.drifted = 0'
+    commits = {}
+    for commit_hash, dirty, timestamp, value in db.execute(query, params):
+        key = commit_hash, bool(dirty)
+        entry = commits.get(key)
+        if entry is None:
+            commits[key] = entry = [timestamp, []]
+        entry[0] = max(entry[0], timestamp)
+        entry[1].append(value)
+    results = [
+        CommitResult(commit_hash, dirty, timestamp,
+                     numpy.median(values).item(), len(values))
+        for (commit_hash, dirty), (timestamp, values) in commits.items()
+    ]
+    results.sort(key=lambda result: result.timestamp)
+    return results
+
+def short_hash(result: CommitResult) -> str:
+    """Return a short name for the commit, marking modified working trees."""
+    name = '(none)' if result.commit_hash is None else result.commit_hash[:10]
+    if result.dirty:
+        name += '+'
+    return name
+
+def show_trend(results: List[CommitResult]):
+    """Print results for each commit, with the change from the previous one."""
+    last = None
+    for result in results:
+        change = ''
+        if last is not None:
+            change = '{:+.2f}%'.format(100 * (result.median / last - 1))
+        print('{:11}  {:19}  {:8.3f}  {:5}  {}'.format(
+            short_hash(result), result.timestamp[:19],
+            result.median, result.count, change))
+        last = result.median
@@ -0,0 +1,83 @@
+"""Tests for history.py."""
+import pathlib
+import sqlite3
+import tempfile
+import unittest
+
+import history
+
+# The run table before the mode, input, and drifted columns were added.
+OLD_SCHEMA = '''
+CREATE TABLE run (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    commit_hash TEXT,
+    dirty INTEGER NOT NULL,
+    backend TEXT NOT NULL,
+    impl TEXT NOT NULL,
+    copts TEXT NOT NULL,
+    cpu TEXT NOT NULL,
+    size INTEGER
+);
+CREATE TABLE sample (
+    run_id INTEGER NOT NULL REFERENCES run(id),
+    operator TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL NOT NULL
+);
+'''
+
+CONFIG = history.Config(backend='oprun', impl='vector', copts=[],
+                        mode='opt', cpu='test', input='linspace')
+
+class CommitResultsTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = pathlib.Path(tmp.name)
+        self.path = self.dir / 'history.db'
+
+    def test_migrate(self):
+        db = sqlite3.connect(str(self.path))
+        db.executescript(OLD_SCHEMA)
+        with db:
+            db.execute(
+                "INSERT INTO run VALUES (1, '2020-01-01', 'abc', 0, 'oprun', "
+                "'vector', '[]', 'test', 1024)")
+            db.executemany(
+                "INSERT INTO sample VALUES (1, 'tri', 'throughput', ?)",
+                [(1.0,), (2.0,), (3.0,)])
+        db.close()
+        db = history.connect(self.path)
+        columns = [row[1] for row in db.execute('PRAGMA table_info(run)')]
+        for name, _ in history.ADDED_COLUMNS:
+            self.assertIn(name, columns)
+        (result,) = history.commit_results(db, CONFIG, 'tri', size=1024)
+        self.assertEqual(result.commit_hash, 'abc')
+        self.assertEqual(result.median, 2.0)
+        self.assertEqual(result.count, 3)
+        # Connecting again does not add the columns twice.
+        history.connect(self.path).close()
+
+    def test_filters(self):
+        db = history.connect(self.path)
+        history.record(db, self.dir, CONFIG, 1024,
+                       {'tri': {history.THROUGHPUT: [1.0, 3.0]}})
+        history.record(db, self.dir, CONFIG, 2048,
+                       {'tri': {history.THROUGHPUT: [10.0]}})
+        other = history.Config(**{**CONFIG.__dict__, 'input': 'uniform'})
+        history.record(db, self.dir, other, 1024,
+                       {'tri': {history.THROUGHPUT: [20.0]}})
+        history.record(db, self.dir, CONFIG, 1024,
+                       {'tri': {history.THROUGHPUT: [100.0]}}, drifted=True)
+        (result,) = history.commit_results(db, CONFIG, 'tri', size=1024)
+        self.assertEqual(result.median, 2.0)
+        self.assertEqual(result.count, 2)
+        (result,) = history.commit_results(db, CONFIG, 'tri', size=1024,
+                                           include_drifted=True)
+        self.assertEqual(result.count, 3)
+        self.assertEqual(
+            history.commit_results(db, CONFIG, 'osc', size=1024), [])
+
+if __name__ == '__main__':
+    unittest.main()
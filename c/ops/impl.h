@@ -28,6 +28,11 @@ noreturn void ufxr_check_align_fail(const void *ptr);
 #define CHECK_SIZE_(n)            \
     if ((n) & (UFXR_QUANTUM - 1)) \
     CHECK_SIZE_FAIL_(n)
+#define CHECK1(n, x1)     \
+    do {                  \
+        CHECK_SIZE_(n);   \
+        CHECK_ALIGN_(x1); \
+    } while (0)
 #define CHECK2(n, x1, x2) \
     do {                  \
         CHECK_SIZE_(n);   \
@@ -5,6 +5,7 @@
 
 #include <math.h>
 #include <stdlib.h>
+#include <string.h>
 
 // Calculate exponential function error in cents.
 static float exp2_err(int n, const float *restrict ys,
@@ -66,6 +67,8 @@ struct func_info {
     char name[8];
     // Evaluate function
     void (*func)(int n, float *restrict outs, const float *restrict xs);
+    // Evaluate function in place
+    void (*inplace)(int n, float *xs);
     // Get error for function
     float (*errf)(int n, const float *restrict ys, const float *restrict xs);
     // Maximum permitted error
@@ -73,7 +76,7 @@ struct func_info {
 };
 
 #define F(f, g, e) \
-    { #f, ufxr_##f, g, e }
+    { #f, ufxr_##f, ufxr_##f##_inplace, g, e }
 // clang-format off
 static const struct func_info kFuncs[] = {
     F(exp2_2, exp2_err, 2.9888e0),
@@ -108,6 +111,7 @@ int main(int argc, char **argv) {
 
     float *xs = xmalloc(size * sizeof(float));
     float *ys = xmalloc(size * sizeof(float));
+    float *zs = xmalloc(size * sizeof(float));
     linspace(size, xs, -5.0f, 5.0f);
 
     bool success = true;
@@ -123,10 +127,28 @@ int main(int argc, char **argv) {
         } else if (error < kFuncs[i].error * (1.0f - kErrorMargin)) {
             puts("****IMPROVED****");
         }
+        memcpy(zs, xs, size * sizeof(float));
+        kFuncs[i].inplace(size, zs);
+        if (memcmp(zs, ys, size * sizeof(float)) != 0) {
+            puts("In-place result differs");
+            puts("****FAIL****");
+            success = false;
+        }
         putc('\n', stdout);
         fflush(stdout);
     }
 
+    puts("Testing: osc in place");
+    ufxr_osc(size, ys, xs);
+    memcpy(zs, xs, size * sizeof(float));
+    ufxr_osc_inplace(size, zs);
+    if (memcmp(zs, ys, size * sizeof(float)) != 0) {
+        puts("In-place result differs");
+        puts("****FAIL****");
+        success = false;
+    }
+    putc('\n', stdout);
+
     if (!success) {
         puts("****FAIL****");
         exit(1);
@@ -1,12 +1,29 @@
+#include "c/convert/convert.h"
+#include "c/io/error.h"
+#include "c/io/wave.h"
 #include "c/ops/ops.h"
 #include "c/util/defs.h"
 #include "c/util/flag.h"
 #include "c/util/util.h"
 
 #include <errno.h>
+#include <fcntl.h>
+#include <limits.h>
+#include <math.h>
+#include <pthread.h>
+#include <stdarg.h>
+#include <stdint.h>
 #include <stdlib.h>
 #include <string.h>
 #include <time.h>
+#include <unistd.h>
+
+#if __linux__
+#include <linux/perf_event.h>
+#include <sys/ioctl.h>
+#include <sys/syscall.h>
+#define HAVE_PERF_EVENT 1
+#endif
 
 #define EXE_NAME "oprun"
 
@@ -14,49 +31,252 @@ enum {
     kBenchmarkSize = 1 << 15,
     kBenchmarkIter = 1 << 15,
     kBenchmarkRuns = 1,
+    // When calibrating, initial runs must take at least this fraction of the
+    // target time before the iteration count is extrapolated.
+    kCalibrateDivisor = 16,
+};
+
+// Latency histogram. Values below 2*kHistSub each have their own bucket, and
+// each octave above that is divided into kHistSub buckets, so the resolution
+// is about 3%.
+enum {
+    kHistSubBits = 5,
+    kHistSub = 1 << kHistSubBits,
+    kHistBuckets = 64 * kHistSub,
+    // Number of clock reads used to measure the clock's overhead.
+    kClockOverheadSamples = 1 << 12,
+};
+
+struct histogram {
+    unsigned long long count[kHistBuckets];
+    unsigned long long total;
+    unsigned long long max;
 };
 
 typedef void (*func)(int n, float *restrict outs, const float *restrict xs);
+typedef void (*inplace_func)(int n, float *xs);
+
+// Input distributions.
+enum {
+    // Use each function's own default.
+    kInputDefault,
+    // Evenly spaced from -5 to 5.
+    kInputLinspace,
+    // Uniform from -0.5 to 0.5, like oscillator phase.
+    kInputUniform,
+    // Standard normal, like note offsets in octaves.
+    kInputNormal,
+    // Frequencies from 20 Hz to 20 kHz at 48 kHz, in cycles per sample, with
+    // a uniform distribution of pitch.
+    kInputAudioFreq,
+    // Subnormal numbers, with random signs.
+    kInputDenormal,
+    // Magnitudes from 2^20 to 2^100, with random signs.
+    kInputHuge,
+    kInputCount,
+};
+
+static const char *const kInputNames[kInputCount] = {
+    "default",    "linspace", "uniform", "normal",
+    "audio-freq", "denormal", "huge",
+};
 
 struct func_info {
-    char name[8];
+    char name[12];
     func func;
+    // In-place version, or NULL if there is none.
+    inplace_func inplace;
+    // Default input distribution.
+    int input;
+    // Size of each output sample in bytes, for conversions to other sample
+    // formats, or 0 if the output is float.
+    int out_size;
 };
 
 static void ufxr_memcpy(int n, float *restrict outs, const float *restrict xs) {
     memcpy(outs, xs, n * sizeof(float));
 }
 
-#define F(f) \
-    { #f, ufxr_##f }
+// Sample format conversions, which write their output to a float buffer. The
+// buffer is large enough for any format.
+#define CONVERT(f)                                         \
+    static void ufxr_##f##_op(int n, float *restrict outs, \
+                              const float *restrict xs) {  \
+        ufxr_##f(n, outs, xs);                             \
+    }
+CONVERT(to_u8)
+CONVERT(to_les16)
+CONVERT(to_les24)
+CONVERT(to_lef32)
+#undef CONVERT
+
+#define F(f, input) \
+    { #f, ufxr_##f, ufxr_##f##_inplace, input, 0 }
+#define C(f, size) \
+    { #f, ufxr_##f##_op, NULL, kInputUniform, size }
 // clang-format off
 static const struct func_info kFuncs[] = {
-    F(exp2_2),
-    F(exp2_3),
-    F(exp2_4),
-    F(exp2_5),
-    F(exp2_6),
-    F(osc),
-    F(sin1_2),
-    F(sin1_3),
-    F(sin1_4),
-    F(sin1_5),
-    F(sin1_6),
-    F(tri),
-    F(memcpy),
+    F(exp2_2, kInputNormal),
+    F(exp2_3, kInputNormal),
+    F(exp2_4, kInputNormal),
+    F(exp2_5, kInputNormal),
+    F(exp2_6, kInputNormal),
+    F(osc, kInputAudioFreq),
+    F(sin1_2, kInputUniform),
+    F(sin1_3, kInputUniform),
+    F(sin1_4, kInputUniform),
+    F(sin1_5, kInputUniform),
+    F(sin1_6, kInputUniform),
+    F(tri, kInputUniform),
+    {"memcpy", ufxr_memcpy, NULL, kInputLinspace, 0},
+    C(to_u8, 1),
+    C(to_les16, 2),
+    C(to_les24, 3),
+    C(to_lef32, 4),
 };
 // clang-format on
 #undef F
+#undef C
 
-static const struct func_info *find_func(const char *name) {
+// Return the function with the given name, or NULL if there is none.
+static const struct func_info *lookup_func(const char *name) {
     for (size_t i = 0; i < ARRAY_SIZE(kFuncs); i++) {
         if (strcmp(name, kFuncs[i].name) == 0) {
             return &kFuncs[i];
         }
     }
-    die_usagef("unknown function %s", quote_str(name));
+    return NULL;
+}
+
+static const struct func_info *find_func(const char *name) {
+    const struct func_info *finfo = lookup_func(name);
+    if (finfo == NULL) {
+        die_usagef("unknown function %s", quote_str(name));
+    }
+    return finfo;
+}
+
+// Hardware performance counters.
+enum {
+    kCounterCycles,
+    kCounterInstructions,
+    kCounterCacheMisses,
+    kCounterBranchMisses,
+    kCounterRaw,
+    kCounterCount,
+};
+
+static const char *const kCounterNames[kCounterCount] = {
+    "Cycles", "Instructions", "CacheMisses", "BranchMisses", "Raw",
+};
+
+// Open performance counters. Each is -1 if unavailable.
+struct counters {
+    int fd[kCounterCount];
+};
+
+#if HAVE_PERF_EVENT
+
+static int counter_open(uint32_t type, uint64_t config) {
+    struct perf_event_attr attr;
+    memset(&attr, 0, sizeof(attr));
+    attr.size = sizeof(attr);
+    attr.type = type;
+    attr.config = config;
+    attr.disabled = 1;
+    attr.exclude_kernel = 1;
+    attr.exclude_hv = 1;
+    attr.read_format =
+        PERF_FORMAT_TOTAL_TIME_ENABLED | PERF_FORMAT_TOTAL_TIME_RUNNING;
+    return (int)syscall(SYS_perf_event_open, &attr, 0, -1, -1, 0);
+}
+
+// Open the counters. The raw event is model-specific, and is not used if it
+// is zero.
+static void counters_open(struct counters *restrict c, uint64_t raw_event) {
+    static const uint64_t kHardware[] = {
+        [kCounterCycles] = PERF_COUNT_HW_CPU_CYCLES,
+        [kCounterInstructions] = PERF_COUNT_HW_INSTRUCTIONS,
+        [kCounterCacheMisses] = PERF_COUNT_HW_CACHE_MISSES,
+        [kCounterBranchMisses] = PERF_COUNT_HW_BRANCH_MISSES,
+    };
+    bool any = false;
+    for (int i = 0; i < kCounterCount; i++) {
+        if (i == kCounterRaw) {
+            c->fd[i] = raw_event != 0 ? counter_open(PERF_TYPE_RAW, raw_event)
+                                      : -1;
+        } else {
+            c->fd[i] = counter_open(PERF_TYPE_HARDWARE, kHardware[i]);
+        }
+        if (c->fd[i] >= 0) {
+            any = true;
+        } else if (i != kCounterRaw || raw_event != 0) {
+            fprintf(stderr, "Warning: counter %s unavailable: %s\n",
+                    kCounterNames[i], strerror(errno));
+        }
+    }
+    if (!any) {
+        fputs("Warning: no performance counters available\n", stderr);
+    }
+}
+
+static void counters_start(struct counters *restrict c) {
+    for (int i = 0; i < kCounterCount; i++) {
+        if (c->fd[i] >= 0) {
+            ioctl(c->fd[i], PERF_EVENT_IOC_RESET, 0);
+            ioctl(c->fd[i], PERF_EVENT_IOC_ENABLE, 0);
+        }
+    }
+}
+
+// Stop the counters and get their values, scaled if the kernel multiplexed
+// them. Unavailable values are NaN.
+static void counters_stop(struct counters *restrict c,
+                          double values[kCounterCount]) {
+    for (int i = 0; i < kCounterCount; i++) {
+        if (c->fd[i] >= 0) {
+            ioctl(c->fd[i], PERF_EVENT_IOC_DISABLE, 0);
+        }
+    }
+    for (int i = 0; i < kCounterCount; i++) {
+        values[i] = NAN;
+        // Value, time enabled, time running.
+        uint64_t data[3];
+        if (c->fd[i] >= 0 && read(c->fd[i], data, sizeof(data)) ==
+                                 (ssize_t)sizeof(data)) {
+            if (data[2] > 0) {
+                values[i] = (double)data[0] * (double)data[1] /
+                            (double)data[2];
+            }
+        }
+    }
 }
 
+#else
+
+static void counters_open(struct counters *restrict c, uint64_t raw_event) {
+    (void)raw_event;
+    for (int i = 0; i < kCounterCount; i++) {
+        c->fd[i] = -1;
+    }
+    fputs("Warning: performance counters not supported on this platform\n",
+          stderr);
+}
+
+static void counters_start(struct counters *restrict c) {
+    (void)c;
+}
+
+static void counters_stop(struct counters *restrict c,
+                          double values[kCounterCount]) {
+    (void)c;
+    for (int i = 0; i < kCounterCount; i++) {
+        values[i] = NAN;
+    }
+}
+
+#endif
+
 static void help_benchmark(const char *name) {
     xprintf(stdout, "\nUsage: %s [<pattern>] [<option>...]\n", name);
     xputs(stdout,
@@ -65,30 +285,420 @@ static void help_benchmark(const char *name) {
           "  -size <size>   Size of input array\n"
           "  -iter <count>  Number of function iterations per run\n"
           "  -runs <count>  Number of benchmark runs\n"
+          "  -time <ms>     Choose iteration count for each function so each\n"
+          "                 run takes about <ms> milliseconds\n"
+          "  -latency       Time each call and report latency percentiles,\n"
+          "                 in ns per call, less the median overhead of\n"
+          "                 reading the clock\n"
+          "  -seed <seed>   Shuffle the order of functions in each run, using\n"
+          "                 the given nonzero random seed\n"
+          "  -input <dist>  Input distribution: default, linspace, uniform,\n"
+          "                 normal, audio-freq, denormal, or huge, default\n"
+          "                 depends on the function\n"
+          "  -input-seed <seed>\n"
+          "                 Random seed for the input\n"
+          "  -align <bytes> Align buffers to exactly <bytes>, a power of two\n"
+          "  -inplace       Use the in-place version of each function,\n"
+          "                 applied repeatedly to one copy of the input\n"
+          "  -threads <n>   Run each function on <n> threads at once, each\n"
+          "                 with its own buffers, and report wall clock time\n"
+          "                 in ns per sample per thread\n"
+          "  -counters      Measure hardware performance counters, per sample\n"
+          "  -raw-event <event>\n"
+          "                 Also measure a model-specific raw counter event,\n"
+          "                 such as 0x08c7 for retired 128-bit packed float\n"
+          "                 instructions on recent Intel CPUs\n"
           "  -out <file>    Write results as CSV to <file>\n");
 }
 
+// Allocate a buffer. If align is nonzero, the buffer is aligned to exactly
+// align bytes, and not to any larger power of two.
+static float *alloc_buffer(int size, int align) {
+    if (align == 0) {
+        return xmalloc(sizeof(float) * size);
+    }
+    void *ptr;
+    if (posix_memalign(&ptr, 2 * (size_t)align,
+                       sizeof(float) * size + align) != 0) {
+        die_nomem();
+    }
+    return (float *)((char *)ptr + align);
+}
+
+// Time the in-place version of a function, in ns. The input is copied to buf
+// once, before the timed region, and each call after the first takes the
+// previous call's output as its input. The exp2 functions overflow to
+// infinity after a few calls, which does not change the time of their SSE
+// versions.
+static double benchmark_inplace(int size, int iter, inplace_func f,
+                                const float *xs, float *buf) {
+    memcpy(buf, xs, sizeof(float) * size);
+    f(size, buf); // Warm cache.
+    struct timespec t0, t1;
+    clock_gettime(CLOCK_THREAD_CPUTIME_ID, &t0);
+    for (int i = 0; i < iter; i++) {
+        f(size, buf);
+    }
+    clock_gettime(CLOCK_THREAD_CPUTIME_ID, &t1);
+    return 1e9 * (t1.tv_sec - t0.tv_sec) + (t1.tv_nsec - t0.tv_nsec);
+}
+
+// Time the function, in ns. If counters is not NULL, also measure the
+// performance counters over the same region.
 static double benchmark(int size, int iter, func f, const float *xs,
-                        float *ys) {
+                        float *ys, struct counters *restrict counters,
+                        double counter_values[kCounterCount]) {
     f(size, ys, xs); // Warm cache.
     struct timespec t0, t1;
+    if (counters != NULL) {
+        counters_start(counters);
+    }
     clock_gettime(CLOCK_THREAD_CPUTIME_ID, &t0);
     for (int i = 0; i < iter; i++) {
         f(size, ys, xs);
     }
     clock_gettime(CLOCK_THREAD_CPUTIME_ID, &t1);
+    if (counters != NULL) {
+        counters_stop(counters, counter_values);
+    }
+    return 1e9 * (t1.tv_sec - t0.tv_sec) + (t1.tv_nsec - t0.tv_nsec);
+}
+
+static int hist_bucket(unsigned long long value) {
+    if (value < kHistSub) {
+        return (int)value;
+    }
+    int exp = 63 - __builtin_clzll(value) - kHistSubBits;
+    return (exp << kHistSubBits) + (int)(value >> exp);
+}
+
+// Return the largest value which falls in the given bucket.
+static unsigned long long hist_bucket_max(int bucket) {
+    int exp = (bucket >> kHistSubBits) - 1;
+    if (exp < 0) {
+        return (unsigned long long)bucket;
+    }
+    unsigned long long sub = bucket - (exp << kHistSubBits);
+    return ((sub + 1) << exp) - 1;
+}
+
+static void hist_add(struct histogram *restrict h, unsigned long long value) {
+    h->count[hist_bucket(value)]++;
+    h->total++;
+    if (value > h->max) {
+        h->max = value;
+    }
+}
+
+// Return an upper bound for the given percentile of the values.
+static unsigned long long hist_percentile(const struct histogram *restrict h,
+                                          double percentile) {
+    unsigned long long target =
+        (unsigned long long)ceil((double)h->total * percentile * 0.01);
+    if (target < 1) {
+        target = 1;
+    }
+    unsigned long long sum = 0;
+    for (int i = 0; i < kHistBuckets; i++) {
+        sum += h->count[i];
+        if (sum >= target) {
+            unsigned long long value = hist_bucket_max(i);
+            return value < h->max ? value : h->max;
+        }
+    }
+    return h->max;
+}
+
+static double elapsed_ns(const struct timespec *t0,
+                         const struct timespec *t1) {
+    return 1e9 * (t1->tv_sec - t0->tv_sec) + (t1->tv_nsec - t0->tv_nsec);
+}
+
+// Return the overhead of timing a call with the monotonic clock, in ns. This
+// is the median time between two consecutive reads of the clock.
+static unsigned long long clock_overhead(struct histogram *restrict h) {
+    memset(h, 0, sizeof(*h));
+    struct timespec t0, t1;
+    for (int i = 0; i < kClockOverheadSamples; i++) {
+        clock_gettime(CLOCK_MONOTONIC, &t0);
+        clock_gettime(CLOCK_MONOTONIC, &t1);
+        long long ns = (long long)elapsed_ns(&t0, &t1);
+        hist_add(h, ns > 0 ? (unsigned long long)ns : 0);
+    }
+    return hist_percentile(h, 50.0);
+}
+
+// Time each function call separately, and record the durations, in ns. The
+// clock overhead is subtracted from each duration.
+static void latency(int size, int iter, func f, const float *xs, float *ys,
+                    unsigned long long overhead,
+                    struct histogram *restrict h) {
+    f(size, ys, xs); // Warm cache.
+    memset(h, 0, sizeof(*h));
+    struct timespec t0, t1;
+    for (int i = 0; i < iter; i++) {
+        clock_gettime(CLOCK_MONOTONIC, &t0);
+        f(size, ys, xs);
+        clock_gettime(CLOCK_MONOTONIC, &t1);
+        long long ns = (long long)elapsed_ns(&t0, &t1) - (long long)overhead;
+        hist_add(h, ns > 0 ? (unsigned long long)ns : 0);
+    }
+}
+
+// Gate which holds threads until all of them are ready to start.
+struct gate {
+    pthread_mutex_t mutex;
+    pthread_cond_t cond;
+    int ready;
+    bool open;
+};
+
+// A thread running a function on its own buffers.
+struct worker {
+    pthread_t thread;
+    struct gate *gate;
+    func f;
+    int size;
+    int iter;
+    float *xs;
+    float *ys;
+};
+
+static void *worker_main(void *arg) {
+    struct worker *w = arg;
+    w->f(w->size, w->ys, w->xs); // Warm cache.
+    struct gate *g = w->gate;
+    pthread_mutex_lock(&g->mutex);
+    g->ready++;
+    pthread_cond_broadcast(&g->cond);
+    while (!g->open) {
+        pthread_cond_wait(&g->cond, &g->mutex);
+    }
+    pthread_mutex_unlock(&g->mutex);
+    for (int i = 0; i < w->iter; i++) {
+        w->f(w->size, w->ys, w->xs);
+    }
+    return NULL;
+}
+
+// Run the function on each worker's buffers concurrently, with a copy of the
+// input xs, and return the wall clock time from when all workers are ready
+// until they have all finished, in ns.
+static double parallel_benchmark(int size, int iter, func f, const float *xs,
+                                 int nthreads, struct worker *workers) {
+    struct gate g = {.ready = 0, .open = false};
+    pthread_mutex_init(&g.mutex, NULL);
+    pthread_cond_init(&g.cond, NULL);
+    for (int i = 0; i < nthreads; i++) {
+        struct worker *w = &workers[i];
+        w->gate = &g;
+        w->f = f;
+        w->size = size;
+        w->iter = iter;
+        memcpy(w->xs, xs, sizeof(float) * size);
+        int r = pthread_create(&w->thread, NULL, worker_main, w);
+        if (r != 0) {
+            dief(r, "could not create thread");
+        }
+    }
+    struct timespec t0, t1;
+    pthread_mutex_lock(&g.mutex);
+    while (g.ready < nthreads) {
+        pthread_cond_wait(&g.cond, &g.mutex);
+    }
+    g.open = true;
+    clock_gettime(CLOCK_MONOTONIC, &t0);
+    pthread_cond_broadcast(&g.cond);
+    pthread_mutex_unlock(&g.mutex);
+    for (int i = 0; i < nthreads; i++) {
+        pthread_join(workers[i].thread, NULL);
+    }
+    clock_gettime(CLOCK_MONOTONIC, &t1);
+    pthread_cond_destroy(&g.cond);
+    pthread_mutex_destroy(&g.mutex);
     return 1e9 * (t1.tv_sec - t0.tv_sec) + (t1.tv_nsec - t0.tv_nsec);
 }
 
+// SplitMix64 random number generator.
+static uint64_t rand_next(uint64_t *state) {
+    uint64_t z = (*state += 0x9e3779b97f4a7c15);
+    z = (z ^ (z >> 30)) * 0xbf58476d1ce4e5b9;
+    z = (z ^ (z >> 27)) * 0x94d049bb133111eb;
+    return z ^ (z >> 31);
+}
+
+// Return a random number in [0, 1).
+static float rand_float(uint64_t *state) {
+    return (float)(rand_next(state) >> 40) * 0x1p-24f;
+}
+
+// Return the input distribution with the given name, or -1 if there is none.
+static int lookup_input(const char *name) {
+    for (int i = 0; i < kInputCount; i++) {
+        if (strcmp(name, kInputNames[i]) == 0) {
+            return i;
+        }
+    }
+    return -1;
+}
+
+static int find_input(const char *name) {
+    int input = lookup_input(name);
+    if (input < 0) {
+        die_usagef("unknown input distribution %s", quote_str(name));
+    }
+    return input;
+}
+
+// Fill an array with values from an input distribution.
+static void fill_input(int n, float *restrict xs, int input, uint64_t seed) {
+    uint64_t state = seed;
+    switch (input) {
+    case kInputLinspace:
+        linspace(n, xs, -5.0f, 5.0f);
+        break;
+    case kInputUniform:
+        for (int i = 0; i < n; i++) {
+            xs[i] = rand_float(&state) - 0.5f;
+        }
+        break;
+    case kInputNormal:
+        // Box-Muller transform.
+        for (int i = 0; i < n; i += 2) {
+            double r = sqrt(-2.0 * log(1.0 - (double)rand_float(&state)));
+            double a = 6.283185307179586 * (double)rand_float(&state);
+            xs[i] = (float)(r * cos(a));
+            if (i + 1 < n) {
+                xs[i + 1] = (float)(r * sin(a));
+            }
+        }
+        break;
+    case kInputAudioFreq:
+        for (int i = 0; i < n; i++) {
+            xs[i] = 20.0f * powf(1000.0f, rand_float(&state)) / 48000.0f;
+        }
+        break;
+    case kInputDenormal:
+        for (int i = 0; i < n; i++) {
+            uint64_t r = rand_next(&state);
+            // Sign and nonzero mantissa, with a zero exponent.
+            uint32_t bits = ((uint32_t)r & 0x807fffffu) | 1u;
+            memcpy(&xs[i], &bits, sizeof(bits));
+        }
+        break;
+    case kInputHuge:
+        for (int i = 0; i < n; i++) {
+            uint64_t r = rand_next(&state);
+            float x = ldexpf(1.0f + rand_float(&state), 20 + (int)(r % 81));
+            xs[i] = (r >> 32) & 1 ? -x : x;
+        }
+        break;
+    default:
+        dief(0, "invalid input %d", input);
+    }
+}
+
+// Shuffle an array of indexes.
+static void shuffle(int n, int *restrict order, uint64_t *state) {
+    for (int i = n - 1; i > 0; i--) {
+        int j = (int)(rand_next(state) % (uint64_t)(i + 1));
+        int t = order[i];
+        order[i] = order[j];
+        order[j] = t;
+    }
+}
+
+// Find the number of iterations for a run to take about target_ns, where
+// time(ctx, iter) returns the time for iter iterations in ns.
+static int calibrate(double target_ns, double (*time)(void *ctx, int iter),
+                     void *ctx) {
+    int iter = 1;
+    for (;;) {
+        double t = time(ctx, iter);
+        if (t * kCalibrateDivisor >= target_ns || iter > INT_MAX / 2) {
+            double n = t > 0.0 ? (double)iter * target_ns / t : (double)iter;
+            if (n < 1.0) {
+                return 1;
+            }
+            if (n > (double)INT_MAX) {
+                return INT_MAX;
+            }
+            return (int)n;
+        }
+        iter *= 2;
+    }
+}
+
+// Arguments for timing a single function.
+struct single {
+    int size;
+    func f;
+    const float *xs;
+    float *ys;
+};
+
+static double time_single(void *ctx, int iter) {
+    const struct single *c = ctx;
+    return benchmark(c->size, iter, c->f, c->xs, c->ys, NULL, NULL);
+}
+
+// Arguments for timing a function on several threads.
+struct parallel {
+    int size;
+    func f;
+    const float *xs;
+    int nthreads;
+    struct worker *workers;
+};
+
+static double time_parallel(void *ctx, int iter) {
+    const struct parallel *c = ctx;
+    return parallel_benchmark(c->size, iter, c->f, c->xs, c->nthreads,
+                              c->workers);
+}
+
+// Arguments for timing an in-place function.
+struct single_inplace {
+    int size;
+    inplace_func f;
+    const float *xs;
+    float *buf;
+};
+
+static double time_inplace(void *ctx, int iter) {
+    const struct single_inplace *c = ctx;
+    return benchmark_inplace(c->size, iter, c->f, c->xs, c->buf);
+}
+
 static int exec_benchmark(int argc, char **argv) {
     // Parse flags
     int size = kBenchmarkSize;
     int iter = kBenchmarkIter;
     int runs = kBenchmarkRuns;
+    float time_ms = 0.0f;
+    bool use_latency = false;
+    int seed = 0;
+    int nthreads = 0;
+    int align = 0;
+    bool inplace = false;
+    const char *input_name = kInputNames[kInputDefault];
+    int input_seed = 1;
+    bool use_counters = false;
+    const char *raw_event_str = NULL;
     const char *outfile = NULL;
     flag_int(&size, "size", "array size");
     flag_int(&iter, "iter", "iteration count");
     flag_int(&runs, "runs", "number of runs");
+    flag_float(&time_ms, "time", "target run time in milliseconds");
+    flag_bool(&use_latency, "latency", "report latency percentiles");
+    flag_int(&seed, "seed", "random seed for function order");
+    flag_int(&nthreads, "threads", "number of threads");
+    flag_int(&align, "align", "buffer alignment in bytes");
+    flag_bool(&inplace, "inplace", "use in-place functions");
+    flag_string(&input_name, "input", "input distribution");
+    flag_int(&input_seed, "input-seed", "random seed for input");
+    flag_bool(&use_counters, "counters", "measure performance counters");
+    flag_string(&raw_event_str, "raw-event", "raw performance counter event");
     flag_string(&outfile, "out", "output file");
     argc = flag_parse(argc, argv);
     bool funcs[ARRAY_SIZE(kFuncs)]; // Which functions to benchmark.
@@ -147,19 +757,104 @@ static int exec_benchmark(int argc, char **argv) {
     if (runs < 1) {
         die_usage("run count must be positive");
     }
+    if (seed < 0) {
+        die_usage("seed must not be negative");
+    }
+    uint64_t raw_event = 0;
+    if (raw_event_str != NULL) {
+        char *end;
+        errno = 0;
+        raw_event = strtoull(raw_event_str, &end, 0);
+        if (*raw_event_str == '\0' || *end != '\0' || errno != 0 ||
+            raw_event == 0) {
+            die_usagef("invalid raw event %s", quote_str(raw_event_str));
+        }
+        use_counters = true;
+    }
+    if (use_counters && use_latency) {
+        die_usage("-counters cannot be used with -latency");
+    }
+    if (nthreads < 0) {
+        die_usage("threads must not be negative");
+    }
+    if (nthreads > 0 && (use_latency || use_counters)) {
+        die_usage("-threads cannot be used with -latency or -counters");
+    }
+    if (time_ms < 0.0f) {
+        die_usage("time must not be negative");
+    }
+    int input = find_input(input_name);
+    if (align != 0 && (align < UFXR_ALIGN || (align & (align - 1)) != 0 ||
+                       align > (1 << 20))) {
+        die_usagef("invalid alignment %d, must be a power of two from %d to %d",
+                   align, UFXR_ALIGN, 1 << 20);
+    }
+    if (inplace && (use_latency || use_counters || nthreads > 0)) {
+        die_usage(
+            "-inplace cannot be used with -latency, -counters, or -threads");
+    }
+    if (inplace) {
+        for (size_t func = 0; func < ARRAY_SIZE(kFuncs); func++) {
+            if (funcs[func] && kFuncs[func].inplace == NULL) {
+                die_usagef("function %s has no in-place version",
+                           quote_str(kFuncs[func].name));
+            }
+        }
+    }
 
     // Execute
     int func_count = 0;
+    int order[ARRAY_SIZE(kFuncs)]; // Order to run functions in.
     for (size_t func = 0; func < ARRAY_SIZE(kFuncs); func++) {
         if (funcs[func]) {
-            func_count++;
+            order[func_count++] = func;
         }
     }
+    uint64_t rand_state = (uint64_t)(unsigned)seed;
     int cur_bench = 0, bench_count = runs * func_count;
-    float *xs = xmalloc(sizeof(float) * size);
-    float *ys = xmalloc(sizeof(float) * size);
-    double samples = (double)iter * (double)size;
-    linspace(size, xs, -5.0f, 5.0f);
+    // Input for each distribution, and for each function.
+    float *inputs[kInputCount] = {NULL};
+    const float *func_xs[ARRAY_SIZE(kFuncs)] = {NULL};
+    for (size_t func = 0; func < ARRAY_SIZE(kFuncs); func++) {
+        if (funcs[func]) {
+            int in = input == kInputDefault ? kFuncs[func].input : input;
+            if (inputs[in] == NULL) {
+                inputs[in] = alloc_buffer(size, align);
+                fill_input(size, inputs[in], in, (uint64_t)input_seed);
+            }
+            func_xs[func] = inputs[in];
+        }
+    }
+    float *ys = alloc_buffer(size, align);
+    struct worker *workers = NULL;
+    if (nthreads > 0) {
+        workers = xmalloc(sizeof(*workers) * nthreads);
+        for (int i = 0; i < nthreads; i++) {
+            workers[i].xs = alloc_buffer(size, align);
+            workers[i].ys = alloc_buffer(size, align);
+        }
+    }
+    int iters[ARRAY_SIZE(kFuncs)]; // Iteration count for each function.
+    for (size_t func = 0; func < ARRAY_SIZE(kFuncs); func++) {
+        iters[func] = iter;
+        if (!funcs[func] || time_ms <= 0.0f) {
+            continue;
+        }
+        // Calibrate with the same variant that is measured.
+        double target_ns = 1e6 * (double)time_ms;
+        if (inplace) {
+            struct single_inplace c = {size, kFuncs[func].inplace,
+                                       func_xs[func], ys};
+            iters[func] = calibrate(target_ns, time_inplace, &c);
+        } else if (nthreads > 0) {
+            struct parallel c = {size, kFuncs[func].func, func_xs[func],
+                                 nthreads, workers};
+            iters[func] = calibrate(target_ns, time_parallel, &c);
+        } else {
+            struct single c = {size, kFuncs[func].func, func_xs[func], ys};
+            iters[func] = calibrate(target_ns, time_single, &c);
+        }
+    }
     FILE *fp;
     if (outfile == NULL) {
         fp = stdout;
@@ -170,19 +865,74 @@ static int exec_benchmark(int argc, char **argv) {
             dief(ecode, "could not open %s", quote_str(outfile));
         }
     }
-    xputs(fp, "Operator,TimeNS\n");
+    struct histogram *hist = NULL;
+    unsigned long long overhead = 0;
+    if (use_latency) {
+        hist = xmalloc(sizeof(*hist));
+        overhead = clock_overhead(hist);
+        xputs(fp, "Operator,P50NS,P99NS,P999NS,MaxNS");
+    } else {
+        xputs(fp, "Operator,TimeNS");
+    }
+    struct counters counters;
+    if (use_counters) {
+        counters_open(&counters, raw_event);
+        for (int i = 0; i < kCounterCount; i++) {
+            xprintf(fp, ",%s", kCounterNames[i]);
+        }
+    }
+    xputs(fp, seed != 0 ? ",Seed\n" : "\n");
     for (int run = 0; run < runs; run++) {
-        for (size_t func = 0; func < ARRAY_SIZE(kFuncs); func++) {
-            if (funcs[func]) {
-                cur_bench++;
-                if (outfile != NULL) {
-                    fprintf(stderr, "\r\x1b[KBenchmark %3d/%3d %s", cur_bench,
-                            bench_count, kFuncs[func].name);
-                    fflush(stderr);
+        if (seed != 0) {
+            shuffle(func_count, order, &rand_state);
+        }
+        for (int i = 0; i < func_count; i++) {
+            int func = order[i];
+            cur_bench++;
+            if (outfile != NULL) {
+                fprintf(stderr, "\r\x1b[KBenchmark %3d/%3d %s", cur_bench,
+                        bench_count, kFuncs[func].name);
+                fflush(stderr);
+            }
+            if (use_latency) {
+                latency(size, iters[func], kFuncs[func].func, func_xs[func],
+                        ys, overhead, hist);
+                xprintf(fp, "%s,%llu,%llu,%llu,%llu", kFuncs[func].name,
+                        hist_percentile(hist, 50.0),
+                        hist_percentile(hist, 99.0),
+                        hist_percentile(hist, 99.9), hist->max);
+            } else if (inplace) {
+                double t = benchmark_inplace(size, iters[func],
+                                             kFuncs[func].inplace,
+                                             func_xs[func], ys);
+                double samples = (double)iters[func] * (double)size;
+                xprintf(fp, "%s,%.3f", kFuncs[func].name, t / samples);
+            } else if (nthreads > 0) {
+                double t = parallel_benchmark(size, iters[func],
+                                              kFuncs[func].func, func_xs[func],
+                                              nthreads, workers);
+                double samples = (double)iters[func] * (double)size;
+                xprintf(fp, "%s,%.3f", kFuncs[func].name, t / samples);
+            } else {
+                double values[kCounterCount];
+                double t = benchmark(size, iters[func], kFuncs[func].func,
+                                     func_xs[func], ys,
+                                     use_counters ? &counters : NULL, values);
+                double samples = (double)iters[func] * (double)size;
+                xprintf(fp, "%s,%.3f", kFuncs[func].name, t / samples);
+                if (use_counters) {
+                    for (int i = 0; i < kCounterCount; i++) {
+                        xprintf(fp, ",%.4f", values[i] / samples);
+                    }
                 }
-                double t = benchmark(size, iter, kFuncs[func].func, xs, ys);
-                xprintf(fp, "%s,%.3f\n", kFuncs[func].name, t / samples);
             }
+            if (seed != 0) {
+                xprintf(fp, ",%d\n", seed);
+            } else {
+                xputs(fp, "\n");
+            }
+            // Results can be read from a pipe as they are measured.
+            fflush(fp);
         }
     }
     if (outfile != NULL) {
@@ -196,6 +946,613 @@ static int exec_benchmark(int argc, char **argv) {
     return 0;
 }
 
+enum {
+    // Maximum number of functions in a chain.
+    kChainMax = 8,
+};
+
+// A chain of functions, where each function's output is the next function's
+// input.
+struct chain {
+    int size;
+    int block;
+    int count;
+    func funcs[kChainMax];
+    const float *xs;
+    float *ys;
+    // Intermediate results for one block.
+    float *tmp[2];
+};
+
+// Run the chain over the array, one block at a time.
+static void chain_run(const struct chain *restrict c) {
+    for (int pos = 0; pos < c->size; pos += c->block) {
+        int n = c->size - pos < c->block ? c->size - pos : c->block;
+        const float *in = c->xs + pos;
+        for (int i = 0; i < c->count; i++) {
+            float *out = i == c->count - 1 ? c->ys + pos : c->tmp[i & 1];
+            c->funcs[i](n, out, in);
+            in = out;
+        }
+    }
+}
+
+// Time the chain, in ns.
+static double time_chain(void *ctx, int iter) {
+    const struct chain *c = ctx;
+    chain_run(c); // Warm cache.
+    struct timespec t0, t1;
+    clock_gettime(CLOCK_THREAD_CPUTIME_ID, &t0);
+    for (int i = 0; i < iter; i++) {
+        chain_run(c);
+    }
+    clock_gettime(CLOCK_THREAD_CPUTIME_ID, &t1);
+    return 1e9 * (t1.tv_sec - t0.tv_sec) + (t1.tv_nsec - t0.tv_nsec);
+}
+
+static void help_chain(const char *name) {
+    xprintf(stdout, "\nUsage: %s [<option>...] [--] <function>...\n", name);
+    xputs(stdout,
+          "\n"
+          "Run each function on the output of the previous function, over an\n"
+          "array, one block at a time.\n"
+          "\n"
+          "Options:\n"
+          "  -size <size>   Size of input array\n"
+          "  -block <size>  Process <size> elements at a time, default is the\n"
+          "                 whole array\n"
+          "  -iter <count>  Number of chain iterations per run\n"
+          "  -runs <count>  Number of benchmark runs\n"
+          "  -time <ms>     Choose iteration count so each run takes about\n"
+          "                 <ms> milliseconds\n"
+          "  -input <dist>  Input distribution, default depends on the first\n"
+          "                 function\n"
+          "  -input-seed <seed>\n"
+          "                 Random seed for the input\n"
+          "  -out <file>    Write results as CSV to <file>\n");
+}
+
+static int exec_chain(int argc, char **argv) {
+    // Parse flags
+    int size = kBenchmarkSize;
+    int block = 0;
+    int iter = kBenchmarkIter;
+    int runs = kBenchmarkRuns;
+    float time_ms = 0.0f;
+    const char *input_name = kInputNames[kInputDefault];
+    int input_seed = 1;
+    const char *outfile = NULL;
+    flag_int(&size, "size", "array size");
+    flag_int(&block, "block", "block size");
+    flag_int(&iter, "iter", "iteration count");
+    flag_int(&runs, "runs", "number of runs");
+    flag_float(&time_ms, "time", "target run time in milliseconds");
+    flag_string(&input_name, "input", "input distribution");
+    flag_int(&input_seed, "input-seed", "random seed for input");
+    flag_string(&outfile, "out", "output file");
+    argc = flag_parse(argc, argv);
+    if (size < 1) {
+        die_usage("size must be positive");
+    }
+    if ((size % UFXR_QUANTUM) != 0) {
+        die_usagef("invalid size %d, must be a multiple of %d", size,
+                   UFXR_QUANTUM);
+    }
+    if (block == 0 || block > size) {
+        block = size;
+    }
+    if (block < 1 || (block % UFXR_QUANTUM) != 0) {
+        die_usagef("invalid block size %d, must be a positive multiple of %d",
+                   block, UFXR_QUANTUM);
+    }
+    if (iter < 1) {
+        die_usage("iteration count must be positive");
+    }
+    if (runs < 1) {
+        die_usage("run count must be positive");
+    }
+    if (time_ms < 0.0f) {
+        die_usage("time must not be negative");
+    }
+    if (argc < 1) {
+        die_usage("no functions");
+    }
+    if (argc > kChainMax) {
+        die_usagef("too many functions, the maximum is %d", kChainMax);
+    }
+    int input = find_input(input_name);
+
+    // Execute
+    struct chain c = {.size = size, .block = block, .count = argc};
+    const struct func_info *first = NULL;
+    for (int i = 0; i < argc; i++) {
+        const struct func_info *finfo = find_func(argv[i]);
+        if (finfo->out_size != 0) {
+            die_usagef("function %s does not output float",
+                       quote_str(finfo->name));
+        }
+        if (first == NULL) {
+            first = finfo;
+        }
+        c.funcs[i] = finfo->func;
+    }
+    float *xs = xmalloc(sizeof(float) * size);
+    fill_input(size, xs, input == kInputDefault ? first->input : input,
+               (uint64_t)input_seed);
+    c.xs = xs;
+    c.ys = xmalloc(sizeof(float) * size);
+    c.tmp[0] = xmalloc(sizeof(float) * block);
+    c.tmp[1] = xmalloc(sizeof(float) * block);
+    if (time_ms > 0.0f) {
+        iter = calibrate(1e6 * (double)time_ms, time_chain, &c);
+    }
+    FILE *fp;
+    if (outfile == NULL) {
+        fp = stdout;
+    } else {
+        fp = fopen(outfile, "w");
+        if (fp == NULL) {
+            int ecode = errno;
+            dief(ecode, "could not open %s", quote_str(outfile));
+        }
+    }
+    xputs(fp, "Block,TimeNS\n");
+    double samples = (double)iter * (double)size;
+    for (int run = 0; run < runs; run++) {
+        double t = time_chain(&c, iter);
+        xprintf(fp, "%d,%.3f\n", block, t / samples);
+    }
+    if (outfile != NULL) {
+        if (fclose(fp) != 0) {
+            int ecode = errno;
+            dief(ecode, "error writing to %s", quote_str(outfile));
+        }
+    }
+    return 0;
+}
+
+// Sample formats for the wave command.
+static const struct wave_format {
+    char name[4];
+    ufxr_format format;
+} kWaveFormats[] = {
+    {"u8", kUFXRFormatU8},
+    {"s16", kUFXRFormatS16},
+    {"s24", kUFXRFormatS24},
+    {"f32", kUFXRFormatF32},
+};
+
+enum {
+    // Number of samples rendered and written at a time by the wave command.
+    kWaveBlock = 1024,
+};
+
+static void help_wave(const char *name) {
+    xprintf(stdout, "\nUsage: %s <file>\n", name);
+    xputs(stdout,
+          "\n"
+          "Render audio in blocks and write it to a WAVE file, and report the\n"
+          "wall clock time to render, write, and sync, in ns per run.\n"
+          "\n"
+          "Options:\n"
+          "  -seconds <n>   Length of audio in seconds, default 10\n"
+          "  -rate <rate>   Sample rate in Hz, default 48000\n"
+          "  -format <fmt>  Sample format: u8, s16, s24, or f32, default s16\n"
+          "  -runs <runs>   Number of runs\n"
+          "  -fsync         Sync the file to disk after writing\n"
+          "  -out <file>    Write results as CSV to <file>\n");
+}
+
+static noreturn void die_wave(const char *path,
+                              const struct ufxr_error *err) {
+    if (err->domain == kUFXRDomainSystem) {
+        dief(err->code, "could not write %s", quote_str(path));
+    }
+    dief(0, "could not write %s: error %d", quote_str(path), err->code);
+}
+
+// Times for one run of the wave command, in ns.
+struct wave_times {
+    double render;
+    double write;
+    double sync;
+};
+
+// Render a sine wave and write it to a wave file. The signal is generated in
+// blocks with exp2, osc, and sin1, like an export from a synthesizer.
+static struct wave_times wave_run(const char *path,
+                                  const struct ufxr_waveinfo *info,
+                                  bool use_fsync, float *buf[2]) {
+    struct wave_times times = {0.0, 0.0, 0.0};
+    struct timespec t0, t1, t2;
+    struct ufxr_wavewriter w;
+    struct ufxr_error err;
+    clock_gettime(CLOCK_MONOTONIC, &t0);
+    if (!ufxr_wavewriter_create(&w, path, info, &err)) {
+        die_wave(path, &err);
+    }
+    clock_gettime(CLOCK_MONOTONIC, &t1);
+    times.write += elapsed_ns(&t0, &t1);
+    // Note value of A4 = 440 Hz, in octaves relative to the sample rate.
+    float note = log2f(440.0f / (float)info->samplerate);
+    for (unsigned pos = 0; pos < info->length; pos += kWaveBlock) {
+        unsigned n = info->length - pos;
+        if (n > kWaveBlock) {
+            n = kWaveBlock;
+        }
+        clock_gettime(CLOCK_MONOTONIC, &t0);
+        for (int i = 0; i < kWaveBlock; i++) {
+            buf[0][i] = note;
+        }
+        ufxr_exp2_3(kWaveBlock, buf[1], buf[0]);
+        ufxr_osc(kWaveBlock, buf[0], buf[1]);
+        ufxr_sin1_4(kWaveBlock, buf[1], buf[0]);
+        clock_gettime(CLOCK_MONOTONIC, &t1);
+        if (!ufxr_wavewriter_write(&w, buf[1], n, &err)) {
+            die_wave(path, &err);
+        }
+        clock_gettime(CLOCK_MONOTONIC, &t2);
+        times.render += elapsed_ns(&t0, &t1);
+        times.write += elapsed_ns(&t1, &t2);
+    }
+    clock_gettime(CLOCK_MONOTONIC, &t0);
+    if (!ufxr_wavewriter_finish(&w, &err)) {
+        die_wave(path, &err);
+    }
+    ufxr_wavewriter_destroy(&w);
+    clock_gettime(CLOCK_MONOTONIC, &t1);
+    times.write += elapsed_ns(&t0, &t1);
+    if (use_fsync) {
+        // The writer closes the file when it finishes, so reopen it. Syncing
+        // any descriptor for the file writes out all of its data.
+        int fd = open(path, O_RDONLY);
+        if (fd == -1 || fsync(fd) == -1) {
+            int ecode = errno;
+            dief(ecode, "could not sync %s", quote_str(path));
+        }
+        close(fd);
+        clock_gettime(CLOCK_MONOTONIC, &t2);
+        times.sync = elapsed_ns(&t1, &t2);
+    }
+    return times;
+}
+
+static int exec_wave(int argc, char **argv) {
+    // Parse flags
+    float seconds = 10.0f;
+    int rate = 48000;
+    const char *format_name = "s16";
+    int runs = kBenchmarkRuns;
+    bool use_fsync = false;
+    const char *outfile = NULL;
+    flag_float(&seconds, "seconds", "audio length in seconds");
+    flag_int(&rate, "rate", "sample rate in Hz");
+    flag_string(&format_name, "format", "sample format");
+    flag_int(&runs, "runs", "number of runs");
+    flag_bool(&use_fsync, "fsync", "sync file to disk");
+    flag_string(&outfile, "out", "output file");
+    argc = flag_parse(argc, argv);
+    if (argc < 1) {
+        die_usage("missing argument <file>");
+    }
+    if (argc > 1) {
+        die_usagef("unexpected argument %s", quote_str(argv[1]));
+    }
+    const char *path = argv[0];
+    if (rate < 1) {
+        die_usage("sample rate must be positive");
+    }
+    double length = rint((double)seconds * rate);
+    if (!(length >= 1.0)) {
+        die_usagef("length %fs is too short", (double)seconds);
+    }
+    if (length > INT_MAX / 4) {
+        die_usagef("length %fs is too long", (double)seconds);
+    }
+    if (runs < 1) {
+        die_usage("run count must be positive");
+    }
+    const struct wave_format *format = NULL;
+    for (size_t i = 0; i < ARRAY_SIZE(kWaveFormats); i++) {
+        if (strcmp(format_name, kWaveFormats[i].name) == 0) {
+            format = &kWaveFormats[i];
+            break;
+        }
+    }
+    if (format == NULL) {
+        die_usagef("unknown format %s", quote_str(format_name));
+    }
+
+    // Execute
+    struct ufxr_waveinfo info = {
+        .samplerate = rate,
+        .channels = 1,
+        .format = format->format,
+        .length = (unsigned)length,
+    };
+    float *buf[2] = {
+        alloc_buffer(kWaveBlock, 0),
+        alloc_buffer(kWaveBlock, 0),
+    };
+    FILE *fp;
+    if (outfile == NULL) {
+        fp = stdout;
+    } else {
+        fp = fopen(outfile, "w");
+        if (fp == NULL) {
+            int ecode = errno;
+            dief(ecode, "could not open %s", quote_str(outfile));
+        }
+    }
+    xputs(fp, "Format,RenderNS,WriteNS,SyncNS\n");
+    for (int run = 0; run < runs; run++) {
+        struct wave_times t = wave_run(path, &info, use_fsync, buf);
+        xprintf(fp, "%s,%.0f,%.0f,%.0f\n", format->name, t.render, t.write,
+                t.sync);
+    }
+    if (outfile != NULL) {
+        if (fclose(fp) != 0) {
+            int ecode = errno;
+            dief(ecode, "error writing to %s", quote_str(outfile));
+        }
+    }
+    return 0;
+}
+
+enum {
+    // Maximum length of a command line for the serve command.
+    kServeLine = 1024,
+    // Maximum number of fields in a command.
+    kServeFields = 16,
+};
+
+static void help_serve(const char *name) {
+    xprintf(stdout, "\nUsage: %s\n", name);
+    xputs(stdout,
+          "\n"
+          "Read commands from standard input, one per line, and write results\n"
+          "to standard output as JSON, one object per line. Buffers and input\n"
+          "data are kept between commands, so repeated measurements run warm.\n"
+          "\n"
+          "Commands:\n"
+          "  run <function> [<key>=<value>...]\n"
+          "                 Benchmark a function, writing an object with\n"
+          "                 \"time_ns\", in ns per sample, for each run\n"
+          "  calibrate <function> [<key>=<value>...]\n"
+          "                 Write an object with the iteration count for a\n"
+          "                 run to take \"time\" milliseconds\n"
+          "  quit           Exit\n"
+          "\n"
+          "Keys:\n"
+          "  size           Array size\n"
+          "  iter           Iteration count\n"
+          "  runs           Number of runs\n"
+          "  time           Target run time in milliseconds, for calibrate\n"
+          "  input          Input distribution, as for benchmark\n"
+          "  input-seed     Random seed for the input\n"
+          "\n"
+          "Errors are written as an object with \"error\", and do not end the\n"
+          "command.\n");
+}
+
+// Write a string as a JSON string literal.
+static void json_str(FILE *fp, const char *s) {
+    xputs(fp, "\"");
+    for (const unsigned char *p = (const unsigned char *)s; *p != '\0'; p++) {
+        unsigned char c = *p;
+        if (c == '"' || c == '\\') {
+            xprintf(fp, "\\%c", c);
+        } else if (c < 0x20) {
+            xprintf(fp, "\\u%04x", c);
+        } else {
+            xprintf(fp, "%c", c);
+        }
+    }
+    xputs(fp, "\"");
+}
+
+// Write an error result for the serve command.
+static void serve_error(const char *fmt, ...)
+    __attribute__((format(printf, 1, 2)));
+
+static void serve_error(const char *fmt, ...) {
+    char msg[kServeLine + 128];
+    va_list ap;
+    va_start(ap, fmt);
+    vsnprintf(msg, sizeof(msg), fmt, ap);
+    va_end(ap);
+    xputs(stdout, "{\"error\":");
+    json_str(stdout, msg);
+    xputs(stdout, "}\n");
+}
+
+// Parse a positive integer. Returns false if the value is invalid.
+static bool parse_positive(const char *s, int *value) {
+    char *end;
+    errno = 0;
+    long x = strtol(s, &end, 10);
+    if (*s == '\0' || *end != '\0' || errno != 0 || x < 1 || x > INT_MAX) {
+        return false;
+    }
+    *value = (int)x;
+    return true;
+}
+
+// Parse a positive number. Returns false if the value is invalid.
+static bool parse_positive_double(const char *s, double *value) {
+    char *end;
+    errno = 0;
+    double x = strtod(s, &end);
+    if (*s == '\0' || *end != '\0' || errno != 0 || !(x > 0.0) ||
+        isinf(x)) {
+        return false;
+    }
+    *value = x;
+    return true;
+}
+
+// Buffers kept by the serve command between commands.
+struct serve_state {
+    // Output buffer and its capacity, in samples.
+    float *ys;
+    int capacity;
+    // Input buffers for each distribution, the size and seed they were filled
+    // with, and their capacity.
+    float *inputs[kInputCount];
+    int input_size[kInputCount];
+    uint64_t input_seed[kInputCount];
+    int input_capacity[kInputCount];
+};
+
+// Return an input buffer filled with the given distribution, reusing the
+// previous buffer if possible.
+static const float *serve_input(struct serve_state *restrict st, int input,
+                                int size, uint64_t seed) {
+    if (st->input_capacity[input] < size) {
+        free(st->inputs[input]);
+        st->inputs[input] = alloc_buffer(size, 0);
+        st->input_capacity[input] = size;
+        st->input_size[input] = 0;
+    }
+    if (st->input_size[input] != size || st->input_seed[input] != seed) {
+        fill_input(size, st->inputs[input], input, seed);
+        st->input_size[input] = size;
+        st->input_seed[input] = seed;
+    }
+    return st->inputs[input];
+}
+
+// Execute one command for the serve command. Returns false to exit.
+static bool serve_command(struct serve_state *restrict st, char *line) {
+    char *fields[kServeFields];
+    int nfields = 0;
+    for (char *tok = strtok(line, " \t\r\n"); tok != NULL;
+         tok = strtok(NULL, " \t\r\n")) {
+        if (nfields == kServeFields) {
+            serve_error("too many fields");
+            return true;
+        }
+        fields[nfields++] = tok;
+    }
+    if (nfields == 0) {
+        return true;
+    }
+    const char *cmd = fields[0];
+    if (strcmp(cmd, "quit") == 0) {
+        return false;
+    }
+    bool is_calibrate = strcmp(cmd, "calibrate") == 0;
+    if (!is_calibrate && strcmp(cmd, "run") != 0) {
+        serve_error("unknown command %s", cmd);
+        return true;
+    }
+    if (nfields < 2) {
+        serve_error("missing function");
+        return true;
+    }
+    const struct func_info *finfo = lookup_func(fields[1]);
+    if (finfo == NULL) {
+        serve_error("unknown function %s", fields[1]);
+        return true;
+    }
+    int size = kBenchmarkSize;
+    int iter = kBenchmarkIter;
+    int runs = kBenchmarkRuns;
+    double time_ms = 0.0;
+    int input = kInputDefault;
+    int input_seed = 1;
+    for (int i = 2; i < nfields; i++) {
+        char *key = fields[i];
+        char *value = strchr(key, '=');
+        if (value == NULL) {
+            serve_error("invalid argument %s, must be <key>=<value>", key);
+            return true;
+        }
+        *value++ = '\0';
+        bool ok;
+        if (strcmp(key, "size") == 0) {
+            ok = parse_positive(value, &size) && size % UFXR_QUANTUM == 0;
+        } else if (strcmp(key, "iter") == 0) {
+            ok = parse_positive(value, &iter);
+        } else if (strcmp(key, "runs") == 0) {
+            ok = parse_positive(value, &runs);
+        } else if (strcmp(key, "time") == 0) {
+            ok = parse_positive_double(value, &time_ms);
+        } else if (strcmp(key, "input") == 0) {
+            input = lookup_input(value);
+            ok = input >= 0;
+        } else if (strcmp(key, "input-seed") == 0) {
+            ok = parse_positive(value, &input_seed);
+        } else {
+            serve_error("unknown key %s", key);
+            return true;
+        }
+        if (!ok) {
+            serve_error("invalid %s %s", key, value);
+            return true;
+        }
+    }
+    if (is_calibrate && time_ms == 0.0) {
+        serve_error("calibrate requires time");
+        return true;
+    }
+    if (input == kInputDefault) {
+        input = finfo->input;
+    }
+    if (st->capacity < size) {
+        free(st->ys);
+        st->ys = alloc_buffer(size, 0);
+        st->capacity = size;
+    }
+    const float *xs = serve_input(st, input, size, (uint64_t)input_seed);
+    if (is_calibrate) {
+        struct single c = {size, finfo->func, xs, st->ys};
+        iter = calibrate(1e6 * time_ms, time_single, &c);
+        xprintf(stdout, "{\"func\":\"%s\",\"size\":%d,\"iter\":%d}\n",
+                finfo->name, size, iter);
+        return true;
+    }
+    double samples = (double)iter * (double)size;
+    for (int run = 0; run < runs; run++) {
+        double t = benchmark(size, iter, finfo->func, xs, st->ys, NULL, NULL);
+        xprintf(stdout,
+                "{\"func\":\"%s\",\"size\":%d,\"iter\":%d,\"input\":\"%s\","
+                "\"run\":%d,\"runs\":%d,\"time_ns\":%.3f}\n",
+                finfo->name, size, iter, kInputNames[input], run, runs,
+                t / samples);
+        fflush(stdout);
+    }
+    return true;
+}
+
+static int exec_serve(int argc, char **argv) {
+    argc = flag_parse(argc, argv);
+    if (argc > 0) {
+        die_usagef("unexpected argument %s", quote_str(argv[0]));
+    }
+    struct serve_state st = {.ys = NULL};
+    char line[kServeLine];
+    while (fgets(line, sizeof(line), stdin) != NULL) {
+        size_t len = strlen(line);
+        if (len == sizeof(line) - 1 && line[len - 1] != '\n') {
+            // Discard the rest of the line.
+            int c;
+            while ((c = getchar()) != EOF && c != '\n') {}
+            serve_error("line too long");
+        } else if (!serve_command(&st, line)) {
+            break;
+        }
+        if (fflush(stdout) != 0) {
+            die_output();
+        }
+    }
+    if (ferror(stdin)) {
+        int ecode = errno;
+        dief(ecode, "could not read standard input");
+    }
+    return 0;
+}
+
 static void help_dump(const char *name) {
     xprintf(stdout, "\nUsage: %s <function> [<min> <max>]\n", name);
     xputs(stdout,
@@ -221,6 +1578,9 @@ static int exec_dump(int argc, char **argv) {
         die_usage("count must be positive");
     }
     const struct func_info *finfo = find_func(argv[0]);
+    if (finfo->out_size != 0) {
+        die_usagef("function %s does not output float", quote_str(finfo->name));
+    }
     float x0, x1;
     switch (argc) {
     case 1:
@@ -255,9 +1615,10 @@ static int exec_dump(int argc, char **argv) {
             xprintf(fp, "%zu\t%f\t%f\n", i, (double)xs[i], (double)ys[i]);
         }
     } else {
+        // Nine significant digits, so values read back exactly as floats.
         xputs(fp, "X,Y\n");
         for (size_t i = 0, n = count; i < n; i++) {
-            xprintf(fp, "%f,%f\n", (double)xs[i], (double)ys[i]);
+            xprintf(fp, "%.9g,%.9g\n", (double)xs[i], (double)ys[i]);
         }
     }
     if (outfile != NULL) {
@@ -281,8 +1642,12 @@ struct cmd_info {
 
 static const struct cmd_info kCmds[] = {
     {"benchmark", "Benchmark functions", help_benchmark, exec_benchmark},
+    {"chain", "Benchmark a chain of functions", help_chain, exec_chain},
     {"dump", "Dump function output to CSV", help_dump, exec_dump},
     {"help", "Show help", help_help, exec_help},
+    {"serve", "Run benchmarks from commands on standard input", help_serve,
+     exec_serve},
+    {"wave", "Benchmark writing a WAVE file", help_wave, exec_wave},
 };
 
 static const struct cmd_info *find_cmd(const char *name) {
@@ -52,3 +52,19 @@ void ufxr_sin1_3(int n, float *restrict outs, const float *restrict xs);
 void ufxr_sin1_4(int n, float *restrict outs, const float *restrict xs);
 void ufxr_sin1_5(int n, float *restrict outs, const float *restrict xs);
 void ufxr_sin1_6(int n, float *restrict outs, const float *restrict xs);
+
+// In-place versions of the operators, which compute xs = f(xs). The other
+// operators do not permit the output to alias the input. Each has its own loop
+// which reads and writes the same array, like the corresponding operator.
+void ufxr_exp2_2_inplace(int n, float *xs);
+void ufxr_exp2_3_inplace(int n, float *xs);
+void ufxr_exp2_4_inplace(int n, float *xs);
+void ufxr_exp2_5_inplace(int n, float *xs);
+void ufxr_exp2_6_inplace(int n, float *xs);
+void ufxr_osc_inplace(int n, float *xs);
+void ufxr_tri_inplace(int n, float *xs);
+void ufxr_sin1_2_inplace(int n, float *xs);
+void ufxr_sin1_3_inplace(int n, float *xs);
+void ufxr_sin1_4_inplace(int n, float *xs);
+void ufxr_sin1_5_inplace(int n, float *xs);
+void ufxr_sin1_6_inplace(int n, float *xs);
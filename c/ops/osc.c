@@ -12,3 +12,13 @@ void ufxr_osc(int n, float *restrict outs, const float *restrict xs) {
         outs[i] = phase;
     }
 }
+
+void ufxr_osc_inplace(int n, float *xs) {
+    CHECK1(n, xs);
+    float phase = 0.0f;
+    for (int i = 0; i < n; i++) {
+        phase += xs[i];
+        phase -= rintf(phase);
+        xs[i] = phase;
+    }
+}
@@ -0,0 +1,102 @@
+"""End-to-end timing of the Rust sfx renderer.
+
+The renderer is run with -timing, which reports the time to parse each program,
+to build its signal graph, and to render it, without writing the audio.
+"""
+import dataclasses
+import pathlib
+import subprocess
+
+from typing import Dict
+
+class SfxError(Exception):
+    pass
+
+@dataclasses.dataclass
+class Timing:
+    """Times for one program, in ns."""
+    parse: float
+    graph: float
+    render: float
+    # Number of samples rendered, and the sample rate.
+    samples: int
+    sample_rate: int
+
+    @property
+    def realtime(self) -> float:
+        """Return the length of the audio divided by the time to render it."""
+        if self.render <= 0:
+            return float('inf')
+        return 1e9 * self.samples / (self.sample_rate * self.render)
+
+def build(rust_dir: pathlib.Path) -> pathlib.Path:
+    """Build the renderer with Cargo. Returns the path to the executable."""
+    try:
+        proc = subprocess.run(
+            ['cargo', 'build', '--release', '--quiet'],
+            cwd=rust_dir,
+            stdin=subprocess.DEVNULL,
+        )
+    except FileNotFoundError:
+        raise SfxError('cargo not found')
+    if proc.returncode:
+        raise SfxError('cargo build failed')
+    return rust_dir / 'target' / 'release' / 'ultrafxr'
+
+def programs(examples_dir: pathlib.Path) -> Dict[str, pathlib.Path]:
+    """Return the example programs, by name.
+
+    Names are paths relative to the examples directory, without the extension,
+    like "intern-apocalypse/bass".
+    """
+    paths = sorted([*examples_dir.glob('*.lisp'),
+                    *examples_dir.glob('intern-apocalypse/*.lisp')])
+    return {str(path.relative_to(examples_dir).with_suffix('')): path
+            for path in paths}
+
+def parse_timing(line: str) -> Timing:
+    """Parse a line of -timing output, after the file name."""
+    fields = {}
+    for field in line.split():
+        key, sep, value = field.partition('=')
+        if not sep:
+            raise SfxError('invalid timing field: {!r}'.format(field))
+        fields[key] = value
+    try:
+        return Timing(
+            parse=float(fields['parse_ns']),
+            graph=float(fields['graph_ns']),
+            render=float(fields['render_ns']),
+            samples=int(fields['samples']),
+            sample_rate=int(fields['sample_rate']),
+        )
+    except (KeyError, ValueError):
+        raise SfxError('invalid timing: {!r}'.format(line))
+
+def run(exe: pathlib.Path, paths: Dict[str, pathlib.Path], *,
+        sample_rate: int, buffer_size: int) -> Dict[str, Timing]:
+    """Render each program once. Returns the times by program name."""
+    names = list(paths)
+    proc = subprocess.run(
+        [exe, '-timing', '-sample-rate={}'.format(sample_rate),
+         '-buffer-size={}'.format(buffer_size),
+         *(str(paths[name]) for name in names)],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if proc.returncode:
+        raise SfxError('sfx failed:\n' + proc.stderr.decode('UTF-8', 'replace'))
+    lines = [line for line in proc.stdout.decode('UTF-8').splitlines()
+             if line.startswith('timing ')]
+    # Programs which fail to compile are reported on stderr, and have no
+    # timing line.
+    if len(lines) != len(names):
+        raise SfxError('sfx failed on some programs:\n'
+                       + proc.stderr.decode('UTF-8', 'replace'))
+    result = {}
+    for name, line in zip(names, lines):
+        # The file name may contain spaces, but the fields do not.
+        fields = line.split(' ')
+        result[name] = parse_timing(' '.join(fields[-5:]))
+    return result
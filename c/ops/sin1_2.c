@@ -17,6 +17,20 @@ void ufxr_sin1_2(int n, float *restrict outs, const float *restrict xs) {
         _mm_store_ps(outs + i, x);
     }
 }
+
+void ufxr_sin1_2_inplace(int n, float *xs) {
+    CHECK1(n, xs);
+    const __m128 abs = _mm_castsi128_ps(_mm_srli_epi32(_mm_set1_epi32(-1), 1));
+    const __m128 c2 = _mm_set1_ps(8.0f);
+    const __m128 c3 = _mm_set1_ps(16.0f);
+    for (int i = 0; i < n; i += 4) {
+        __m128 x = _mm_load_ps(xs + i);
+        x = _mm_sub_ps(
+            x, _mm_round_ps(x, _MM_FROUND_TO_NEAREST_INT | _MM_FROUND_NO_EXC));
+        x = _mm_mul_ps(x, _mm_sub_ps(c2, _mm_mul_ps(c3, _mm_and_ps(x, abs))));
+        _mm_store_ps(xs + i, x);
+    }
+}
 #endif
 
 #if !HAVE_FUNC && USE_SSE2
@@ -34,6 +48,19 @@ void ufxr_sin1_2(int n, float *restrict outs, const float *restrict xs) {
         _mm_store_ps(outs + i, x);
     }
 }
+
+void ufxr_sin1_2_inplace(int n, float *xs) {
+    CHECK1(n, xs);
+    const __m128 abs = _mm_castsi128_ps(_mm_srli_epi32(_mm_set1_epi32(-1), 1));
+    const __m128 c2 = _mm_set1_ps(8.0f);
+    const __m128 c3 = _mm_set1_ps(16.0f);
+    for (int i = 0; i < n; i += 4) {
+        __m128 x = _mm_load_ps(xs + i);
+        x = _mm_sub_ps(x, _mm_cvtepi32_ps(_mm_cvtps_epi32(x)));
+        x = _mm_mul_ps(x, _mm_sub_ps(c2, _mm_mul_ps(c3, _mm_and_ps(x, abs))));
+        _mm_store_ps(xs + i, x);
+    }
+}
 #endif
 
 // Scalar version.
@@ -47,4 +74,13 @@ void ufxr_sin1_2(int n, float *restrict outs, const float *restrict xs) {
         outs[i] = x * (8.0f - 16.0f * fabsf(x));
     }
 }
+
+void ufxr_sin1_2_inplace(int n, float *xs) {
+    CHECK1(n, xs);
+    for (int i = 0; i < n; i++) {
+        float x = xs[i];
+        x -= rintf(x);
+        xs[i] = x * (8.0f - 16.0f * fabsf(x));
+    }
+}
 #endif
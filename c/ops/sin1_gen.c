@@ -28,8 +28,17 @@ static int find_algorithm(const char *name) {
     die_usagef("unknown algorithm: %s", quote_str(name));
 }
 
-static const char *const kArgs =
-    "(int n, float *restrict outs, const float *restrict xs)";
+// Each function is emitted twice, as the operator and its in-place version.
+static const struct signature {
+    const char *suffix;
+    const char *args;
+    const char *check;
+    const char *outs;
+} kSignatures[] = {
+    {"", "(int n, float *restrict outs, const float *restrict xs)",
+     "CHECK2(n, outs, xs)", "outs"},
+    {"_inplace", "(int n, float *xs)", "CHECK1(n, xs)", "xs"},
+};
 
 static void emit_full(FILE *fp, int order, char **coeffs) {
     enum {
@@ -52,42 +61,54 @@ static void emit_full(FILE *fp, int order, char **coeffs) {
                   "#define HAVE_FUNC 1\n"
                   "#include <smmintrin.h>\n");
         }
-        xprintf(fp, "void ufxr_sin1_%d%s {\n", order, kArgs);
-        xputs(fp,
-              "    CHECK2(n, outs, xs);\n"
-              "    const __m128 d0 = _mm_set1_ps(0.25f);\n"
-              "    const __m128 d1 = _mm_set1_ps(0.5f);\n");
-        for (int i = 0; i < order; i++) {
-            xprintf(fp, "    const __m128 c%d = _mm_set1_ps(%sf);\n", i,
-                    coeffs[i]);
-        }
-        xputs(fp,
-              "    const __m128 abs = "
-              "_mm_castsi128_ps(_mm_srli_epi32(_mm_set1_epi32(-1), 1));\n"
-              "    for (int i = 0; i < n; i += 4) {\n"
-              "        __m128 x = _mm_load_ps(xs + i);\n");
-        if (v == kSSE2) {
+        for (size_t k = 0; k < ARRAY_SIZE(kSignatures); k++) {
+            const struct signature *sig = &kSignatures[k];
+            if (k > 0) {
+                xputs(fp, "\n");
+            }
+            xprintf(fp, "void ufxr_sin1_%d%s%s {\n", order, sig->suffix,
+                    sig->args);
+            xprintf(fp,
+                    "    %s;\n"
+                    "    const __m128 d0 = _mm_set1_ps(0.25f);\n"
+                    "    const __m128 d1 = _mm_set1_ps(0.5f);\n",
+                    sig->check);
+            for (int i = 0; i < order; i++) {
+                xprintf(fp, "    const __m128 c%d = _mm_set1_ps(%sf);\n", i,
+                        coeffs[i]);
+            }
             xputs(fp,
-                  "        x = _mm_sub_ps(x, "
-                  "_mm_cvtepi32_ps(_mm_cvtps_epi32(_mm_sub_ps(x, d0))));\n");
-        } else {
+                  "    const __m128 abs = "
+                  "_mm_castsi128_ps(_mm_srli_epi32(_mm_set1_epi32(-1), 1));\n"
+                  "    for (int i = 0; i < n; i += 4) {\n"
+                  "        __m128 x = _mm_load_ps(xs + i);\n");
+            if (v == kSSE2) {
+                xputs(fp,
+                      "        x = _mm_sub_ps(x, "
+                      "_mm_cvtepi32_ps(_mm_cvtps_epi32(_mm_sub_ps(x, d0))));"
+                      "\n");
+            } else {
+                xputs(fp,
+                      "        x = _mm_sub_ps(x, _mm_round_ps("
+                      "_mm_sub_ps(x, d0), "
+                      "_MM_FROUND_TO_NEAREST_INT | _MM_FROUND_NO_EXC));\n");
+            }
             xputs(fp,
-                  "        x = _mm_sub_ps(x, _mm_round_ps("
-                  "_mm_sub_ps(x, d0), "
-                  "_MM_FROUND_TO_NEAREST_INT | _MM_FROUND_NO_EXC));\n");
-        }
-        xputs(fp,
-              "        x = _mm_min_ps(x, _mm_sub_ps(d1, x));\n"
-              "        __m128 ax = _mm_and_ps(x, abs);\n");
-        xprintf(fp, "        __m128 y = c%d;\n", order - 1);
-        for (int i = order - 2; i >= 0; i--) {
-            xprintf(fp, "        y = _mm_add_ps(_mm_mul_ps(y, ax), c%d);\n", i);
+                  "        x = _mm_min_ps(x, _mm_sub_ps(d1, x));\n"
+                  "        __m128 ax = _mm_and_ps(x, abs);\n");
+            xprintf(fp, "        __m128 y = c%d;\n", order - 1);
+            for (int i = order - 2; i >= 0; i--) {
+                xprintf(fp,
+                        "        y = _mm_add_ps(_mm_mul_ps(y, ax), c%d);\n",
+                        i);
+            }
+            xprintf(fp,
+                    "        _mm_store_ps(%s + i, _mm_mul_ps(y, x));\n"
+                    "    }\n"
+                    "}\n",
+                    sig->outs);
         }
-        xputs(fp,
-              "        _mm_store_ps(outs + i, _mm_mul_ps(y, x));\n"
-              "    }\n"
-              "}\n"
-              "#endif\n");
+        xputs(fp, "#endif\n");
     }
 
     xputs(fp,
@@ -95,28 +116,36 @@ static void emit_full(FILE *fp, int order, char **coeffs) {
           "// Scalar version.\n"
           "#if !HAVE_FUNC\n"
           "#include <math.h>\n");
-    xprintf(fp, "void ufxr_sin1_%d%s {\n", order, kArgs);
-    xputs(fp, "    CHECK2(n, outs, xs);\n");
-    for (int i = 0; i < order; i++) {
-        xprintf(fp, "    const float c%d = %sf;\n", i, coeffs[i]);
-    }
-    xputs(fp,
-          "    for (int i = 0; i < n; i++) {\n"
-          "        float x = xs[i];\n"
-          "        x -= rintf(x - 0.25f);\n"
-          "        float t1 = 0.5f - x;\n"
-          "        if (t1 < x)\n"
-          "            x = t1;\n"
-          "        float ax = fabsf(x);\n");
-    xprintf(fp, "        float y = c%d;\n", order - 1);
-    for (int i = order - 2; i >= 0; i--) {
-        xprintf(fp, "        y = y * ax + c%d;\n", i);
+    for (size_t k = 0; k < ARRAY_SIZE(kSignatures); k++) {
+        const struct signature *sig = &kSignatures[k];
+        if (k > 0) {
+            xputs(fp, "\n");
+        }
+        xprintf(fp, "void ufxr_sin1_%d%s%s {\n", order, sig->suffix,
+                sig->args);
+        xprintf(fp, "    %s;\n", sig->check);
+        for (int i = 0; i < order; i++) {
+            xprintf(fp, "    const float c%d = %sf;\n", i, coeffs[i]);
+        }
+        xputs(fp,
+              "    for (int i = 0; i < n; i++) {\n"
+              "        float x = xs[i];\n"
+              "        x -= rintf(x - 0.25f);\n"
+              "        float t1 = 0.5f - x;\n"
+              "        if (t1 < x)\n"
+              "            x = t1;\n"
+              "        float ax = fabsf(x);\n");
+        xprintf(fp, "        float y = c%d;\n", order - 1);
+        for (int i = order - 2; i >= 0; i--) {
+            xprintf(fp, "        y = y * ax + c%d;\n", i);
+        }
+        xprintf(fp,
+                "        %s[i] = x * y;\n"
+                "    }\n"
+                "}\n",
+                sig->outs);
     }
-    xputs(fp,
-          "        outs[i] = x * y;\n"
-          "    }\n"
-          "}\n"
-          "#endif\n");
+    xputs(fp, "#endif\n");
 }
 
 static void emit_odd(FILE *fp, int order, char **coeffs) {
@@ -125,31 +154,39 @@ static void emit_odd(FILE *fp, int order, char **coeffs) {
           "// Scalar version.\n"
           "#if !HAVE_FUNC\n"
           "#include <math.h>\n");
-    xprintf(fp, "void ufxr_sin1_%d%s {\n", order, kArgs);
-    xputs(fp, "    CHECK2(n, outs, xs);\n");
-    for (int i = 0; i < order - 1; i++) {
-        xprintf(fp, "    const float c%d = %sf;\n", i, coeffs[i]);
-    }
-    xputs(fp,
-          "    for (int i = 0; i < n; i++) {\n"
-          "        float x = xs[i];\n"
-          "        x -= rintf(x);\n"
-          "        float t1 = 0.5f - x;\n"
-          "        float t2 = -0.5f - x;\n"
-          "        if (t1 < x)\n"
-          "            x = t1;\n"
-          "        if (t2 > x)\n"
-          "            x = t2;\n"
-          "        float x2 = x * x;\n");
-    xprintf(fp, "        float y = c%d;\n", order - 2);
-    for (int i = order - 3; i >= 0; i--) {
-        xprintf(fp, "        y = y * x2 + c%d;\n", i);
+    for (size_t k = 0; k < ARRAY_SIZE(kSignatures); k++) {
+        const struct signature *sig = &kSignatures[k];
+        if (k > 0) {
+            xputs(fp, "\n");
+        }
+        xprintf(fp, "void ufxr_sin1_%d%s%s {\n", order, sig->suffix,
+                sig->args);
+        xprintf(fp, "    %s;\n", sig->check);
+        for (int i = 0; i < order - 1; i++) {
+            xprintf(fp, "    const float c%d = %sf;\n", i, coeffs[i]);
+        }
+        xputs(fp,
+              "    for (int i = 0; i < n; i++) {\n"
+              "        float x = xs[i];\n"
+              "        x -= rintf(x);\n"
+              "        float t1 = 0.5f - x;\n"
+              "        float t2 = -0.5f - x;\n"
+              "        if (t1 < x)\n"
+              "            x = t1;\n"
+              "        if (t2 > x)\n"
+              "            x = t2;\n"
+              "        float x2 = x * x;\n");
+        xprintf(fp, "        float y = c%d;\n", order - 2);
+        for (int i = order - 3; i >= 0; i--) {
+            xprintf(fp, "        y = y * x2 + c%d;\n", i);
+        }
+        xprintf(fp,
+                "        %s[i] = x * y;\n"
+                "    }\n"
+                "}\n",
+                sig->outs);
     }
-    xputs(fp,
-          "        outs[i] = x * y;\n"
-          "    }\n"
-          "}\n"
-          "#endif\n");
+    xputs(fp, "#endif\n");
 }
 
 static void emit(int algorithm, int order, char **coeffs) {
@@ -14,6 +14,7 @@ use std::ffi::{OsStr, OsString};
 use std::fs;
 use std::io::{stdout, Error as IOError, Read, Write};
 use std::path::PathBuf;
+use std::time::{Duration, Instant};
 
 const DEFAULT_SAMPLE_RATE: u32 = 48000;
 const MIN_SAMPLE_RATE: u32 = 8000;
@@ -48,6 +49,20 @@ pub struct Command {
     pub dump_graph: bool,
     pub sample_rate: Option<u32>,
     pub buffer_size: Option<usize>,
+    pub timing: bool,
+}
+
+/// Time spent in each phase of processing an input file.
+#[derive(Debug, Clone, Copy, Default)]
+struct Timing {
+    /// Tokenizing and parsing.
+    parse: Duration,
+    /// Evaluating the program and creating the signal graph and program.
+    graph: Duration,
+    /// Rendering audio, not including writing it.
+    render: Duration,
+    /// Number of samples rendered.
+    samples: usize,
 }
 
 fn parse_notes(arg: &str) -> Option<Vec<Note>> {
@@ -85,6 +100,7 @@ impl Command {
         let mut dump_graph = false;
         let mut sample_rate = None;
         let mut buffer_size = None;
+        let mut timing = false;
         let mut args = Args::from_args(args);
         loop {
             args = match args.next()? {
@@ -152,6 +168,10 @@ impl Command {
                         buffer_size = Some(value);
                         rest
                     }
+                    "timing" => {
+                        timing = true;
+                        option.no_value()?.1
+                    }
                     "script" => {
                         let (_, value, rest) = option.value_str()?;
                         script = Some(value);
@@ -235,6 +255,7 @@ impl Command {
             dump_graph,
             sample_rate,
             buffer_size,
+            timing,
         })
     }
 
@@ -255,6 +276,8 @@ impl Command {
     fn run_file(&self, file: &File) -> Result<(), Failed> {
         let (filename, text) = self.read_input(file)?;
         let mut err_handler = ConsoleLogger::from_text(filename.as_ref(), text.as_ref());
+        let mut timing = Timing::default();
+        let start = Instant::now();
         let exprs = {
             let mut exprs = Vec::new();
             let mut toks = match Tokenizer::new(text.as_ref()) {
@@ -283,15 +306,36 @@ impl Command {
             }
             exprs
         };
+        timing.parse = start.elapsed();
+        let start = Instant::now();
         let (graph, root) = evaluate_program(&mut err_handler, exprs.as_ref())?;
+        timing.graph = start.elapsed();
         if self.dump_graph {
             let mut stdout = stdout();
             graph.dump(&mut stdout);
             writeln!(&mut stdout, "root = {:?}", root).unwrap();
         }
         match file.output_wave {
-            Some(ref path) => self.write_wave(path, &graph, root)?,
-            None => {}
+            Some(ref path) => self.write_wave(path, &graph, root, &mut timing)?,
+            None => {
+                if self.timing {
+                    // Render the audio without writing it, so it can be timed.
+                    let parameters = self.parameters()?;
+                    let mut program = self.new_program(&graph, root, &parameters, &mut timing)?;
+                    self.render(&mut program, &parameters, &mut timing, |_| Ok(()))?;
+                }
+            }
+        }
+        if self.timing {
+            println!(
+                "timing {} parse_ns={} graph_ns={} render_ns={} samples={} sample_rate={}",
+                filename,
+                timing.parse.as_nanos(),
+                timing.graph.as_nanos(),
+                timing.render.as_nanos(),
+                timing.samples,
+                self.sample_rate()?,
+            );
         }
         Ok(())
     }
@@ -315,30 +359,41 @@ impl Command {
         }
     }
 
-    /// Write output wave file.
-    fn write_wave(&self, path: &OsStr, graph: &Graph, signal: SignalRef) -> Result<(), Failed> {
-        let filename = quote_os(path);
-        let sample_rate = match self.sample_rate {
+    /// Get the parameters to render with.
+    fn parameters(&self) -> Result<Parameters, Failed> {
+        Ok(Parameters {
+            sample_rate: self.sample_rate()? as f64,
+            buffer_size: self.buffer_size(),
+        })
+    }
+
+    /// Get the sample rate to render at.
+    fn sample_rate(&self) -> Result<u32, Failed> {
+        match self.sample_rate {
             Some(rate) => {
                 if rate < MIN_SAMPLE_RATE {
                     error!(
                         "sample rate {} is too low, acceptable rates are {}-{}",
                         rate, MIN_SAMPLE_RATE, MAX_SAMPLE_RATE
                     );
-                    return Err(Failed);
+                    Err(Failed)
                 } else if rate > MAX_SAMPLE_RATE {
                     error!(
                         "sample rate {} is too high, acceptable rates are {}-{}",
                         rate, MIN_SAMPLE_RATE, MAX_SAMPLE_RATE
                     );
-                    return Err(Failed);
+                    Err(Failed)
                 } else {
-                    rate
+                    Ok(rate)
                 }
             }
-            None => DEFAULT_SAMPLE_RATE,
-        };
-        let buffer_size = match self.buffer_size {
+            None => Ok(DEFAULT_SAMPLE_RATE),
+        }
+    }
+
+    /// Get the buffer size to render with.
+    fn buffer_size(&self) -> usize {
+        match self.buffer_size {
             Some(size) => {
                 if size < MIN_BUFFER_SIZE {
                     warning!("buffer size {} is too low, using {}", size, MIN_BUFFER_SIZE);
@@ -363,60 +418,168 @@ impl Command {
                 }
             }
             None => DEFAULT_BUFFER_SIZE,
-        };
+        }
+    }
+
+    /// Create a program to render the signal. The time taken is added to the
+    /// graph time.
+    fn new_program(
+        &self,
+        graph: &Graph,
+        signal: SignalRef,
+        parameters: &Parameters,
+        timing: &mut Timing,
+    ) -> Result<Program, Failed> {
+        let start = Instant::now();
+        let program = Program::new(&graph, signal, parameters);
+        timing.graph += start.elapsed();
+        match program {
+            Ok(p) => Ok(p),
+            Err(e) => {
+                error!("could not create program: {}", e);
+                Err(Failed)
+            }
+        }
+    }
+
+    /// Render a program to completion, passing each buffer to the output
+    /// function. The time taken to render, but not to output, is recorded.
+    fn render<F>(
+        &self,
+        program: &mut Program,
+        parameters: &Parameters,
+        timing: &mut Timing,
+        mut output_fn: F,
+    ) -> Result<(), Failed>
+    where
+        F: FnMut(&[f32]) -> Result<(), Failed>,
+    {
+        let buffer_size = parameters.buffer_size;
         let note = self
             .notes
             .as_ref()
             .and_then(|x| x.first().copied())
             .unwrap_or(Note(69));
-        let program = Program::new(
-            &graph,
-            signal,
-            &Parameters {
-                sample_rate: sample_rate as f64,
-                buffer_size,
-            },
-        );
-        let mut program = match program {
-            Ok(p) => p,
-            Err(e) => {
-                error!("could not create program: {}", e);
-                return Err(Failed);
-            }
-        };
-        let mut file = match fs::File::create(&path) {
-            Ok(file) => file,
-            Err(e) => {
-                error!("could not create {}: {}", filename, e);
-                return Err(Failed);
-            }
-        };
-        let mut writer = wave::Writer::from_stream(
-            &mut file,
-            &wave::Parameters {
-                channel_count: 1,
-                sample_rate,
-            },
-        );
         let mut pos: usize = 0;
-        let end = (sample_rate / 2) as usize;
+        let end = (parameters.sample_rate / 2.0) as usize;
         loop {
+            let start = Instant::now();
             let output = program.render(&PInput {
-                gate: if pos < end && end - pos < buffer_size {
+                gate: if pos <= end && end - pos < buffer_size {
                     Some(end - pos)
                 } else {
                     None
                 },
                 note: note.0 as f32,
             });
+            timing.render += start.elapsed();
             let output = match output {
                 Some(x) => x,
                 None => break,
             };
             pos += output.len();
-            unwrap_write(&filename, writer.write(output))?;
+            output_fn(output)?;
         }
+        timing.samples = pos;
+        Ok(())
+    }
+
+    /// Write output wave file.
+    fn write_wave(
+        &self,
+        path: &OsStr,
+        graph: &Graph,
+        signal: SignalRef,
+        timing: &mut Timing,
+    ) -> Result<(), Failed> {
+        let filename = quote_os(path);
+        let parameters = self.parameters()?;
+        let mut program = self.new_program(graph, signal, &parameters, timing)?;
+        let mut file = match fs::File::create(&path) {
+            Ok(file) => file,
+            Err(e) => {
+                error!("could not create {}: {}", filename, e);
+                return Err(Failed);
+            }
+        };
+        let mut writer = wave::Writer::from_stream(
+            &mut file,
+            &wave::Parameters {
+                channel_count: 1,
+                sample_rate: parameters.sample_rate as u32,
+            },
+        );
+        self.render(&mut program, &parameters, timing, |output| {
+            unwrap_write(&filename, writer.write(output))
+        })?;
         unwrap_write(&filename, writer.finish())?;
         unwrap_write(&filename, file.sync_all())
     }
 }
+
+#[cfg(test)]
+mod test {
+    use super::*;
+
+    /// Render a program with a gated envelope, and return the number of
+    /// samples rendered, or None if it did not stop within two seconds.
+    fn render_gated(sample_rate: u32, buffer_size: usize) -> Option<usize> {
+        let text: &[u8] = b"(* (sawtooth (oscillator (note 0)))
+                               (envelope (lin 10ms 1) (gate) (lin 10ms 0) (stop)))";
+        let mut err_handler = ConsoleLogger::from_text("<test>", text);
+        let mut toks = Tokenizer::new(text).unwrap();
+        let mut parser = Parser::new();
+        let mut exprs = Vec::new();
+        loop {
+            match parser.parse(&mut err_handler, &mut toks) {
+                ParseResult::Value(expr) => exprs.push(expr),
+                ParseResult::None => break,
+                _ => panic!("could not parse program"),
+            }
+        }
+        let (graph, root) = evaluate_program(&mut err_handler, exprs.as_ref()).unwrap();
+        let command = Command {
+            files: Vec::new(),
+            play: false,
+            notes: None,
+            tempo: None,
+            gate: None,
+            disassemble: false,
+            do_loop: false,
+            verbose: false,
+            dump_syntax: false,
+            dump_graph: false,
+            sample_rate: Some(sample_rate),
+            buffer_size: Some(buffer_size),
+            timing: false,
+        };
+        let parameters = command.parameters().unwrap();
+        let mut timing = Timing::default();
+        let mut program = command
+            .new_program(&graph, root, &parameters, &mut timing)
+            .unwrap();
+        let limit = 2 * sample_rate as usize;
+        let mut samples = 0;
+        let result = command.render(&mut program, &parameters, &mut timing, |output| {
+            samples += output.len();
+            if samples > limit {
+                Err(Failed)
+            } else {
+                Ok(())
+            }
+        });
+        result.ok().map(|_| samples)
+    }
+
+    #[test]
+    fn gate_on_buffer_boundary() {
+        // The gate is released after 0.5s, which is a multiple of these
+        // buffer sizes at 48 kHz.
+        for &buffer_size in [32, 64].iter() {
+            match render_gated(48000, buffer_size) {
+                Some(samples) => assert!(samples < 48000, "rendered {} samples", samples),
+                None => panic!("rendering did not stop, buffer size {}", buffer_size),
+            }
+        }
+    }
+}